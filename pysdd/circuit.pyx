@@ -0,0 +1,1758 @@
+# -*- coding: UTF-8 -*-
+"""
+pysdd.circuit
+~~~~~~~~~~~~~
+
+Vectorized evaluation of SDDs in their array representation (see ``SddNode.to_arrays``).
+
+The functions in this module only depend on the arrays, not on the SDD library. They can thus
+also be used for SDDs that are read from file without an SddManager.
+
+:author: Wannes Meert, Arthur Choi
+:copyright: Copyright 2017-2019 KU Leuven and Regents of the University of California.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+cimport cython
+from libc.stdint cimport int8_t, int64_t, uint64_t, UINT64_MAX
+from libc.math cimport exp, log, log1p, INFINITY
+from heapq import heappush, heappop
+
+try:
+    import numpy as np
+except ImportError:
+    # The whole module works on arrays, fail on import with the same message as pysdd.sdd
+    raise ImportError("This functionality requires NumPy (pip install numpy)")
+
+
+# Same values as pysdd.sdd.NodeKind
+cdef enum:
+    FALSE_NODE = 0
+    TRUE_NODE = 1
+    LITERAL_NODE = 2
+    DECISION_NODE = 3
+
+# Maximal number of values kept in memory per block of queries
+DEF BLOCK_BUDGET = 1 << 22
+DEF MAX_BLOCK = 256
+
+
+cdef inline double _logaddexp(double a, double b) nogil:
+    if a == -INFINITY:
+        return b
+    if b == -INFINITY:
+        return a
+    if a > b:
+        return a + log1p(exp(b - a))
+    return b + log1p(exp(a - b))
+
+
+cdef inline Py_ssize_t _weight_index(int64_t literal, Py_ssize_t var_count) nogil:
+    """Index of a literal in the weights layout [-n, ..., -1, 1, ..., n]."""
+    if literal < 0:
+        return var_count + literal
+    return var_count + literal - 1
+
+
+# Operations of semirings that are evaluated in compiled code
+cdef enum:
+    OP_OTHER = -1
+    OP_ADD = 0
+    OP_MUL = 1
+    OP_LOGADDEXP = 2
+    OP_MAX = 3
+    OP_MIN = 4
+
+
+cdef inline double _semiring_op(int op, double a, double b) nogil:
+    if op == OP_ADD:
+        return a + b
+    if op == OP_MUL:
+        return a * b
+    if op == OP_LOGADDEXP:
+        return _logaddexp(a, b)
+    if op == OP_MAX:
+        return a if a >= b else b
+    return a if a <= b else b
+
+
+cdef int _ufunc_op(ufunc, dtype):
+    if dtype == np.float64:
+        ops = {np.add: OP_ADD, np.multiply: OP_MUL, np.logaddexp: OP_LOGADDEXP,
+               np.maximum: OP_MAX, np.minimum: OP_MIN}
+    elif dtype == np.bool_:
+        ops = {np.logical_or: OP_MAX, np.logical_and: OP_MIN, np.maximum: OP_MAX, np.minimum: OP_MIN}
+    else:
+        return OP_OTHER
+    return ops.get(ufunc, OP_OTHER)
+
+
+cdef class Semiring:
+    """Commutative semiring to evaluate a circuit in (see ``Circuit.evaluate``).
+
+    :param plus: Binary NumPy ufunc for the addition (used for decision nodes and to smooth variables)
+    :param times: Binary NumPy ufunc for the multiplication (used for the elements)
+    :param zero: Neutral element of plus (the value of false)
+    :param one: Neutral element of times (the value of true)
+    :param dtype: NumPy dtype of the values, e.g. ``object`` for Python integers
+    :param name: Name of the semiring
+
+    Semirings over float64 or bool with add, multiply, logaddexp, maximum and minimum (or logical_or and
+    logical_and for bool) are evaluated in compiled code. Other semirings are evaluated with the ufuncs,
+    one vectorized call per layer of the circuit.
+    """
+    cdef readonly object plus
+    cdef readonly object times
+    cdef readonly object zero
+    cdef readonly object one
+    cdef readonly object dtype
+    cdef readonly object name
+    cdef int plus_op
+    cdef int times_op
+
+    def __init__(self, plus, times, zero, one, dtype=np.float64, name=None):
+        self.plus = plus
+        self.times = times
+        self.dtype = np.dtype(dtype)
+        self.zero = np.array(zero, dtype=self.dtype)[()]
+        self.one = np.array(one, dtype=self.dtype)[()]
+        self.name = name if name is not None else f"({plus.__name__}, {times.__name__})"
+        self.plus_op = _ufunc_op(plus, self.dtype)
+        self.times_op = _ufunc_op(times, self.dtype)
+
+    def __repr__(self):
+        return f"Semiring({self.name})"
+
+
+# Built-in semirings
+SEMIRINGS = {semiring.name: semiring for semiring in [
+    Semiring(np.add, np.multiply, 0.0, 1.0, np.float64, "sum-product"),
+    Semiring(np.logaddexp, np.add, -np.inf, 0.0, np.float64, "log-sum-exp"),
+    Semiring(np.maximum, np.multiply, 0.0, 1.0, np.float64, "max-product"),
+    Semiring(np.minimum, np.add, np.inf, 0.0, np.float64, "min-plus"),
+    Semiring(np.logical_or, np.logical_and, False, True, np.bool_, "boolean"),
+    Semiring(np.add, np.multiply, 0, 1, object, "counting"),
+]}
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef class Circuit:
+    """Evaluation structure for an SDD in its array representation.
+
+    :param arrays: SddArrays, as returned by ``SddNode.to_arrays()``. The first root is evaluated.
+    :param vtree_arrays: VtreeArrays of the manager's vtree (``SddManager.vtree().to_arrays()``).
+        If given, the computations are smoothed with respect to all variables in the vtree, as is
+        done by the WmcManager. If None, no smoothing is performed.
+
+    Smoothing is implemented by multiplying, for every element, the prime and sub with the
+    weighted model count of the vtree nodes that are skipped between the decision node and
+    the prime or sub (the gaps). These gaps are precomputed when the circuit is created.
+
+    Weights are passed as a matrix with one row per query and one column per literal, using
+    the same layout as ``WmcManager.set_literal_weights_from_array``: [-n, ..., -1, 1, ..., n].
+    """
+    cdef readonly object arrays
+    cdef readonly object vtree_arrays
+    cdef readonly Py_ssize_t var_count
+    cdef readonly Py_ssize_t root
+    cdef readonly Py_ssize_t nb_nodes
+    cdef readonly Py_ssize_t nb_elements
+    cdef readonly Py_ssize_t nb_vtree_nodes
+    cdef const int8_t[::1] kind
+    cdef const int64_t[::1] literal
+    cdef const int64_t[::1] elem_offsets
+    cdef const int64_t[::1] primes
+    cdef const int64_t[::1] subs
+    # Gaps, slot 2*e is the prime of element e, slot 2*e+1 its sub, and slot 2*nb_elements the root
+    cdef int64_t[::1] gap_offsets
+    cdef int64_t[::1] gap_vtrees
+    # Vtree, internal nodes in post-order
+    cdef const int64_t[::1] vtree_left
+    cdef const int64_t[::1] vtree_right
+    cdef const int64_t[::1] vtree_var
+    cdef int64_t[::1] vtree_postorder
+    cdef int64_t[::1] vtree_lo  # Position of the leftmost leaf
+    cdef int64_t[::1] vtree_hi  # Position of the rightmost leaf
+    cdef object _layers  # Layers for the evaluation with ufuncs, see _semiring_layers
+
+    def __init__(self, arrays, vtree_arrays=None):
+        cdef Py_ssize_t i, e, v, slot, nb_gaps
+        self.arrays = arrays
+        self.vtree_arrays = vtree_arrays
+        self.var_count = arrays.var_count
+        self.kind = np.ascontiguousarray(arrays.kind, dtype=np.int8)
+        self.literal = np.ascontiguousarray(arrays.literal, dtype=np.int64)
+        self.elem_offsets = np.ascontiguousarray(arrays.elem_offsets, dtype=np.int64)
+        self.primes = np.ascontiguousarray(arrays.primes, dtype=np.int64)
+        self.subs = np.ascontiguousarray(arrays.subs, dtype=np.int64)
+        self.nb_nodes = self.kind.shape[0]
+        self.nb_elements = self.primes.shape[0]
+        self.root = arrays.roots[0]
+        if vtree_arrays is None:
+            self.nb_vtree_nodes = 0
+            self.gap_offsets = np.zeros(2 * self.nb_elements + 2, dtype=np.int64)
+            self.gap_vtrees = np.zeros(0, dtype=np.int64)
+            self.vtree_left = self.vtree_right = self.vtree_var = self.vtree_postorder = self.gap_vtrees
+            self.vtree_lo = self.vtree_hi = self.gap_vtrees
+            return
+        if vtree_arrays.offset != 0 or vtree_arrays.parent[vtree_arrays.root] != -1:
+            raise ValueError("Expected the arrays of the root of the manager's vtree")
+        self.nb_vtree_nodes = len(vtree_arrays.var)
+        self.vtree_left = np.ascontiguousarray(vtree_arrays.left, dtype=np.int64)
+        self.vtree_right = np.ascontiguousarray(vtree_arrays.right, dtype=np.int64)
+        self.vtree_var = np.ascontiguousarray(vtree_arrays.var, dtype=np.int64)
+        self.vtree_postorder = self._postorder(vtree_arrays.root)
+        self.vtree_lo = np.empty(self.nb_vtree_nodes, dtype=np.int64)
+        self.vtree_hi = np.empty(self.nb_vtree_nodes, dtype=np.int64)
+        for i in range(self.nb_vtree_nodes):
+            v = self.vtree_postorder[i]
+            if self.vtree_left[v] < 0:
+                self.vtree_lo[v] = v
+                self.vtree_hi[v] = v
+            else:
+                self.vtree_lo[v] = self.vtree_lo[self.vtree_left[v]]
+                self.vtree_hi[v] = self.vtree_hi[self.vtree_right[v]]
+        # Gaps: first count, then fill
+        cdef const int64_t[::1] vtree = np.ascontiguousarray(arrays.vtree, dtype=np.int64)
+        cdef const int64_t[::1] parent = np.ascontiguousarray(vtree_arrays.parent, dtype=np.int64)
+        cdef int64_t[::1] targets = np.empty(2 * self.nb_elements + 1, dtype=np.int64)
+        cdef int64_t[::1] children = np.empty(2 * self.nb_elements + 1, dtype=np.int64)
+        for i in range(self.nb_nodes):
+            if self.kind[i] != DECISION_NODE:
+                continue
+            for e in range(self.elem_offsets[i], self.elem_offsets[i + 1]):
+                targets[2 * e] = self.vtree_left[vtree[i]]
+                children[2 * e] = vtree[self.primes[e]]
+                targets[2 * e + 1] = self.vtree_right[vtree[i]]
+                children[2 * e + 1] = vtree[self.subs[e]]
+        targets[2 * self.nb_elements] = vtree_arrays.root
+        children[2 * self.nb_elements] = vtree[self.root]
+        self.gap_offsets = np.empty(2 * self.nb_elements + 2, dtype=np.int64)
+        nb_gaps = 0
+        for slot in range(2 * self.nb_elements + 1):
+            self.gap_offsets[slot] = nb_gaps
+            nb_gaps += self._fill_gap(targets[slot], children[slot], parent, None)
+        self.gap_offsets[2 * self.nb_elements + 1] = nb_gaps
+        self.gap_vtrees = np.empty(nb_gaps, dtype=np.int64)
+        for slot in range(2 * self.nb_elements + 1):
+            self._fill_gap(targets[slot], children[slot], parent, self.gap_vtrees[self.gap_offsets[slot]:])
+
+    cdef int64_t[::1] _postorder(self, Py_ssize_t root):
+        cdef int64_t[::1] order = np.empty(self.nb_vtree_nodes, dtype=np.int64)
+        cdef int64_t[::1] stack = np.empty(self.nb_vtree_nodes, dtype=np.int64)
+        cdef Py_ssize_t depth = 0, n = self.nb_vtree_nodes, v
+        # Reverse of a pre-order that visits the right child first
+        stack[0] = root
+        while depth >= 0:
+            v = stack[depth]
+            depth -= 1
+            n -= 1
+            order[n] = v
+            if self.vtree_left[v] >= 0:
+                depth += 1
+                stack[depth] = self.vtree_left[v]
+                depth += 1
+                stack[depth] = self.vtree_right[v]
+        return order
+
+    cdef Py_ssize_t _fill_gap(self, int64_t target, int64_t child, const int64_t[::1] parent, int64_t[::1] out) except -1:
+        """Vtree nodes that are not covered when a node normalized for child is used for target."""
+        cdef Py_ssize_t n = 0
+        cdef int64_t v, p
+        if child < 0:
+            # True and false are not normalized for a vtree
+            if out is not None:
+                out[0] = target
+            return 1
+        v = child
+        while v != target:
+            p = parent[v]
+            if p < 0:
+                raise ValueError("Node is not normalized for a vtree below its parent")
+            if out is not None:
+                out[n] = self.vtree_right[p] if self.vtree_left[p] == v else self.vtree_left[p]
+            n += 1
+            v = p
+        return n
+
+    cdef Py_ssize_t _block_size(self, Py_ssize_t nb_queries, Py_ssize_t nb_passes=1):
+        cdef Py_ssize_t block = BLOCK_BUDGET // (nb_passes * (self.nb_nodes + self.nb_vtree_nodes + 1))
+        if block > MAX_BLOCK:
+            block = MAX_BLOCK
+        if block > nb_queries:
+            block = nb_queries
+        if block < 1:
+            block = 1
+        return block
+
+    cdef void _upward(self, const double[:, ::1] weights, Py_ssize_t q0, Py_ssize_t nq,
+                      bint log_mode, double[:, ::1] values, double[:, ::1] vvalues) nogil:
+        """Bottom-up pass for queries q0 to q0+nq.
+
+        values[i, q] is the (smoothed) weighted model count of node i for query q0+q,
+        vvalues[v, q] is the weighted model count of all variables in vtree node v.
+        """
+        cdef Py_ssize_t i, j, e, g, q, v, slot
+        cdef Py_ssize_t n = self.var_count
+        cdef double zero = -INFINITY if log_mode else 0.0
+        cdef double one = 0.0 if log_mode else 1.0
+        cdef double* acc
+        cdef double* tmp
+        # Vtree values
+        for j in range(self.nb_vtree_nodes):
+            v = self.vtree_postorder[j]
+            acc = &vvalues[v, 0]
+            if self.vtree_left[v] < 0:
+                for q in range(nq):
+                    if log_mode:
+                        acc[q] = _logaddexp(weights[q0 + q, n + self.vtree_var[v] - 1],
+                                            weights[q0 + q, n - self.vtree_var[v]])
+                    else:
+                        acc[q] = weights[q0 + q, n + self.vtree_var[v] - 1] + weights[q0 + q, n - self.vtree_var[v]]
+            else:
+                for q in range(nq):
+                    if log_mode:
+                        acc[q] = vvalues[self.vtree_left[v], q] + vvalues[self.vtree_right[v], q]
+                    else:
+                        acc[q] = vvalues[self.vtree_left[v], q] * vvalues[self.vtree_right[v], q]
+        # Node values, the last row of values is used as scratch space
+        tmp = &values[self.nb_nodes, 0]
+        for i in range(self.nb_nodes):
+            acc = &values[i, 0]
+            if self.kind[i] == DECISION_NODE:
+                for q in range(nq):
+                    acc[q] = zero
+                for e in range(self.elem_offsets[i], self.elem_offsets[i + 1]):
+                    if log_mode:
+                        for q in range(nq):
+                            tmp[q] = values[self.primes[e], q] + values[self.subs[e], q]
+                        for slot in range(2 * e, 2 * e + 2):
+                            for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+                                v = self.gap_vtrees[g]
+                                for q in range(nq):
+                                    tmp[q] += vvalues[v, q]
+                        for q in range(nq):
+                            acc[q] = _logaddexp(acc[q], tmp[q])
+                    else:
+                        for q in range(nq):
+                            tmp[q] = values[self.primes[e], q] * values[self.subs[e], q]
+                        for slot in range(2 * e, 2 * e + 2):
+                            for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+                                v = self.gap_vtrees[g]
+                                for q in range(nq):
+                                    tmp[q] *= vvalues[v, q]
+                        for q in range(nq):
+                            acc[q] += tmp[q]
+            elif self.kind[i] == LITERAL_NODE:
+                j = _weight_index(self.literal[i], n)
+                for q in range(nq):
+                    acc[q] = weights[q0 + q, j]
+            elif self.kind[i] == TRUE_NODE:
+                for q in range(nq):
+                    acc[q] = one
+            else:
+                for q in range(nq):
+                    acc[q] = zero
+
+    cdef void _root_values(self, Py_ssize_t nq, bint log_mode, double[:, ::1] values, double[:, ::1] vvalues,
+                           double* out) nogil:
+        """Weighted model count of the root, smoothed with respect to the vtree root."""
+        cdef Py_ssize_t g, q, slot = 2 * self.nb_elements
+        for q in range(nq):
+            out[q] = values[self.root, q]
+        for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+            for q in range(nq):
+                if log_mode:
+                    out[q] += vvalues[self.gap_vtrees[g], q]
+                else:
+                    out[q] *= vvalues[self.gap_vtrees[g], q]
+
+    cdef const double[:, ::1] _check_weights(self, weights):
+        weights = np.ascontiguousarray(weights, dtype=np.float64)
+        if weights.ndim == 1:
+            weights = weights.reshape(1, -1)
+        if weights.ndim != 2 or weights.shape[1] != 2 * self.var_count:
+            raise ValueError(f"Expected weights with {2 * self.var_count} columns (one per literal), "
+                             f"got an array with shape {weights.shape}")
+        return weights
+
+    def wmc(self, weights, bint log_mode=False):
+        """Weighted model count for every row of weights.
+
+        :param weights: Array of shape (nb_queries, 2 * var_count), or a single vector of weights
+        :param log_mode: Weights are given as natural logarithms and the result is in log-space
+        :return: Array of shape (nb_queries,)
+        """
+        cdef const double[:, ::1] weights_v = self._check_weights(weights)
+        cdef Py_ssize_t nb_queries = weights_v.shape[0]
+        cdef Py_ssize_t block = self._block_size(nb_queries)
+        cdef Py_ssize_t q0 = 0, nq
+        result = np.empty(nb_queries, dtype=np.float64)
+        cdef double[::1] result_v = result
+        cdef double[:, ::1] values = np.empty((self.nb_nodes + 1, block), dtype=np.float64)
+        cdef double[:, ::1] vvalues = np.empty((max(self.nb_vtree_nodes, 1), block), dtype=np.float64)
+        with nogil:
+            while q0 < nb_queries:
+                nq = min(block, nb_queries - q0)
+                self._upward(weights_v, q0, nq, log_mode, values, vvalues)
+                self._root_values(nq, log_mode, values, vvalues, &result_v[q0])
+                q0 += nq
+        return result
+
+    cdef void _semiring_upward(self, const double[:, ::1] weights, Py_ssize_t q0, Py_ssize_t nq,
+                               int plus, int times, double zero, double one,
+                               double[:, ::1] values, double[:, ::1] vvalues, double* out) nogil:
+        """Bottom-up pass in a semiring for queries q0 to q0+nq, see _upward.
+
+        The value of the root, smoothed with respect to the vtree root, is written to out.
+        """
+        cdef Py_ssize_t i, j, e, g, q, v, slot
+        cdef Py_ssize_t n = self.var_count
+        cdef double* acc
+        cdef double* tmp
+        for j in range(self.nb_vtree_nodes):
+            v = self.vtree_postorder[j]
+            acc = &vvalues[v, 0]
+            if self.vtree_left[v] < 0:
+                for q in range(nq):
+                    acc[q] = _semiring_op(plus, weights[q0 + q, n + self.vtree_var[v] - 1],
+                                          weights[q0 + q, n - self.vtree_var[v]])
+            else:
+                for q in range(nq):
+                    acc[q] = _semiring_op(times, vvalues[self.vtree_left[v], q], vvalues[self.vtree_right[v], q])
+        tmp = &values[self.nb_nodes, 0]
+        for i in range(self.nb_nodes):
+            acc = &values[i, 0]
+            if self.kind[i] == DECISION_NODE:
+                for q in range(nq):
+                    acc[q] = zero
+                for e in range(self.elem_offsets[i], self.elem_offsets[i + 1]):
+                    for q in range(nq):
+                        tmp[q] = _semiring_op(times, values[self.primes[e], q], values[self.subs[e], q])
+                    for g in range(self.gap_offsets[2 * e], self.gap_offsets[2 * e + 2]):
+                        v = self.gap_vtrees[g]
+                        for q in range(nq):
+                            tmp[q] = _semiring_op(times, tmp[q], vvalues[v, q])
+                    for q in range(nq):
+                        acc[q] = _semiring_op(plus, acc[q], tmp[q])
+            elif self.kind[i] == LITERAL_NODE:
+                j = _weight_index(self.literal[i], n)
+                for q in range(nq):
+                    acc[q] = weights[q0 + q, j]
+            elif self.kind[i] == TRUE_NODE:
+                for q in range(nq):
+                    acc[q] = one
+            else:
+                for q in range(nq):
+                    acc[q] = zero
+        slot = 2 * self.nb_elements
+        for q in range(nq):
+            out[q] = values[self.root, q]
+        for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+            for q in range(nq):
+                out[q] = _semiring_op(times, out[q], vvalues[self.gap_vtrees[g], q])
+
+    cdef object _semiring_layers(self):
+        """Group the nodes and internal vtree nodes in layers that only depend on lower layers.
+
+        Returns the vtree leaves, a list with the internal vtree nodes per layer, a list with
+        (nodes, elements, element starts) per layer of decision nodes, and the gather index and
+        segment starts to compute the product of the gaps of every element (and the root) at once.
+        """
+        cdef Py_ssize_t i, e, j, v, h
+        cdef int64_t[::1] height
+        if self._layers is not None:
+            return self._layers
+        # Vtree
+        height = np.zeros(self.nb_vtree_nodes, dtype=np.int64)
+        for j in range(self.nb_vtree_nodes):
+            v = self.vtree_postorder[j]
+            if self.vtree_left[v] >= 0:
+                height[v] = 1 + max(height[self.vtree_left[v]], height[self.vtree_right[v]])
+        vtree_leaves = np.flatnonzero(np.asarray(self.vtree_var) > 0)
+        vtree_layers = self._split_layers(np.asarray(height))[1:]
+        # Nodes
+        height = np.zeros(self.nb_nodes, dtype=np.int64)
+        for i in range(self.nb_nodes):
+            if self.kind[i] != DECISION_NODE:
+                continue
+            h = 0
+            for e in range(self.elem_offsets[i], self.elem_offsets[i + 1]):
+                h = max(h, height[self.primes[e]], height[self.subs[e]])
+            height[i] = h + 1
+        elem_offsets = np.asarray(self.elem_offsets)
+        node_layers = []
+        for nodes in self._split_layers(np.asarray(height))[1:]:
+            counts = elem_offsets[nodes + 1] - elem_offsets[nodes]
+            starts = np.cumsum(counts) - counts
+            elements = np.repeat(elem_offsets[nodes] - starts, counts) + np.arange(counts.sum())
+            node_layers.append((nodes, elements, starts))
+        # Gaps of the elements and the root, every segment starts with the vtree value 'one'
+        gap_offsets = np.asarray(self.gap_offsets)
+        gap_starts = np.arange(self.nb_elements + 1) + gap_offsets[0:2 * self.nb_elements + 1:2]
+        gap_index = np.empty(self.nb_elements + 1 + len(self.gap_vtrees), dtype=np.int64)
+        is_gap = np.ones(len(gap_index), dtype=bool)
+        is_gap[gap_starts] = False
+        gap_index[gap_starts] = self.nb_vtree_nodes
+        gap_index[is_gap] = np.asarray(self.gap_vtrees)
+        self._layers = (vtree_leaves, vtree_layers, node_layers, gap_index, gap_starts)
+        return self._layers
+
+    @staticmethod
+    def _split_layers(height):
+        order = np.argsort(height, kind="stable")
+        bounds = np.searchsorted(height[order], np.arange(height.max(initial=0) + 2))
+        return [order[bounds[h]:bounds[h + 1]] for h in range(len(bounds) - 1)]
+
+    def _evaluate_ufuncs(self, Semiring semiring, weights):
+        """Evaluate with the ufuncs of the semiring, vectorized over the queries and the nodes in a layer."""
+        vtree_leaves, vtree_layers, node_layers, gap_index, gap_starts = self._semiring_layers()
+        plus, times = semiring.plus, semiring.times
+        nb_queries = weights.shape[0]
+        n = self.var_count
+        vvalues = np.empty((self.nb_vtree_nodes + 1, nb_queries), dtype=semiring.dtype)
+        vvalues[self.nb_vtree_nodes] = semiring.one
+        var = np.asarray(self.vtree_var)[vtree_leaves]
+        vvalues[vtree_leaves] = plus(weights[:, n + var - 1].T, weights[:, n - var].T)
+        left, right = np.asarray(self.vtree_left), np.asarray(self.vtree_right)
+        for nodes in vtree_layers:
+            vvalues[nodes] = times(vvalues[left[nodes]], vvalues[right[nodes]])
+        gaps = times.reduceat(vvalues[gap_index], gap_starts, axis=0)
+        kind = np.asarray(self.kind)
+        values = np.empty((self.nb_nodes, nb_queries), dtype=semiring.dtype)
+        values[kind == TRUE_NODE] = semiring.one
+        values[kind == FALSE_NODE] = semiring.zero
+        literal_nodes = np.flatnonzero(kind == LITERAL_NODE)
+        literals = np.asarray(self.literal)[literal_nodes]
+        values[literal_nodes] = weights[:, np.where(literals < 0, n + literals, n + literals - 1)].T
+        primes, subs = np.asarray(self.primes), np.asarray(self.subs)
+        for nodes, elements, starts in node_layers:
+            products = times(times(values[primes[elements]], values[subs[elements]]), gaps[elements])
+            values[nodes] = plus.reduceat(products, starts, axis=0)
+        return times(values[self.root], gaps[self.nb_elements])
+
+    def evaluate(self, semiring, weights=None):
+        """Evaluate the circuit in a commutative semiring, for every row of weights.
+
+        This generalizes ``wmc`` (the sum-product semiring) to algebraic model counting. Smoothing
+        uses the plus of the semiring on the values of the positive and negative literal.
+
+        :param semiring: Semiring, or the name of a built-in semiring (the keys of ``SEMIRINGS``:
+            sum-product, log-sum-exp, max-product, min-plus, boolean and counting)
+        :param weights: Array of shape (nb_queries, 2 * var_count) with the value of every literal,
+            or a single vector. By default, every literal has the value one of the semiring.
+        :return: Array of shape (nb_queries,) with the dtype of the semiring
+        """
+        cdef Semiring sr
+        cdef const double[:, ::1] weights_v
+        cdef Py_ssize_t nb_queries, block, q0 = 0, nq
+        cdef double[::1] result_v
+        cdef double[:, ::1] values
+        cdef double[:, ::1] vvalues
+        if isinstance(semiring, str):
+            if semiring not in SEMIRINGS:
+                raise ValueError(f"Unknown semiring {semiring}, expected one of {', '.join(SEMIRINGS)}")
+            semiring = SEMIRINGS[semiring]
+        sr = semiring
+        if weights is None:
+            weights = np.full((1, 2 * self.var_count), sr.one, dtype=sr.dtype)
+        weights = np.asarray(weights, dtype=sr.dtype)
+        if weights.ndim == 1:
+            weights = weights.reshape(1, -1)
+        if weights.ndim != 2 or weights.shape[1] != 2 * self.var_count:
+            raise ValueError(f"Expected weights with {2 * self.var_count} columns (one per literal), "
+                             f"got an array with shape {weights.shape}")
+        if sr.plus_op == OP_OTHER or sr.times_op == OP_OTHER:
+            return self._evaluate_ufuncs(sr, weights)
+        weights_v = self._check_weights(weights)
+        nb_queries = weights_v.shape[0]
+        block = self._block_size(nb_queries)
+        result = np.empty(nb_queries, dtype=np.float64)
+        result_v = result
+        values = np.empty((self.nb_nodes + 1, block), dtype=np.float64)
+        vvalues = np.empty((max(self.nb_vtree_nodes, 1), block), dtype=np.float64)
+        cdef double zero = sr.zero, one = sr.one
+        with nogil:
+            while q0 < nb_queries:
+                nq = min(block, nb_queries - q0)
+                self._semiring_upward(weights_v, q0, nq, sr.plus_op, sr.times_op, zero, one,
+                                      values, vvalues, &result_v[q0])
+                q0 += nq
+        return result.astype(sr.dtype, copy=False)
+
+    cdef void _downward(self, Py_ssize_t nq, double[:, ::1] values, double[:, ::1] vvalues,
+                        double[:, ::1] adj, double[:, ::1] vadj) nogil:
+        """Top-down pass in log-space, after an upward pass in log-space.
+
+        adj[i, q] is the partial derivative of the (smoothed) weighted model count of the root with respect
+        to the value of node i, vadj[v, q] with respect to the value of vtree node v.
+        """
+        cdef Py_ssize_t i, j, e, g, h, q, v, p, s, slot, slot2, root_slot = 2 * self.nb_elements
+        cdef double* tmp = &values[self.nb_nodes, 0]
+        cdef double other
+        for i in range(self.nb_nodes):
+            for q in range(nq):
+                adj[i, q] = -INFINITY
+        for v in range(self.nb_vtree_nodes):
+            for q in range(nq):
+                vadj[v, q] = -INFINITY
+        # Root
+        for q in range(nq):
+            adj[self.root, q] = 0.0
+        for g in range(self.gap_offsets[root_slot], self.gap_offsets[root_slot + 1]):
+            for q in range(nq):
+                adj[self.root, q] += vvalues[self.gap_vtrees[g], q]
+                other = values[self.root, q]
+                for h in range(self.gap_offsets[root_slot], self.gap_offsets[root_slot + 1]):
+                    if h != g:
+                        other += vvalues[self.gap_vtrees[h], q]
+                vadj[self.gap_vtrees[g], q] = _logaddexp(vadj[self.gap_vtrees[g], q], other)
+        # Decision nodes, parents before children
+        for i in range(self.nb_nodes - 1, -1, -1):
+            if self.kind[i] != DECISION_NODE:
+                continue
+            for e in range(self.elem_offsets[i], self.elem_offsets[i + 1]):
+                p = self.primes[e]
+                s = self.subs[e]
+                for q in range(nq):
+                    tmp[q] = adj[i, q]
+                for g in range(self.gap_offsets[2 * e], self.gap_offsets[2 * e + 2]):
+                    for q in range(nq):
+                        tmp[q] += vvalues[self.gap_vtrees[g], q]
+                for q in range(nq):
+                    adj[p, q] = _logaddexp(adj[p, q], tmp[q] + values[s, q])
+                    adj[s, q] = _logaddexp(adj[s, q], tmp[q] + values[p, q])
+                for g in range(self.gap_offsets[2 * e], self.gap_offsets[2 * e + 2]):
+                    v = self.gap_vtrees[g]
+                    for q in range(nq):
+                        other = adj[i, q] + values[p, q] + values[s, q]
+                        for h in range(self.gap_offsets[2 * e], self.gap_offsets[2 * e + 2]):
+                            if h != g:
+                                other += vvalues[self.gap_vtrees[h], q]
+                        vadj[v, q] = _logaddexp(vadj[v, q], other)
+        # Vtree, parents before children
+        for j in range(self.nb_vtree_nodes - 1, -1, -1):
+            v = self.vtree_postorder[j]
+            if self.vtree_left[v] < 0:
+                continue
+            for q in range(nq):
+                vadj[self.vtree_left[v], q] = _logaddexp(vadj[self.vtree_left[v], q],
+                                                         vadj[v, q] + vvalues[self.vtree_right[v], q])
+                vadj[self.vtree_right[v], q] = _logaddexp(vadj[self.vtree_right[v], q],
+                                                          vadj[v, q] + vvalues[self.vtree_left[v], q])
+
+    def _check_evidence(self, evidence, weights, bint log_mode):
+        """Evidence as a matrix and the literal weights as a vector in log-space."""
+        cdef Py_ssize_t n = self.var_count
+        if self.vtree_arrays is None:
+            raise ValueError("Evidence queries require a circuit with the vtree arrays")
+        evidence = np.asarray(evidence)
+        if evidence.ndim == 1:
+            evidence = evidence.reshape(1, -1)
+        if evidence.ndim != 2 or evidence.shape[1] != n:
+            raise ValueError(f"Expected evidence with {n} columns (one per variable), "
+                             f"got an array with shape {evidence.shape}")
+        if weights is None:
+            weights = np.zeros(2 * n) if log_mode else np.ones(2 * n)
+        weights = np.asarray(self._check_weights(weights))[0]
+        if not log_mode:
+            with np.errstate(divide="ignore"):
+                weights = np.log(weights)
+        return evidence, weights
+
+    def _evidence_weights(self, evidence, weights):
+        """Log-weights with one row per row of evidence, literals that contradict the evidence get weight zero."""
+        n = self.var_count
+        neg_cols = n - 1 - np.arange(n)
+        pos_cols = n + np.arange(n)
+        evidence_weights = np.empty((evidence.shape[0], 2 * n), dtype=np.float64)
+        evidence_weights[:, neg_cols] = np.where(evidence > 0, -np.inf, weights[neg_cols])
+        evidence_weights[:, pos_cols] = np.where(evidence < 0, -np.inf, weights[pos_cols])
+        return evidence_weights
+
+    cdef void _mpe_vtree(self, Py_ssize_t v, const double[:, ::1] weights, Py_ssize_t q, int8_t* out) nogil:
+        """Assign the variables in vtree node v to their literal with the largest weight."""
+        cdef Py_ssize_t n = self.var_count, pos = self.vtree_lo[v], var
+        while pos <= self.vtree_hi[v]:
+            var = self.vtree_var[pos]
+            out[var - 1] = weights[q, n + var - 1] >= weights[q, n - var]
+            pos += 2
+
+    cdef void _mpe_backtrack(self, const double[:, ::1] weights, Py_ssize_t q, double[:, ::1] values,
+                             double[:, ::1] vvalues, int64_t[::1] stack, int8_t* out) nogil:
+        """Follow the maximizing elements from the root, after a max-sum upward pass, for query q."""
+        cdef Py_ssize_t i, e, g, best_e, depth = 0, slot = 2 * self.nb_elements
+        cdef double value, best = 0
+        for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+            self._mpe_vtree(self.gap_vtrees[g], weights, q, out)
+        stack[0] = self.root
+        while depth >= 0:
+            i = stack[depth]
+            depth -= 1
+            if self.kind[i] == DECISION_NODE:
+                best_e = -1
+                for e in range(self.elem_offsets[i], self.elem_offsets[i + 1]):
+                    value = values[self.primes[e], q] + values[self.subs[e], q]
+                    for g in range(self.gap_offsets[2 * e], self.gap_offsets[2 * e + 2]):
+                        value += vvalues[self.gap_vtrees[g], q]
+                    if best_e < 0 or value > best:
+                        best = value
+                        best_e = e
+                for g in range(self.gap_offsets[2 * best_e], self.gap_offsets[2 * best_e + 2]):
+                    self._mpe_vtree(self.gap_vtrees[g], weights, q, out)
+                stack[depth + 1] = self.primes[best_e]
+                stack[depth + 2] = self.subs[best_e]
+                depth += 2
+            elif self.kind[i] == LITERAL_NODE:
+                if self.literal[i] > 0:
+                    out[self.literal[i] - 1] = 1
+                else:
+                    out[-self.literal[i] - 1] = 0
+
+    def mpe(self, evidence=None, weights=None, bint log_mode=False):
+        """Most probable explanation (the complete assignment with the largest weight) for every row of evidence.
+
+        Computed with a max-product upward pass (in log-space) and a backtrack over the maximizing elements.
+
+        :param evidence: Array of shape (nb_queries, var_count) with values -1 (variable is false),
+            0 (not observed) and 1 (variable is true). By default, one query without evidence.
+        :param weights: Literal weights [-n, ..., -1, 1, ..., n], by default all weights are one
+        :param log_mode: The weights are natural logarithms
+        :return: Tuple with an array of shape (nb_queries, var_count) with int8 values 0 and 1 (column i is
+            variable i+1) and an array of shape (nb_queries,) with the natural logarithm of the weight of the
+            assignment. If the evidence is inconsistent, the log-weight is -inf and the assignment is all -1.
+        """
+        cdef Py_ssize_t nb_queries, block, q0, q, nq
+        if evidence is None:
+            evidence = np.zeros((1, self.var_count), dtype=np.int8)
+        evidence, weights = self._check_evidence(evidence, weights, log_mode)
+        nb_queries = evidence.shape[0]
+        log_weights = np.empty(nb_queries, dtype=np.float64)
+        assignments = np.zeros((nb_queries, self.var_count), dtype=np.int8)
+        block = self._block_size(nb_queries)
+        cdef double[:, ::1] values = np.empty((self.nb_nodes + 1, block), dtype=np.float64)
+        cdef double[:, ::1] vvalues = np.empty((self.nb_vtree_nodes, block), dtype=np.float64)
+        cdef int64_t[::1] stack = np.empty(self.nb_nodes + 1, dtype=np.int64)
+        cdef const double[:, ::1] block_weights_v
+        cdef double[::1] log_weights_v = log_weights
+        cdef int8_t[:, ::1] assignments_v = assignments
+        for q0 in range(0, nb_queries, block):
+            nq = min(block, nb_queries - q0)
+            block_weights_v = self._evidence_weights(evidence[q0:q0 + nq], weights)
+            with nogil:
+                self._semiring_upward(block_weights_v, 0, nq, OP_MAX, OP_ADD, -INFINITY, 0.0,
+                                      values, vvalues, &log_weights_v[q0])
+                for q in range(nq):
+                    if log_weights_v[q0 + q] > -INFINITY:
+                        self._mpe_backtrack(block_weights_v, q, values, vvalues, stack, &assignments_v[q0 + q, 0])
+        assignments[log_weights == -np.inf] = -1
+        return assignments, log_weights
+
+    def top_k(self, Py_ssize_t k, weights=None, bint log_mode=False):
+        """The k models with the largest weight, in order of decreasing weight.
+
+        The weight of a model is the product of its literal weights. Only models with a non-zero weight are
+        returned. The models are found with a lazy best-first search (see _TopK), not by enumerating all models.
+
+        :param k: Number of models
+        :param weights: Literal weights [-n, ..., -1, 1, ..., n], by default all weights are one
+        :param log_mode: The weights are natural logarithms
+        :return: Tuple with an array of shape (m, var_count) with int8 values 0 and 1 (column i is variable i+1),
+            with m = min(k, number of models), and an array of shape (m,) with the natural logarithm of the
+            weight of every model.
+        """
+        if k < 0:
+            raise ValueError("The number of models should be non-negative")
+        return _TopK(self, weights, log_mode).top_k(k)
+
+    def evidence(self, evidence, weights=None, bint log_mode=False):
+        """Probability of evidence and posterior marginals for every row of an evidence matrix.
+
+        :param evidence: Array of shape (nb_queries, var_count) with values -1 (variable is false),
+            0 (not observed) and 1 (variable is true)
+        :param weights: Literal weights [-n, ..., -1, 1, ..., n], by default all weights are one
+        :param log_mode: The weights are natural logarithms
+        :return: Tuple with an array of shape (nb_queries,) with the probability of the evidence and an array
+            of shape (nb_queries, var_count) with the probability that each variable is true given the evidence.
+            The marginals are nan if the evidence has probability zero.
+        """
+        cdef Py_ssize_t n = self.var_count, block, q0, nq
+        evidence, weights = self._check_evidence(evidence, weights, log_mode)
+        total = self.wmc(weights, log_mode=True)[0]
+        nb_queries = evidence.shape[0]
+        log_pe = np.empty(nb_queries, dtype=np.float64)
+        marginals = np.empty((nb_queries, n), dtype=np.float64)
+        pos_cols = n + np.arange(n)
+        is_leaf = np.asarray(self.vtree_left) < 0
+        leaf_of_var = np.empty(n + 1, dtype=np.int64)
+        leaf_of_var[np.asarray(self.vtree_var)[is_leaf]] = np.flatnonzero(is_leaf)
+        leaf_rows = leaf_of_var[1:]
+        literal_rows = np.flatnonzero((np.asarray(self.kind) == LITERAL_NODE) & (np.asarray(self.literal) > 0))
+        literal_cols = np.asarray(self.literal)[literal_rows] - 1
+        block = self._block_size(nb_queries, 2)
+        cdef double[:, ::1] values = np.empty((self.nb_nodes + 1, block), dtype=np.float64)
+        cdef double[:, ::1] vvalues = np.empty((self.nb_vtree_nodes, block), dtype=np.float64)
+        cdef double[:, ::1] adj = np.empty((self.nb_nodes, block), dtype=np.float64)
+        cdef double[:, ::1] vadj = np.empty((self.nb_vtree_nodes, block), dtype=np.float64)
+        cdef const double[:, ::1] block_weights_v
+        cdef double[::1] log_pe_v = log_pe
+        for q0 in range(0, nb_queries, block):
+            nq = min(block, nb_queries - q0)
+            block_weights = self._evidence_weights(evidence[q0:q0 + nq], weights)
+            block_weights_v = block_weights
+            with nogil:
+                self._upward(block_weights_v, 0, nq, True, values, vvalues)
+                self._root_values(nq, True, values, vvalues, &log_pe_v[q0])
+                self._downward(nq, values, vvalues, adj, vadj)
+            # Derivatives with respect to the weights of the positive literals
+            derivatives = np.asarray(vadj)[leaf_rows, :nq].T
+            derivatives[:, literal_cols] = np.logaddexp(derivatives[:, literal_cols],
+                                                        np.asarray(adj)[literal_rows, :nq].T)
+            with np.errstate(invalid="ignore"):
+                marginals[q0:q0 + nq] = np.exp(derivatives + block_weights[:, pos_cols] - log_pe[q0:q0 + nq, None])
+        log_pe -= total
+        return np.exp(log_pe), marginals
+
+    def model_batches(self, Py_ssize_t batch_size=65536, variables=None, bint packed=False):
+        """Generator for the models of the SDD, in batches.
+
+        Models are global models, that is, assignments to all variables in the vtree. Every batch is a matrix
+        with one row per model and one column per variable (in increasing order of the variables).
+
+        :param batch_size: Number of models per batch (the last batch can be smaller)
+        :param variables: Only enumerate the values of these variables. The SDD is expected to not depend on
+            the other variables (see ``SddNode.model_batches``, which takes care of this).
+        :param packed: Return batches with the values packed into bits (``numpy.packbits`` along the rows)
+            instead of int8 values.
+        :return: Generator of NumPy arrays
+        """
+        if batch_size < 1:
+            raise ValueError("The batch size should be positive")
+        enumerator = _ModelEnumerator(self, variables)
+        total = enumerator.model_count
+        start = 0
+        while start < total:
+            size = min(batch_size, total - start)
+            models = np.empty((size, enumerator.nb_columns), dtype=np.int8)
+            enumerator.fill(models, start)
+            start += size
+            if packed:
+                yield np.packbits(models, axis=1)
+            else:
+                yield models
+
+    def model_count(self, variables=None):
+        """Number of models of the SDD, see model_batches.
+
+        Counts are computed with 64-bit integers, an OverflowError is raised if the count does not fit
+        (see ``SddNode.global_model_count`` for arbitrary counts).
+        """
+        enumerator = _ModelEnumerator(self, variables)
+        if enumerator.saturated:
+            raise OverflowError("The number of models does not fit in a 64-bit integer")
+        return enumerator.model_count
+
+    def sample(self, Py_ssize_t n, weights=None, seed=None):
+        """Draw models of the SDD, proportional to their weight.
+
+        The weight of a model is the product of the weights of its literals. The weighted model counts are
+        computed in one upward pass, after which all samples are drawn top-down.
+
+        :param n: Number of samples
+        :param weights: Literal weights [-n, ..., -1, 1, ..., n] (not in log-space), by default all weights are 1,
+            which results in uniform sampling
+        :param seed: Seed for the random number generator (an integer), by default a random seed is used
+        :return: Array of shape (n, var_count) with int8 values, column i is variable i+1
+        """
+        if n < 0:
+            raise ValueError("The number of samples should be non-negative")
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        sampler = _Sampler(self, weights)
+        samples = np.empty((n, self.var_count), dtype=np.int8)
+        sampler.fill(samples, int(seed) & 0xFFFFFFFFFFFFFFFF)
+        return samples
+
+
+cdef inline uint64_t _sat_add(uint64_t a, uint64_t b) nogil:
+    cdef uint64_t c = a + b
+    if c < a:
+        return UINT64_MAX
+    return c
+
+
+cdef inline uint64_t _sat_mul(uint64_t a, uint64_t b) nogil:
+    if a == 0 or b == 0:
+        return 0
+    if a > UINT64_MAX // b:
+        return UINT64_MAX
+    return a * b
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef class _ModelEnumerator:
+    """Model enumeration by unranking: model k is constructed directly from the model counts of the nodes.
+
+    Counts saturate at 2**64-1. A saturated count either makes the count of the root saturate or is multiplied
+    by zero and never used. If the count of the root saturates, the counts are recomputed with Python integers
+    and the models are unranked in Python, which is slower but exact.
+    """
+    cdef Circuit circuit
+    cdef readonly object model_count
+    cdef readonly bint saturated
+    cdef list big_slot_count  # Python integer counts, only if the count of the root saturates
+    cdef list big_element_cumsum
+    cdef readonly Py_ssize_t nb_columns
+    cdef int64_t[::1] var_column  # Column of each variable, -1 if the variable is not enumerated
+    cdef uint64_t[::1] node_count
+    cdef uint64_t[::1] slot_count  # Count of a prime or sub including the gaps
+    cdef uint64_t[::1] element_cumsum  # Cumulative count of elements within a decision node
+    cdef uint64_t[::1] vtree_count
+    cdef int64_t[::1] vtree_lo
+    cdef int64_t[::1] vtree_hi
+    cdef int64_t[::1] vtree_nb_vars  # Number of enumerated variables
+    cdef int64_t[::1] stack_id
+    cdef uint64_t[::1] stack_k
+    # Circuit structure
+    cdef Py_ssize_t root
+    cdef Py_ssize_t nb_elements
+    cdef const int8_t[::1] kind
+    cdef const int64_t[::1] literal
+    cdef const int64_t[::1] elem_offsets
+    cdef const int64_t[::1] primes
+    cdef const int64_t[::1] subs
+    cdef int64_t[::1] gap_offsets
+    cdef int64_t[::1] gap_vtrees
+    cdef const int64_t[::1] vtree_var
+
+    def __init__(self, Circuit circuit, variables=None):
+        cdef Py_ssize_t i, j, e, g, slot, v, var
+        cdef uint64_t count
+        if circuit.vtree_arrays is None:
+            raise ValueError("Model enumeration requires a circuit with the vtree arrays")
+        self.circuit = circuit
+        self.root = circuit.root
+        self.nb_elements = circuit.nb_elements
+        self.kind = circuit.kind
+        self.literal = circuit.literal
+        self.elem_offsets = circuit.elem_offsets
+        self.primes = circuit.primes
+        self.subs = circuit.subs
+        self.gap_offsets = circuit.gap_offsets
+        self.gap_vtrees = circuit.gap_vtrees
+        self.vtree_var = circuit.vtree_var
+        var_column = np.full(circuit.var_count + 1, -1, dtype=np.int64)
+        if variables is None:
+            variables = np.arange(1, circuit.var_count + 1)
+        else:
+            variables = np.unique(np.asarray(variables, dtype=np.int64))
+            if len(variables) > 0 and (variables.min() < 1 or variables.max() > circuit.var_count):
+                raise ValueError(f"Variables should be between 1 and {circuit.var_count}")
+        var_column[variables] = np.arange(len(variables))
+        self.var_column = var_column
+        self.nb_columns = len(variables)
+        # Vtree
+        self.vtree_lo = circuit.vtree_lo
+        self.vtree_hi = circuit.vtree_hi
+        self.vtree_nb_vars = np.empty(circuit.nb_vtree_nodes, dtype=np.int64)
+        self.vtree_count = np.empty(circuit.nb_vtree_nodes, dtype=np.uint64)
+        for j in range(circuit.nb_vtree_nodes):
+            v = circuit.vtree_postorder[j]
+            if circuit.vtree_left[v] < 0:
+                self.vtree_nb_vars[v] = 1 if self.var_column[circuit.vtree_var[v]] >= 0 else 0
+            else:
+                self.vtree_nb_vars[v] = (self.vtree_nb_vars[circuit.vtree_left[v]] +
+                                         self.vtree_nb_vars[circuit.vtree_right[v]])
+            self.vtree_count[v] = UINT64_MAX if self.vtree_nb_vars[v] >= 64 else (<uint64_t>1) << self.vtree_nb_vars[v]
+        # Nodes
+        self.node_count = np.empty(circuit.nb_nodes, dtype=np.uint64)
+        self.slot_count = np.empty(2 * circuit.nb_elements + 1, dtype=np.uint64)
+        self.element_cumsum = np.empty(circuit.nb_elements, dtype=np.uint64)
+        for i in range(circuit.nb_nodes):
+            if circuit.kind[i] == DECISION_NODE:
+                count = 0
+                for e in range(circuit.elem_offsets[i], circuit.elem_offsets[i + 1]):
+                    self._count_slot(2 * e, circuit.primes[e])
+                    self._count_slot(2 * e + 1, circuit.subs[e])
+                    count = _sat_add(count, _sat_mul(self.slot_count[2 * e], self.slot_count[2 * e + 1]))
+                    self.element_cumsum[e] = count
+                self.node_count[i] = count
+            elif circuit.kind[i] == LITERAL_NODE:
+                var = circuit.literal[i] if circuit.literal[i] > 0 else -circuit.literal[i]
+                if self.var_column[var] < 0:
+                    raise ValueError(f"The SDD depends on variable {var}, which is not enumerated")
+                self.node_count[i] = 1
+            elif circuit.kind[i] == TRUE_NODE:
+                self.node_count[i] = 1
+            else:
+                self.node_count[i] = 0
+        self._count_slot(2 * circuit.nb_elements, circuit.root)
+        self.saturated = self.slot_count[2 * circuit.nb_elements] == UINT64_MAX
+        if self.saturated:
+            self._count_big()
+        else:
+            self.model_count = int(self.slot_count[2 * circuit.nb_elements])
+        # Every decision node pushes two slots, every slot one node
+        self.stack_id = np.empty(2 * circuit.nb_nodes + 2, dtype=np.int64)
+        self.stack_k = np.empty(2 * circuit.nb_nodes + 2, dtype=np.uint64)
+
+    cdef _count_big(self):
+        """Model counts with Python integers, in the same layout as the 64-bit counts."""
+        cdef Py_ssize_t i, e, g, slot
+        vtree_count = [1 << int(nb_vars) for nb_vars in self.vtree_nb_vars]
+        node_count = [int(count) for count in self.node_count]
+        slot_count = [0] * (2 * self.nb_elements + 1)
+        element_cumsum = [0] * self.nb_elements
+        for i in range(len(self.kind)):
+            if self.kind[i] == DECISION_NODE:
+                count = 0
+                for e in range(self.elem_offsets[i], self.elem_offsets[i + 1]):
+                    for slot, child in ((2 * e, self.primes[e]), (2 * e + 1, self.subs[e])):
+                        slot_count[slot] = node_count[child]
+                        for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+                            slot_count[slot] *= vtree_count[self.gap_vtrees[g]]
+                    count += slot_count[2 * e] * slot_count[2 * e + 1]
+                    element_cumsum[e] = count
+                node_count[i] = count
+        slot = 2 * self.nb_elements
+        slot_count[slot] = node_count[self.root]
+        for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+            slot_count[slot] *= vtree_count[self.gap_vtrees[g]]
+        self.big_slot_count = slot_count
+        self.big_element_cumsum = element_cumsum
+        self.model_count = slot_count[slot]
+
+    cdef _unrank_big(self, k, int8_t[::1] model):
+        """Write model k to model, as ``_unrank`` but with Python integers."""
+        cdef Py_ssize_t node, slot, e, lo, hi, mid, g, v, p, col
+        stack = [(-1 - 2 * self.nb_elements, k)]
+        while stack:
+            node, r = stack.pop()
+            if node < 0:
+                slot = -1 - node
+                for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+                    v = self.gap_vtrees[g]
+                    for p in range(self.vtree_lo[v], self.vtree_hi[v] + 1, 2):
+                        col = self.var_column[self.vtree_var[p]]
+                        if col >= 0:
+                            model[col] = r & 1
+                            r >>= 1
+                if slot == 2 * self.nb_elements:
+                    stack.append((self.root, r))
+                elif slot % 2 == 0:
+                    stack.append((self.primes[slot // 2], r))
+                else:
+                    stack.append((self.subs[slot // 2], r))
+            elif self.kind[node] == DECISION_NODE:
+                lo = self.elem_offsets[node]
+                hi = self.elem_offsets[node + 1] - 1
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self.big_element_cumsum[mid] > r:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                e = lo
+                if e > self.elem_offsets[node]:
+                    r -= self.big_element_cumsum[e - 1]
+                stack.append((-1 - (2 * e + 1), r % self.big_slot_count[2 * e + 1]))
+                stack.append((-1 - 2 * e, r // self.big_slot_count[2 * e + 1]))
+            elif self.kind[node] == LITERAL_NODE:
+                if self.literal[node] > 0:
+                    model[self.var_column[self.literal[node]]] = 1
+                else:
+                    model[self.var_column[-self.literal[node]]] = 0
+
+    cdef void _count_slot(self, Py_ssize_t slot, Py_ssize_t child):
+        cdef Py_ssize_t g
+        cdef uint64_t count = self.node_count[child]
+        for g in range(self.circuit.gap_offsets[slot], self.circuit.gap_offsets[slot + 1]):
+            count = _sat_mul(count, self.vtree_count[self.circuit.gap_vtrees[g]])
+        self.slot_count[slot] = count
+
+    cdef inline void _assign_gap(self, Py_ssize_t v, uint64_t k, int8_t* model) nogil:
+        """Assign the enumerated variables in vtree v to the bits of k."""
+        cdef Py_ssize_t p, col
+        for p in range(self.vtree_lo[v], self.vtree_hi[v] + 1, 2):
+            col = self.var_column[self.vtree_var[p]]
+            if col >= 0:
+                model[col] = k & 1
+                k >>= 1
+
+    cdef void _unrank(self, uint64_t k, int8_t* model) nogil:
+        """Write model k (0 <= k < model_count) to model.
+
+        The stack contains nodes and slots (encoded as -1-slot), together with the rank of the model
+        that is requested for that node or slot.
+        """
+        cdef Py_ssize_t depth = 1, node, slot, e, lo, hi, mid, g, v
+        cdef uint64_t r
+        cdef int64_t literal
+        self.stack_id[0] = -1 - 2 * self.nb_elements
+        self.stack_k[0] = k
+        while depth > 0:
+            depth -= 1
+            node = self.stack_id[depth]
+            r = self.stack_k[depth]
+            if node < 0:
+                slot = -1 - node
+                for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+                    v = self.gap_vtrees[g]
+                    self._assign_gap(v, r, model)
+                    if self.vtree_nb_vars[v] >= 64:
+                        r = 0
+                    else:
+                        r >>= self.vtree_nb_vars[v]
+                if slot == 2 * self.nb_elements:
+                    self.stack_id[depth] = self.root
+                elif slot % 2 == 0:
+                    self.stack_id[depth] = self.primes[slot // 2]
+                else:
+                    self.stack_id[depth] = self.subs[slot // 2]
+                self.stack_k[depth] = r
+                depth += 1
+            elif self.kind[node] == DECISION_NODE:
+                # First element for which the cumulative count exceeds r
+                lo = self.elem_offsets[node]
+                hi = self.elem_offsets[node + 1] - 1
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self.element_cumsum[mid] > r:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                e = lo
+                if e > self.elem_offsets[node]:
+                    r -= self.element_cumsum[e - 1]
+                self.stack_id[depth] = -1 - (2 * e + 1)
+                self.stack_k[depth] = r % self.slot_count[2 * e + 1]
+                self.stack_id[depth + 1] = -1 - 2 * e
+                self.stack_k[depth + 1] = r // self.slot_count[2 * e + 1]
+                depth += 2
+            elif self.kind[node] == LITERAL_NODE:
+                literal = self.literal[node]
+                if literal > 0:
+                    model[self.var_column[literal]] = 1
+                else:
+                    model[self.var_column[-literal]] = 0
+
+    def fill(self, int8_t[:, ::1] models, start):
+        """Write the models with rank start, start+1, ... to the rows of models."""
+        cdef uint64_t k
+        cdef Py_ssize_t row
+        if start + models.shape[0] > self.model_count:
+            raise IndexError("Model rank larger than the model count")
+        if self.saturated:
+            for row in range(models.shape[0]):
+                self._unrank_big(start + row, models[row])
+            return
+        k = start
+        with nogil:
+            for row in range(models.shape[0]):
+                self._unrank(k + row, &models[row, 0])
+
+
+cdef inline uint64_t _splitmix64(uint64_t* state) nogil:
+    cdef uint64_t z
+    state[0] += 0x9E3779B97F4A7C15ULL
+    z = state[0]
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+    return z ^ (z >> 31)
+
+
+cdef inline double _uniform(uint64_t* state) nogil:
+    """Uniform value in [0, 1)."""
+    return (_splitmix64(state) >> 11) * (1.0 / 9007199254740992.0)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef class _Sampler:
+    """Top-down sampling of models, proportional to the weighted model counts of the elements."""
+    cdef Py_ssize_t root
+    cdef Py_ssize_t nb_elements
+    cdef const int8_t[::1] kind
+    cdef const int64_t[::1] literal
+    cdef const int64_t[::1] elem_offsets
+    cdef const int64_t[::1] primes
+    cdef const int64_t[::1] subs
+    cdef int64_t[::1] gap_offsets
+    cdef int64_t[::1] gap_vtrees
+    cdef const int64_t[::1] vtree_var
+    cdef int64_t[::1] vtree_lo
+    cdef int64_t[::1] vtree_hi
+    cdef double[::1] element_cumsum  # Cumulative probability of the elements within a decision node
+    cdef double[::1] prob_true  # Probability of a variable being true if it is not constrained
+    cdef int64_t[::1] stack
+
+    def __init__(self, Circuit circuit, weights=None):
+        cdef Py_ssize_t i, e, slot, g, var
+        cdef double total, logw
+        if circuit.vtree_arrays is None:
+            raise ValueError("Sampling requires a circuit with the vtree arrays")
+        self.root = circuit.root
+        self.nb_elements = circuit.nb_elements
+        self.kind = circuit.kind
+        self.literal = circuit.literal
+        self.elem_offsets = circuit.elem_offsets
+        self.primes = circuit.primes
+        self.subs = circuit.subs
+        self.gap_offsets = circuit.gap_offsets
+        self.gap_vtrees = circuit.gap_vtrees
+        self.vtree_var = circuit.vtree_var
+        self.vtree_lo = circuit.vtree_lo
+        self.vtree_hi = circuit.vtree_hi
+        if weights is None:
+            weights = np.ones(2 * circuit.var_count)
+        weights = np.asarray(circuit._check_weights(weights))
+        if np.any(weights < 0):
+            raise ValueError("Weights should be non-negative")
+        with np.errstate(divide="ignore"):
+            log_weights = np.log(weights)
+        # Upward pass in log-space
+        cdef double[:, ::1] values = np.empty((circuit.nb_nodes + 1, 1), dtype=np.float64)
+        cdef double[:, ::1] vvalues = np.empty((circuit.nb_vtree_nodes, 1), dtype=np.float64)
+        circuit._upward(log_weights, 0, 1, True, values, vvalues)
+        circuit._root_values(1, True, values, vvalues, &total)
+        if total == -INFINITY or total != total:
+            raise ValueError("The SDD has no models with a positive weight")
+        self.element_cumsum = np.empty(circuit.nb_elements, dtype=np.float64)
+        for i in range(circuit.nb_nodes):
+            if circuit.kind[i] != DECISION_NODE:
+                continue
+            total = 0.0
+            for e in range(circuit.elem_offsets[i], circuit.elem_offsets[i + 1]):
+                logw = values[circuit.primes[e], 0] + values[circuit.subs[e], 0] - values[i, 0]
+                for slot in range(2 * e, 2 * e + 2):
+                    for g in range(circuit.gap_offsets[slot], circuit.gap_offsets[slot + 1]):
+                        logw += vvalues[circuit.gap_vtrees[g], 0]
+                total += exp(logw)
+                self.element_cumsum[e] = total
+        self.prob_true = np.zeros(circuit.var_count + 1, dtype=np.float64)
+        for var in range(1, circuit.var_count + 1):
+            total = weights[0, circuit.var_count + var - 1] + weights[0, circuit.var_count - var]
+            if total > 0:
+                self.prob_true[var] = weights[0, circuit.var_count + var - 1] / total
+        self.stack = np.empty(2 * circuit.nb_nodes + 2, dtype=np.int64)
+
+    cdef void _draw(self, uint64_t* state, int8_t* model) nogil:
+        """Write one sample to model, nodes and slots (encoded as -1-slot) are visited top-down."""
+        cdef Py_ssize_t depth = 1, node, slot, e, lo, hi, mid, g, v, p, var
+        cdef double u
+        cdef int64_t literal
+        self.stack[0] = -1 - 2 * self.nb_elements
+        while depth > 0:
+            depth -= 1
+            node = self.stack[depth]
+            if node < 0:
+                slot = -1 - node
+                for g in range(self.gap_offsets[slot], self.gap_offsets[slot + 1]):
+                    v = self.gap_vtrees[g]
+                    for p in range(self.vtree_lo[v], self.vtree_hi[v] + 1, 2):
+                        var = self.vtree_var[p]
+                        model[var - 1] = _uniform(state) < self.prob_true[var]
+                if slot == 2 * self.nb_elements:
+                    self.stack[depth] = self.root
+                elif slot % 2 == 0:
+                    self.stack[depth] = self.primes[slot // 2]
+                else:
+                    self.stack[depth] = self.subs[slot // 2]
+                depth += 1
+            elif self.kind[node] == DECISION_NODE:
+                lo = self.elem_offsets[node]
+                hi = self.elem_offsets[node + 1] - 1
+                u = _uniform(state) * self.element_cumsum[hi]
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self.element_cumsum[mid] > u:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                e = lo
+                self.stack[depth] = -1 - (2 * e + 1)
+                self.stack[depth + 1] = -1 - 2 * e
+                depth += 2
+            elif self.kind[node] == LITERAL_NODE:
+                literal = self.literal[node]
+                if literal > 0:
+                    model[literal - 1] = 1
+                else:
+                    model[-literal - 1] = 0
+
+    def fill(self, int8_t[:, ::1] samples, uint64_t seed):
+        """Write a sample to every row of samples."""
+        cdef uint64_t state = seed
+        cdef Py_ssize_t row
+        with nogil:
+            for row in range(samples.shape[0]):
+                self._draw(&state, &samples[row, 0])
+
+
+# Edge codes of derivations without tails
+DEF LEAF_EDGE = -1  # Literal or true node
+DEF POSITIVE_EDGE = -2  # Positive literal of a vtree leaf
+DEF NEGATIVE_EDGE = -3  # Negative literal of a vtree leaf
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef class _TopK:
+    """Lazy enumeration of the models with the largest weight, in order.
+
+    The smoothed circuit is a hypergraph with a node for every SDD node, every vtree node (for the
+    variables in the gaps) and the root. Hyperedges are the elements (tails are the prime, the sub
+    and the gaps), the internal vtree nodes (tails are the children) and the root (tails are the
+    root node and the root gaps). The k-th best derivation of a node is computed on demand from
+    the best derivations of the tails (Huang and Chiang, Better k-best parsing, 2005), thus finding
+    the k best models costs O(|SDD| + k * |model| * log(k)).
+
+    A derivation is a tuple (log-weight, edge, ranks of the derivations of the tails). The
+    derivations are computed with an explicit stack of (node, k) requests, deep circuits do not
+    recurse.
+    """
+    cdef Circuit circuit
+    cdef Py_ssize_t nb_nodes
+    cdef Py_ssize_t root
+    cdef double[::1] log_weights
+    cdef int64_t[::1] tail_offsets
+    cdef int64_t[::1] tails
+    cdef list derivations
+    cdef list candidates  # Heap of (-log-weight, edge, ranks)
+    cdef list seen  # Edges and ranks that have been added to the candidates
+    cdef int64_t[::1] nb_pushed  # Number of derivations whose successors are in the candidates
+
+    def __init__(self, Circuit circuit, weights=None, bint log_mode=False):
+        cdef Py_ssize_t e, v, g, nb_edges, nb_tails = 0
+        if circuit.vtree_arrays is None:
+            raise ValueError("Top-k models requires a circuit with the vtree arrays")
+        self.circuit = circuit
+        if weights is None:
+            weights = np.zeros(2 * circuit.var_count) if log_mode else np.ones(2 * circuit.var_count)
+        weights = np.asarray(circuit._check_weights(weights))[0]
+        if not log_mode:
+            with np.errstate(divide="ignore"):
+                weights = np.log(weights)
+        self.log_weights = weights
+        self.nb_nodes = circuit.nb_nodes + circuit.nb_vtree_nodes + 1
+        self.root = self.nb_nodes - 1
+        # Edges: elements, vtree nodes and the root
+        nb_edges = circuit.nb_elements + circuit.nb_vtree_nodes + 1
+        self.tail_offsets = np.empty(nb_edges + 1, dtype=np.int64)
+        self.tails = np.empty(2 * nb_edges + len(circuit.gap_vtrees), dtype=np.int64)
+        for e in range(circuit.nb_elements):
+            self.tail_offsets[e] = nb_tails
+            self.tails[nb_tails] = circuit.primes[e]
+            self.tails[nb_tails + 1] = circuit.subs[e]
+            nb_tails += 2
+            for g in range(circuit.gap_offsets[2 * e], circuit.gap_offsets[2 * e + 2]):
+                self.tails[nb_tails] = circuit.nb_nodes + circuit.gap_vtrees[g]
+                nb_tails += 1
+        for v in range(circuit.nb_vtree_nodes):
+            self.tail_offsets[circuit.nb_elements + v] = nb_tails
+            if circuit.vtree_left[v] >= 0:
+                self.tails[nb_tails] = circuit.nb_nodes + circuit.vtree_left[v]
+                self.tails[nb_tails + 1] = circuit.nb_nodes + circuit.vtree_right[v]
+                nb_tails += 2
+        self.tail_offsets[nb_edges - 1] = nb_tails
+        self.tails[nb_tails] = circuit.root
+        nb_tails += 1
+        for g in range(circuit.gap_offsets[2 * circuit.nb_elements], circuit.gap_offsets[2 * circuit.nb_elements + 1]):
+            self.tails[nb_tails] = circuit.nb_nodes + circuit.gap_vtrees[g]
+            nb_tails += 1
+        self.tail_offsets[nb_edges] = nb_tails
+        self.derivations = [None] * self.nb_nodes
+        self.candidates = [None] * self.nb_nodes
+        self.seen = [None] * self.nb_nodes
+        self.nb_pushed = np.zeros(self.nb_nodes, dtype=np.int64)
+
+    cdef double _score(self, int64_t edge, tuple ranks):
+        cdef Py_ssize_t t
+        cdef int64_t offset = self.tail_offsets[edge]
+        cdef double score = 0
+        for t in range(len(ranks)):
+            score += self.derivations[self.tails[offset + t]][ranks[t]][0]
+        return score
+
+    cdef _init(self, Py_ssize_t x):
+        """Derivations of leaves, the candidates of other nodes are added once their tails are known."""
+        cdef Circuit circuit = self.circuit
+        cdef Py_ssize_t n = circuit.var_count, v
+        cdef double pos, neg
+        derivations = []
+        self.derivations[x] = derivations
+        self.seen[x] = set()
+        if x < circuit.nb_nodes:
+            if circuit.kind[x] == LITERAL_NODE:
+                derivations.append((self.log_weights[_weight_index(circuit.literal[x], n)], LEAF_EDGE, ()))
+            elif circuit.kind[x] == TRUE_NODE:
+                derivations.append((0.0, LEAF_EDGE, ()))
+        elif x < self.root:
+            v = x - circuit.nb_nodes
+            if circuit.vtree_left[v] < 0:
+                pos = self.log_weights[n + circuit.vtree_var[v] - 1]
+                neg = self.log_weights[n - circuit.vtree_var[v]]
+                derivations.append((pos, POSITIVE_EDGE, ()))
+                derivations.append((neg, NEGATIVE_EDGE, ()))
+                if neg > pos:
+                    derivations.reverse()
+
+    cdef tuple _edge_range(self, Py_ssize_t x):
+        cdef Circuit circuit = self.circuit
+        cdef Py_ssize_t v
+        if x < circuit.nb_nodes:
+            if circuit.kind[x] == DECISION_NODE:
+                return circuit.elem_offsets[x], circuit.elem_offsets[x + 1]
+        elif x < self.root:
+            v = x - circuit.nb_nodes
+            if circuit.vtree_left[v] >= 0:
+                return circuit.nb_elements + v, circuit.nb_elements + v + 1
+        else:
+            return circuit.nb_elements + circuit.nb_vtree_nodes, circuit.nb_elements + circuit.nb_vtree_nodes + 1
+        return 0, 0
+
+    cdef bint _resolved(self, Py_ssize_t x, Py_ssize_t k):
+        """True if node x has k derivations, or if it is known to have less."""
+        cdef list derivations = self.derivations[x]
+        cdef list candidates = self.candidates[x]
+        if derivations is None or candidates is None:
+            return False
+        if len(derivations) >= k:
+            return True
+        return self.nb_pushed[x] == len(derivations) and (len(candidates) == 0 or candidates[0][0] == INFINITY)
+
+    cdef bint _has(self, Py_ssize_t x, Py_ssize_t k):
+        cdef list derivations = self.derivations[x]
+        return len(derivations) >= k and derivations[k - 1][0] > -INFINITY
+
+    cdef bint _kth(self, Py_ssize_t x, Py_ssize_t k) except -1:
+        """Compute the k best derivations of node x, returns False if there are less than k derivations."""
+        cdef Py_ssize_t y, needed, e, t, first, last
+        cdef int64_t edge, offset
+        cdef tuple ranks
+        cdef list derivations, candidates
+        stack = [(x, k)]
+        while stack:
+            y, needed = stack[len(stack) - 1]
+            if self.derivations[y] is None:
+                self._init(y)
+            derivations = self.derivations[y]
+            candidates = self.candidates[y]
+            if candidates is None:
+                # The best derivation of every edge, after the best derivations of the tails
+                first, last = self._edge_range(y)
+                pending = self._pending_tail(first, last)
+                if pending is not None:
+                    stack.append(pending)
+                    continue
+                candidates = []
+                self.candidates[y] = candidates
+                for e in range(first, last):
+                    ranks = (0,) * (self.tail_offsets[e + 1] - self.tail_offsets[e])
+                    for t in range(len(ranks)):
+                        if not self._has(self.tails[self.tail_offsets[e] + t], 1):
+                            break
+                    else:
+                        self.seen[y].add((e, ranks))
+                        heappush(candidates, (-self._score(e, ranks), e, ranks))
+            if len(derivations) >= needed:
+                stack.pop()
+                continue
+            if self.nb_pushed[y] < len(derivations):
+                # The successors of the last derivation need the next derivation of one of the tails
+                edge = derivations[len(derivations) - 1][1]
+                ranks = derivations[len(derivations) - 1][2]
+                offset = self.tail_offsets[edge] if edge >= 0 else 0
+                for t in range(len(ranks)):
+                    if not self._resolved(self.tails[offset + t], ranks[t] + 2):
+                        stack.append((self.tails[offset + t], ranks[t] + 2))
+                        break
+                else:
+                    self._push_next(y, derivations[len(derivations) - 1])
+                    self.nb_pushed[y] = len(derivations)
+                continue
+            if len(candidates) == 0 or candidates[0][0] == INFINITY:
+                stack.pop()
+                continue
+            neg_score, edge, ranks = heappop(candidates)
+            derivations.append((-neg_score, edge, ranks))
+        return self._has(x, k)
+
+    cdef _pending_tail(self, Py_ssize_t first, Py_ssize_t last):
+        """A request for the best derivation of a tail that is not known yet, None if there is none."""
+        cdef Py_ssize_t e, t
+        for e in range(first, last):
+            for t in range(self.tail_offsets[e], self.tail_offsets[e + 1]):
+                if not self._resolved(self.tails[t], 1):
+                    return self.tails[t], 1
+                if not self._has(self.tails[t], 1):
+                    break
+        return None
+
+    cdef _push_next(self, Py_ssize_t x, tuple derivation):
+        """Add the successors of a derivation to the candidates of node x, the tails are resolved."""
+        cdef Py_ssize_t t
+        cdef int64_t edge = derivation[1]
+        cdef tuple ranks = derivation[2]
+        cdef tuple successor
+        for t in range(len(ranks)):
+            successor = ranks[:t] + (ranks[t] + 1,) + ranks[t + 1:]
+            if (edge, successor) in self.seen[x]:
+                continue
+            if self._has(self.tails[self.tail_offsets[edge] + t], successor[t] + 1):
+                self.seen[x].add((edge, successor))
+                heappush(self.candidates[x], (-self._score(edge, successor), edge, successor))
+
+    cdef _fill(self, Py_ssize_t rank, int8_t[::1] model):
+        """Write the model of the derivation with the given rank of the root."""
+        cdef Circuit circuit = self.circuit
+        cdef Py_ssize_t x, r, t, v
+        cdef int64_t edge, offset, literal
+        stack = [(self.root, rank)]
+        while stack:
+            x, r = stack.pop()
+            _, edge, ranks = self.derivations[x][r]
+            if edge >= 0:
+                offset = self.tail_offsets[edge]
+                for t in range(len(ranks)):
+                    stack.append((self.tails[offset + t], ranks[t]))
+            elif edge == LEAF_EDGE:
+                if circuit.kind[x] == LITERAL_NODE:
+                    literal = circuit.literal[x]
+                    if literal > 0:
+                        model[literal - 1] = 1
+                    else:
+                        model[-literal - 1] = 0
+            else:
+                v = x - circuit.nb_nodes
+                model[circuit.vtree_var[v] - 1] = 1 if edge == POSITIVE_EDGE else 0
+
+    def top_k(self, Py_ssize_t k):
+        """The k models with the largest weight (less if there are fewer models) and their log-weights."""
+        cdef Py_ssize_t rank = 0
+        while rank < k and self._kth(self.root, rank + 1):
+            rank += 1
+        models = np.empty((rank, self.circuit.var_count), dtype=np.int8)
+        log_weights = np.empty(rank, dtype=np.float64)
+        for rank in range(len(log_weights)):
+            self._fill(rank, models[rank])
+            log_weights[rank] = self.derivations[self.root][rank][0]
+        return models, log_weights
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef class IncrementalWmc:
+    """Weighted model count that is updated incrementally after changing literal weights.
+
+    :param circuit: Circuit, with the vtree arrays
+    :param weights: Literal weights [-n, ..., -1, 1, ..., n], by default all weights are one
+    :param log_mode: Weights and the weighted model count are natural logarithms
+
+    After changing the weights of a few literals, propagate only recomputes the nodes that depend
+    on these literals: the literal nodes, the decision nodes that smooth over the variables, and
+    their ancestors. Ancestors of nodes whose value did not change are not revisited.
+    """
+    cdef Circuit circuit
+    cdef readonly bint log_mode
+    cdef double[:, ::1] weights
+    cdef double[:, ::1] values
+    cdef double[:, ::1] vvalues
+    cdef double root_value
+    cdef int64_t[::1] parent_offsets  # Decision nodes that have a node as prime or sub
+    cdef int64_t[::1] parents
+    cdef int64_t[::1] gap_user_offsets  # Decision nodes that have a vtree node in a gap
+    cdef int64_t[::1] gap_users
+    cdef int64_t[::1] literal_node  # Node of each literal (weights layout), -1 if not in the SDD
+    cdef int64_t[::1] vtree_parent
+    cdef int64_t[::1] vtree_of_var
+    cdef int64_t[::1] dirty_vars
+    cdef Py_ssize_t nb_dirty_vars
+    cdef int8_t[::1] var_is_dirty
+    cdef int8_t[::1] vtree_is_dirty
+    cdef int8_t[::1] node_is_queued
+    cdef int64_t[::1] dirty_vtrees
+    cdef int64_t[::1] heap
+
+    def __init__(self, Circuit circuit, weights=None, bint log_mode=False):
+        if circuit.vtree_arrays is None:
+            raise ValueError("Incremental WMC requires a circuit with the vtree arrays")
+        self.circuit = circuit
+        self.log_mode = log_mode
+        if weights is None:
+            weights = np.full(2 * circuit.var_count, 0.0 if log_mode else 1.0)
+        self.weights = np.array(circuit._check_weights(weights))
+        self.values = np.empty((circuit.nb_nodes + 1, 1), dtype=np.float64)
+        self.vvalues = np.empty((circuit.nb_vtree_nodes, 1), dtype=np.float64)
+        arrays = circuit.arrays
+        elem_owner = np.repeat(np.arange(circuit.nb_nodes), np.diff(arrays.elem_offsets))
+        # Parents
+        children = np.concatenate([arrays.primes, arrays.subs])
+        owners = np.concatenate([elem_owner, elem_owner])
+        self.parent_offsets, self.parents = self._csr(children, owners, circuit.nb_nodes)
+        # Decision nodes that use vtree nodes as gap, the root gap is always recomputed
+        gap_offsets = np.asarray(circuit.gap_offsets)[:2 * circuit.nb_elements + 1]
+        gap_slots = np.repeat(np.arange(2 * circuit.nb_elements), np.diff(gap_offsets))
+        self.gap_user_offsets, self.gap_users = self._csr(np.asarray(circuit.gap_vtrees)[:len(gap_slots)],
+                                                          elem_owner[gap_slots // 2], circuit.nb_vtree_nodes)
+        # Literals and variables
+        literal_node = np.full(2 * circuit.var_count, -1, dtype=np.int64)
+        is_literal = np.flatnonzero(np.asarray(arrays.kind) == LITERAL_NODE)
+        literals = np.asarray(arrays.literal)[is_literal]
+        literal_node[np.where(literals < 0, circuit.var_count + literals, circuit.var_count + literals - 1)] = is_literal
+        self.literal_node = literal_node
+        self.vtree_parent = np.ascontiguousarray(circuit.vtree_arrays.parent, dtype=np.int64)
+        vtree_of_var = np.full(circuit.var_count + 1, -1, dtype=np.int64)
+        leaves = np.flatnonzero(np.asarray(circuit.vtree_var) > 0)
+        vtree_of_var[np.asarray(circuit.vtree_var)[leaves]] = leaves
+        self.vtree_of_var = vtree_of_var
+        # Work space
+        self.dirty_vars = np.empty(circuit.var_count, dtype=np.int64)
+        self.nb_dirty_vars = 0
+        self.var_is_dirty = np.zeros(circuit.var_count + 1, dtype=np.int8)
+        self.vtree_is_dirty = np.zeros(circuit.nb_vtree_nodes, dtype=np.int8)
+        self.node_is_queued = np.zeros(circuit.nb_nodes, dtype=np.int8)
+        self.dirty_vtrees = np.empty(circuit.nb_vtree_nodes, dtype=np.int64)
+        self.heap = np.empty(circuit.nb_nodes, dtype=np.int64)
+        # Full pass
+        circuit._upward(self.weights, 0, 1, log_mode, self.values, self.vvalues)
+        circuit._root_values(1, log_mode, self.values, self.vvalues, &self.root_value)
+
+    @staticmethod
+    def _csr(keys, items, Py_ssize_t nb_keys):
+        """Unique items per key, in compressed sparse row format."""
+        pairs = np.unique(np.stack([keys, items], axis=1).astype(np.int64), axis=0)
+        offsets = np.zeros(nb_keys + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs[:, 0], minlength=nb_keys), out=offsets[1:])
+        return offsets, np.ascontiguousarray(pairs[:, 1])
+
+    def set_literal_weight(self, int64_t literal, double weight):
+        """Set the weight of a literal (natural log of the weight in log-mode)."""
+        cdef int64_t var = literal if literal > 0 else -literal
+        if literal == 0 or var > self.circuit.var_count:
+            raise ValueError(f"Literal {literal} is not in the circuit")
+        self.weights[0, _weight_index(literal, self.circuit.var_count)] = weight
+        if not self.var_is_dirty[var]:
+            self.var_is_dirty[var] = 1
+            self.dirty_vars[self.nb_dirty_vars] = var
+            self.nb_dirty_vars += 1
+
+    def literal_weight(self, int64_t literal):
+        """Returns the weight of a literal."""
+        cdef int64_t var = literal if literal > 0 else -literal
+        if literal == 0 or var > self.circuit.var_count:
+            raise ValueError(f"Literal {literal} is not in the circuit")
+        return self.weights[0, _weight_index(literal, self.circuit.var_count)]
+
+    def propagate(self):
+        """Returns the weighted model count, after recomputing the nodes affected by the changed weights."""
+        with nogil:
+            self._propagate()
+        return self.root_value
+
+    cdef void _push(self, Py_ssize_t node, Py_ssize_t* size) nogil:
+        """Add a node to the min-heap of nodes to recompute."""
+        cdef Py_ssize_t i = size[0], p
+        if self.node_is_queued[node]:
+            return
+        self.node_is_queued[node] = 1
+        size[0] += 1
+        while i > 0:
+            p = (i - 1) // 2
+            if self.heap[p] <= node:
+                break
+            self.heap[i] = self.heap[p]
+            i = p
+        self.heap[i] = node
+
+    cdef Py_ssize_t _pop(self, Py_ssize_t* size) nogil:
+        cdef Py_ssize_t top = self.heap[0], last, i = 0, c
+        size[0] -= 1
+        last = self.heap[size[0]]
+        while 2 * i + 1 < size[0]:
+            c = 2 * i + 1
+            if c + 1 < size[0] and self.heap[c + 1] < self.heap[c]:
+                c += 1
+            if self.heap[c] >= last:
+                break
+            self.heap[i] = self.heap[c]
+            i = c
+        self.heap[i] = last
+        self.node_is_queued[top] = 0
+        return top
+
+    cdef void _propagate(self) nogil:
+        cdef Py_ssize_t j, v, var, node, k, nb_dirty_vtrees = 0, size = 0
+        cdef double old
+        # Vtree values on the path from the changed variables to the root
+        for j in range(self.nb_dirty_vars):
+            var = self.dirty_vars[j]
+            v = self.vtree_of_var[var]
+            while v >= 0:
+                if self.circuit.vtree_left[v] < 0:
+                    if self.log_mode:
+                        self.vvalues[v, 0] = _logaddexp(self.weights[0, self.circuit.var_count + var - 1],
+                                                        self.weights[0, self.circuit.var_count - var])
+                    else:
+                        self.vvalues[v, 0] = self.weights[0, self.circuit.var_count + var - 1] + self.weights[0, self.circuit.var_count - var]
+                elif self.log_mode:
+                    self.vvalues[v, 0] = self.vvalues[self.circuit.vtree_left[v], 0] + self.vvalues[self.circuit.vtree_right[v], 0]
+                else:
+                    self.vvalues[v, 0] = self.vvalues[self.circuit.vtree_left[v], 0] * self.vvalues[self.circuit.vtree_right[v], 0]
+                if not self.vtree_is_dirty[v]:
+                    self.vtree_is_dirty[v] = 1
+                    self.dirty_vtrees[nb_dirty_vtrees] = v
+                    nb_dirty_vtrees += 1
+                v = self.vtree_parent[v]
+            # Literal nodes
+            node = self.literal_node[self.circuit.var_count + var - 1]
+            if node >= 0:
+                self._push(node, &size)
+            node = self.literal_node[self.circuit.var_count - var]
+            if node >= 0:
+                self._push(node, &size)
+            self.var_is_dirty[var] = 0
+        self.nb_dirty_vars = 0
+        # Decision nodes that smooth over the changed variables
+        for j in range(nb_dirty_vtrees):
+            v = self.dirty_vtrees[j]
+            self.vtree_is_dirty[v] = 0
+            for k in range(self.gap_user_offsets[v], self.gap_user_offsets[v + 1]):
+                self._push(self.gap_users[k], &size)
+        # Nodes in topological order (children have a lower index than their parents)
+        while size > 0:
+            node = self._pop(&size)
+            old = self.values[node, 0]
+            self._update(node)
+            if self.values[node, 0] != old:
+                for k in range(self.parent_offsets[node], self.parent_offsets[node + 1]):
+                    self._push(self.parents[k], &size)
+        self.circuit._root_values(1, self.log_mode, self.values, self.vvalues, &self.root_value)
+
+    cdef void _update(self, Py_ssize_t node) nogil:
+        """Recompute the value of a literal or decision node."""
+        cdef Py_ssize_t e, slot, g
+        cdef double value, total
+        if self.circuit.kind[node] == LITERAL_NODE:
+            self.values[node, 0] = self.weights[0, _weight_index(self.circuit.literal[node], self.circuit.var_count)]
+            return
+        total = -INFINITY if self.log_mode else 0.0
+        for e in range(self.circuit.elem_offsets[node], self.circuit.elem_offsets[node + 1]):
+            if self.log_mode:
+                value = self.values[self.circuit.primes[e], 0] + self.values[self.circuit.subs[e], 0]
+            else:
+                value = self.values[self.circuit.primes[e], 0] * self.values[self.circuit.subs[e], 0]
+            for slot in range(2 * e, 2 * e + 2):
+                for g in range(self.circuit.gap_offsets[slot], self.circuit.gap_offsets[slot + 1]):
+                    if self.log_mode:
+                        value += self.vvalues[self.circuit.gap_vtrees[g], 0]
+                    else:
+                        value *= self.vvalues[self.circuit.gap_vtrees[g], 0]
+            if self.log_mode:
+                total = _logaddexp(total, value)
+            else:
+                total += value
+        self.values[node, 0] = total
@@ -28,10 +28,27 @@ cdef extern from "compiler.h":
         int vtree_search_mode       #  vtree search mode
         int post_search             #  post-compilation search
         int verbose                 #  print manager
+    ctypedef struct LitSet:
+        sddapi_c.SddSize id
+        sddapi_c.SddLiteral literal_count
+        sddapi_c.SddLiteral* literals
+        sddapi_c.BoolOp op  # DISJOIN (clause) or CONJOIN (term)
+        sddapi_c.Vtree* vtree
+        unsigned bit
     ctypedef struct Fnf:
         long var_count;
         sddapi_c.SddSize litset_count;
+        LitSet* litsets  # array of literal sets
+        sddapi_c.BoolOp op  # CONJOIN (CNF) or DISJOIN (DNF)
     ctypedef Fnf Cnf;
     ctypedef Fnf Dnf;
 
-    sddapi_c.SddNode* fnf_to_sdd(Fnf* fnf, sddapi_c.SddManager* manager);
+    sddapi_c.SddNode* fnf_to_sdd(Fnf* fnf, sddapi_c.SddManager* manager) nogil;
+    void sort_litsets_by_lca(LitSet** litsets, sddapi_c.SddSize litset_count, sddapi_c.SddManager* manager) nogil;
+
+cdef extern from *:
+    # Compiles a single clause or term, defined in fnf/compiler.c without a declaration in compiler.h
+    """
+    SddNode* apply_litset(LitSet* litset, SddManager* manager);
+    """
+    sddapi_c.SddNode* apply_litset(LitSet* litset, sddapi_c.SddManager* manager) nogil
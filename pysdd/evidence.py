@@ -16,6 +16,7 @@ import time
 import argparse
 import logging
 from pysdd.sdd import SddManager, Vtree, Fnf, CompilerOptions
+from pysdd.util import read_weighted_fnf
 
 
 logger = logging.getLogger(__name__)
@@ -26,7 +27,8 @@ def main(argv=None):
 
     if options.cnf_filename is not None:
         print("creating manager...")
-        sdd, _ = SddManager.from_cnf_file(bytes(options.cnf_filename))
+        fnf, weights = read_weighted_fnf(bytes(options.cnf_filename))
+        sdd, _ = SddManager.from_fnf(fnf)
 
         root = sdd.root
 
@@ -34,7 +36,6 @@ def main(argv=None):
         wmc = root.wmc(log_mode=False)
         wmc.propagate()
 
-        weights = read_weights(bytes(options.cnf_filename))
         print("Weights size: " + str(len(weights)))
 
         literals = [sdd.literal(i) for i in range(1, sdd.var_count()+1)]
@@ -42,9 +43,7 @@ def main(argv=None):
         print("Number of literals: " + str(len(literals)))
 
         # Set weights for all literals
-        for i in range(1, len(literals)+1):
-            wmc.set_literal_weight(i, weights[(i-1)*2])  # Positive literal weight
-            wmc.set_literal_weight(-i, weights[(i-1)*2+1])  # Negative literal weight
+        wmc.set_literal_weights_from_array(weights)
 
         w = wmc.propagate()
 
@@ -84,35 +83,11 @@ def main(argv=None):
         print("8: " + str(wmc.literal_pr(8)))
 
 
-def read_weights(nnf_path):
-    """
-    Format: c weights PW_1 NW_1 ... PW_n NW_n
-    :param nnf_path: Path to NNF file
-    :return: list of weights
-    """
-    weight_str = None
-    with open(nnf_path, "r") as ifile:
-        for line in ifile.readlines():
-            if "c weights " in line:
-                weight_str = line[10:].strip()
-                break
-    if weight_str is None:
-        return None
-    weight_strs = weight_str.split(" ")
-    weights = [float(w) for w in weight_strs]
-    return weights
-
-
 def create_wmc(node, weights):
     if weights is None:
         return None
     wmc = node.wmc(False)
-    for i in range(len(weights)):
-        lit = (i // 2) + 1
-        if (i % 2) == 1:
-            lit = -lit
-        w = weights[i]
-        wmc.set_literal_weight(node.manager.literal(lit), w)
+    wmc.set_literal_weights_from_array(weights)
     return wmc
 
 
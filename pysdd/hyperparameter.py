@@ -16,6 +16,7 @@ import time
 import argparse
 import logging
 from pysdd.sdd import SddManager, Vtree, Fnf, CompilerOptions
+from pysdd.util import read_weighted_fnf, read_weight_line
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +28,10 @@ def main(argv=None):
 
     if options.cnf_filename is not None:
         # print("reading cnf...")
-        fnf = Fnf.from_cnf_file(bytes(options.cnf_filename))
-        weights = read_weights(options.cnf_filename)
+        fnf, weights = read_weighted_fnf(bytes(options.cnf_filename))
     elif options.dnf_filename is not None:
         # print("reading dnf...")
-        fnf = Fnf.from_dnf_file(bytes(options.dnf_filename))
-        weights = read_weights(options.cnf_filename)
+        fnf, weights = read_weighted_fnf(bytes(options.dnf_filename), "dnf")
 
     if options.vtree_filename is not None:
         # print("reading initial vtree...")
@@ -73,32 +72,17 @@ def create_wmc(node, weights, args):
     if weights is None:
         return None
     wmc = node.wmc(log_mode=args.log_mode)
-    for i in range(len(weights)):
-        lit = (i // 2) + 1
-        if (i % 2) == 1:
-            lit = -lit
-        w = weights[i]
-        wmc.set_literal_weight(node.manager.literal(lit), w)
+    wmc.set_literal_weights_from_array(weights)
     return wmc
 
 
-def read_weights(nnf_path):
+def read_weights(sdd_path):
     """
     Format: c weights PW_1 NW_1 ... PW_n NW_n
-    :param nnf_path: Path to NNF file
-    :return: list of weights
+    :param sdd_path: Path to SDD file
+    :return: array with weights of literals [-n, ..., -1, 1, ..., n]
     """
-    weight_str = None
-    with open(nnf_path, "r") as ifile:
-        for line in ifile.readlines():
-            if "c weights " in line:
-                weight_str = line[10:].strip()
-                break
-    if weight_str is None:
-        return None
-    weight_strs = weight_str.split(" ")
-    weights = [float(w) for w in weight_strs]
-    return weights
+    return read_weight_line(sdd_path)
 
 
 def print_node(node, wmc=None):
@@ -16,6 +16,75 @@ if MYPY:
     from typing import Dict, Set, Optional, List, Tuple, Callable, Union
 
 
+class VtreeVars:
+    """The set of variables in a vtree node.
+
+    Behaves as a read-only set, but does not store the variables. Variables in a vtree node are
+    a contiguous range of leaves in the in-order traversal of the vtree, thus the size and
+    membership tests are computed in constant time from the range.
+    """
+    __slots__ = ("position", "lo", "hi", "nb_models", "_leaves")
+
+    def __init__(self, position, lo, hi, leaves):
+        self.position = position  # Vtree position
+        self.lo = lo  # Position of the leftmost leaf
+        self.hi = hi  # Position of the rightmost leaf
+        self.nb_models = 2 ** len(self)  # Number of assignments to the variables, the smoothing factor
+        self._leaves = leaves  # type: VtreeLeaves
+
+    def __len__(self):
+        return (self.hi - self.lo) // 2 + 1
+
+    def __contains__(self, var):
+        if not 0 < var < len(self._leaves.position):
+            return False
+        return self.lo <= self._leaves.position[var] <= self.hi
+
+    def __iter__(self):
+        return iter(self._leaves.var[self.lo:self.hi + 1:2].tolist())
+
+    def __or__(self, other):
+        return frozenset(self) | frozenset(other)
+
+    def __sub__(self, other):
+        if isinstance(other, VtreeVars) and self.lo <= other.lo and other.hi <= self.hi:
+            return frozenset(self._leaves.var[self.lo:other.lo:2].tolist() +
+                             self._leaves.var[other.hi + 2:self.hi + 1:2].tolist())
+        return frozenset(self) - frozenset(other)
+
+    def __eq__(self, other):
+        if isinstance(other, VtreeVars):
+            return self.lo == other.lo and self.hi == other.hi
+        return frozenset(self) == other
+
+    def __hash__(self):
+        # Equal to the hash of the frozenset, VtreeVars compare equal to sets of the same variables
+        return hash(frozenset(self))
+
+    def __repr__(self):
+        return "VtreeVars({})".format(set(self))
+
+
+def _nb_models(variables):
+    """Number of assignments to a set of variables, precomputed for VtreeVars."""
+    if isinstance(variables, VtreeVars):
+        return variables.nb_models
+    return 2 ** len(variables)
+
+
+# Variables of the true and false nodes, which have no vtree
+_NO_VARS = frozenset()
+
+
+class VtreeLeaves:
+    """Variables of the leaves of a vtree, indexed by vtree position, and the position of every variable."""
+    __slots__ = ("var", "position")
+
+    def __init__(self, var, position):
+        self.var = var
+        self.position = position
+
+
 class SddIterator:
     def __init__(self, sdd, smooth=True, smooth_to_root=False):
         """Simple iterator to iterate over the SDD graph.
@@ -24,9 +93,10 @@ class SddIterator:
         (1) it contains at least one indicator for each variable in X, and
         (2) for every child c of '+'-node n, we have vars(n) = vars(c).
 
-        Note, if you know that you will be performing WMC, smoothing can be implemented more efficient
-        by keeping track of the expected WMC of used and unused variables in the vtree instead of keeping
-        track of the sets of variables as is done in this iterator.
+        The sets of variables that are passed to the function are VtreeVars objects. They represent the
+        variables in a vtree node by a range of vtree positions. Their size and membership are thus computed
+        in constant time and no set of variables is stored per vtree node. The smoothing factors for weighted
+        model counting are cached per pair of vtree nodes (see ``func_weightedmodelcounting``).
 
         :param sdd: WmcManager
         :param smooth: Perform smoothing while iterating over the graph
@@ -35,8 +105,10 @@ class SddIterator:
         self.sdd = sdd  # type: SddManager
         self.vtree = sdd.vtree()  # type: Vtree
         self._wmc_cache = dict()  # type: Dict[SddNode, Union[float, int]]
+        # Map Sdd nodes to the variables of their vtree node
+        self._node_vars = dict()  # type: Dict[SddNode, Union[VtreeVars, frozenset]]
         # Map Vtree node positions to expected variables
-        self._expected_vars = None  # type: Optional[Dict[int, Set[int]]]
+        self._expected_vars = None  # type: Optional[List[VtreeVars]]
         # Map Sdd nodes to missing variables
         self._missing_vars = dict()  # type: Dict[SddNode, Set[int]]
         self.smooth = smooth  # type: bool
@@ -46,25 +118,29 @@ class SddIterator:
             self._cache_expected_vars()
 
     def _cache_expected_vars(self):
-        self._expected_vars = dict()
-        nb_vtree_nodes = self.sdd.var_count() * 2 - 1
-        # visited = [False] * nb_vtree_nodes
-        visited = np.zeros(nb_vtree_nodes, dtype=bool)
-        queue = deque([self.vtree])
+        arrays = self.vtree.to_arrays()
+        nb_vtree_nodes = len(arrays.var)
+        lo = np.arange(nb_vtree_nodes)
+        hi = np.arange(nb_vtree_nodes)
+        # Post-order: reverse of a pre-order that visits the right child first
+        order = []
+        queue = deque([arrays.root])
         while len(queue) > 0:
-            node = queue.pop()  # type: Vtree
-            pos = node.position()
-            if node.is_leaf():
-                self._expected_vars[pos] = {node.var()}
-            else:
-                if visited[pos]:
-                    self._expected_vars[pos] = self._expected_vars[node.left().position()] | \
-                                               self._expected_vars[node.right().position()]
-                else:
-                    visited[pos] = True
-                    queue.append(node)
-                    queue.append(node.right())
-                    queue.append(node.left())
+            pos = queue.pop()
+            order.append(pos)
+            if arrays.left[pos] >= 0:
+                queue.append(arrays.left[pos])
+                queue.append(arrays.right[pos])
+        for pos in reversed(order):
+            if arrays.left[pos] >= 0:
+                lo[pos] = lo[arrays.left[pos]]
+                hi[pos] = hi[arrays.right[pos]]
+        position = np.full(max(arrays.var) + 1, -1, dtype=np.int64)
+        is_leaf = arrays.var > 0
+        position[arrays.var[is_leaf]] = np.flatnonzero(is_leaf)
+        self._leaves = VtreeLeaves(arrays.var, position)
+        self._expected_vars = [VtreeVars(pos + arrays.offset, pos_lo, pos_hi, self._leaves)
+                               for pos, (pos_lo, pos_hi) in enumerate(zip(lo.tolist(), hi.tolist()))]
 
     def depth_first_from_root(self, func):
         # type: (SddIterator, Callable) -> List[Union[int, float]]
@@ -98,10 +174,11 @@ class SddIterator:
         :return:
         """
         self._wmc_cache = dict()
+        self._node_vars = dict()
         if self.smooth and self._expected_vars is None:
             self._cache_expected_vars()
         if self.smooth and (node.is_true() or node.is_literal()):
-            wmc = func(node, None, self._expected_vars[self.vtree.position()], set())
+            wmc = func(node, None, self._expected_vars[self.vtree.position()], _NO_VARS)
         else:    
             wmc = self.depth_first_rec(node, func)
         if self.smooth_to_root and not (node.is_true() or node.is_literal() or node.is_false()):
@@ -110,59 +187,48 @@ class SddIterator:
                 wmc_prime = wmc
                 wmc_sub = func(self.sdd.true(), None, None, None)
                 used_prime_vars = self._expected_vars[node.vtree().position()]
-                used_sub_vars = set()
+                used_sub_vars = _NO_VARS
                 rvalues = [(wmc_prime, wmc_sub, used_prime_vars, used_sub_vars)]
                 expected_prime_vars = used_prime_vars
                 expected_sub_vars = self._expected_vars[root.position()] - used_prime_vars
                 wmc = func(None, rvalues, expected_prime_vars, expected_sub_vars)
         return wmc
 
+    def _vars_of(self, node):
+        """Variables of the vtree node of an SDD node, computed once per SDD node."""
+        used_vars = self._node_vars.get(node)
+        if used_vars is None:
+            vtree = node.vtree()
+            used_vars = _NO_VARS if vtree is None else self._expected_vars[vtree.position()]
+            self._node_vars[node] = used_vars
+        return used_vars
+
     def depth_first_rec(self, node, func):
         # type: (SddIterator, SddNode, Callable) -> Union[int, float]
-        if node in self._wmc_cache:
-            return self._wmc_cache[node]
-        if node.is_false():
-            result = func(node, None, None, None)
-            self._wmc_cache[node] = result
-            return result
-        if node.is_true():
-            result = func(node, None, None, None)
-            self._wmc_cache[node] = result
-            return result
-        vtree = node.vtree()
-        if node.is_decision():
-            rvalues = []
+        wmc_cache = self._wmc_cache
+        if node in wmc_cache:
+            return wmc_cache[node]
+        if not node.is_decision():
+            rvalue = func(node, None, None, None)
+            wmc_cache[node] = rvalue
+            return rvalue
+        rvalues = []
+        if self.smooth:
+            vtree = node.vtree()
             vtree_left = vtree.left()
-            if not self.smooth or vtree_left is None:
-                expected_prime_vars = set()
-            else:
-                expected_prime_vars = self._expected_vars[vtree_left.position()]
+            expected_prime_vars = _NO_VARS if vtree_left is None else self._expected_vars[vtree_left.position()]
             vtree_right = vtree.right()
-            if not self.smooth or vtree_right is None:
-                expected_sub_vars = set()
-            else:
-                expected_sub_vars = self._expected_vars[vtree_right.position()]
+            expected_sub_vars = _NO_VARS if vtree_right is None else self._expected_vars[vtree_right.position()]
             for prime, sub in node.elements():
-                wmc_prime = self.depth_first_rec(prime, func)
-                wmc_sub = self.depth_first_rec(sub, func)
-                if not self.smooth:
-                    used_prime_vars = None
-                    used_sub_vars = None
-                else:
-                    if prime.vtree() is None:
-                        used_prime_vars = set()
-                    else:
-                        used_prime_vars = self._expected_vars[prime.vtree().position()]
-                    if sub.vtree() is None:
-                        used_sub_vars = set()
-                    else:
-                        used_sub_vars = self._expected_vars[sub.vtree().position()]
-                rvalues.append((wmc_prime, wmc_sub, used_prime_vars, used_sub_vars))
-            rvalue = func(node, rvalues, expected_prime_vars, expected_sub_vars)
+                rvalues.append((self.depth_first_rec(prime, func), self.depth_first_rec(sub, func),
+                                self._vars_of(prime), self._vars_of(sub)))
         else:
-            rvalue = func(node, None, None, None)
-        if self._wmc_cache is not None:
-            self._wmc_cache[node] = rvalue
+            expected_prime_vars = _NO_VARS
+            expected_sub_vars = _NO_VARS
+            for prime, sub in node.elements():
+                rvalues.append((self.depth_first_rec(prime, func), self.depth_first_rec(sub, func), None, None))
+        rvalue = func(node, rvalues, expected_prime_vars, expected_sub_vars)
+        wmc_cache[node] = rvalue
         return rvalue
 
     @staticmethod
@@ -175,28 +241,26 @@ class SddIterator:
         if rvalues is None:
             # Leaf
             if node.is_true():
-                prime_smooth_factor = 2**len(expected_prime_vars) if expected_prime_vars is not None else 1
-                sub_smooth_factor = 2**len(expected_sub_vars) if expected_sub_vars is not None else 1
+                prime_smooth_factor = _nb_models(expected_prime_vars) if expected_prime_vars is not None else 1
+                sub_smooth_factor = _nb_models(expected_sub_vars) if expected_sub_vars is not None else 1
                 return prime_smooth_factor * sub_smooth_factor
 
             elif node.is_false():
                 return 0
 
             elif node.is_literal():
+                var = abs(node.literal)
                 if expected_prime_vars is not None:
-                    nb_missing_vars = len(expected_prime_vars)
-                    if abs(node.literal) in expected_prime_vars:
-                        nb_missing_vars -= 1
-
-                    prime_smooth_factor = 2**nb_missing_vars
+                    prime_smooth_factor = _nb_models(expected_prime_vars)
+                    if var in expected_prime_vars:
+                        prime_smooth_factor //= 2
                 else:
                     prime_smooth_factor = 1
 
                 if expected_sub_vars is not None:
-                    nb_missing_vars = len(expected_sub_vars)
-                    if abs(node.literal) in expected_sub_vars:
-                        nb_missing_vars -= 1
-                    sub_smooth_factor = 2**nb_missing_vars
+                    sub_smooth_factor = _nb_models(expected_sub_vars)
+                    if var in expected_sub_vars:
+                        sub_smooth_factor //= 2
                 else:
                     sub_smooth_factor = 1
 
@@ -208,16 +272,94 @@ class SddIterator:
             if node is not None and not node.is_decision():
                 raise Exception("Expected a decision node for node {}".format(node))
             rvalue = 0
+            # The gap factor is the ratio of the precomputed number of assignments of the vtree nodes
+            prime_nb_models = _nb_models(expected_prime_vars)
+            sub_nb_models = _nb_models(expected_sub_vars)
             for mc_prime, mc_sub, prime_vars, sub_vars in rvalues:
                 if prime_vars is not None:
-                    nb_missing_vars = len(expected_prime_vars) - len(prime_vars)
-                    prime_smooth_factor = 2**nb_missing_vars
-                else:
-                    prime_smooth_factor = 1
+                    mc_prime *= prime_nb_models // _nb_models(prime_vars)
                 if sub_vars is not None:
-                    nb_missing_vars = len(expected_sub_vars) - len(sub_vars)
-                    sub_smooth_factor = 2**nb_missing_vars
+                    mc_sub *= sub_nb_models // _nb_models(sub_vars)
+                rvalue += mc_prime * mc_sub
+            return rvalue
+
+    @staticmethod
+    def func_weightedmodelcounting(weights):
+        # type: (Union[List[float], np.ndarray]) -> Callable
+        """Create a method to pass on to ``depth_first`` to perform weighted model counting.
+
+        The smoothing factor for a set of missing variables, the product of (w+ + w-) of these variables,
+        is computed once for every combination of expected and present vtree nodes.
+
+        :param weights: Literal weights [-n, ..., -1, 1, ..., n], the same layout as
+            ``WmcManager.set_literal_weights_from_array`` (not in log-space)
+        :return: Function
+        """
+        weights = np.asarray(weights, dtype=float)
+        nb_vars = len(weights) // 2
+        var_weights = np.concatenate([[1.0], weights[nb_vars:] + weights[nb_vars - 1::-1]])
+        cache = dict()  # type: Dict[Tuple[int, int, int, int], float]
+
+        def smooth_factor(expected_vars, used_lo=None, used_hi=None):
+            """Product of the variable weights in expected_vars, except for the leaves between used_lo and used_hi."""
+            if not isinstance(expected_vars, VtreeVars):
+                return float(np.prod(var_weights[list(expected_vars)]))
+            key = (expected_vars.lo, expected_vars.hi, used_lo, used_hi)
+            factor = cache.get(key)
+            if factor is None:
+                leaves = expected_vars._leaves.var
+                if used_lo is None:
+                    missing = leaves[expected_vars.lo:expected_vars.hi + 1:2]
                 else:
-                    sub_smooth_factor = 1
-                rvalue += mc_prime * prime_smooth_factor * mc_sub * sub_smooth_factor
+                    missing = np.concatenate([leaves[expected_vars.lo:used_lo:2],
+                                              leaves[used_hi + 2:expected_vars.hi + 1:2]])
+                factor = float(np.prod(var_weights[missing]))
+                cache[key] = factor
+            return factor
+
+        def missing_factor(expected_vars, used_vars):
+            if used_vars is None:
+                return 1.0
+            if isinstance(expected_vars, VtreeVars) and isinstance(used_vars, VtreeVars):
+                return smooth_factor(expected_vars, used_vars.lo, used_vars.hi)
+            if len(used_vars) == 0:
+                return smooth_factor(expected_vars)
+            return float(np.prod(var_weights[list(set(expected_vars) - set(used_vars))]))
+
+        def func_weightedmodelcounting(node, rvalues, expected_prime_vars, expected_sub_vars):
+            # type: (SddNode, List[Tuple[float, float, Set[int], Set[int]]], Set[int], Set[int]) -> float
+            if rvalues is None:
+                # Leaf
+                if node.is_true():
+                    prime_smooth_factor = smooth_factor(expected_prime_vars) if expected_prime_vars is not None else 1
+                    sub_smooth_factor = smooth_factor(expected_sub_vars) if expected_sub_vars is not None else 1
+                    return prime_smooth_factor * sub_smooth_factor
+                elif node.is_false():
+                    return 0.0
+                elif node.is_literal():
+                    lit = node.literal
+                    rvalue = weights[nb_vars + lit - 1] if lit > 0 else weights[nb_vars + lit]
+                    for expected_vars in (expected_prime_vars, expected_sub_vars):
+                        if expected_vars is None:
+                            continue
+                        if abs(lit) in expected_vars:
+                            if isinstance(expected_vars, VtreeVars):
+                                leaf = expected_vars._leaves.position[abs(lit)]
+                                rvalue *= smooth_factor(expected_vars, leaf, leaf)
+                            else:
+                                rvalue *= missing_factor(expected_vars, {abs(lit)})
+                        else:
+                            rvalue *= smooth_factor(expected_vars)
+                    return rvalue
+                else:
+                    raise Exception("Unknown leaf type for node {}".format(node))
+            # Decision node
+            if node is not None and not node.is_decision():
+                raise Exception("Expected a decision node for node {}".format(node))
+            rvalue = 0.0
+            for wmc_prime, wmc_sub, prime_vars, sub_vars in rvalues:
+                rvalue += wmc_prime * missing_factor(expected_prime_vars, prime_vars) * \
+                          wmc_sub * missing_factor(expected_sub_vars, sub_vars)
             return rvalue
+
+        return func_weightedmodelcounting
@@ -0,0 +1,142 @@
+# -*- coding: UTF-8 -*-
+"""
+pysdd.learning
+~~~~~~~~~~~~~~
+
+Learn literal weights from data by maximizing the log-likelihood with gradient ascent.
+
+The probability of an example e (a partial assignment) is P(e) = WMC(e) / WMC. With the natural
+logarithms of the literal weights as parameters, the gradient of log P(e) with respect to the
+parameter of literal l is P(l | e) - P(l). These marginals are computed for all literals and all
+examples in a minibatch with one batched upward and downward pass over the SDD
+(see ``Circuit.evidence``).
+
+:author: Wannes Meert, Arthur Choi
+:copyright: Copyright 2017-2019 KU Leuven and Regents of the University of California.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import collections
+import logging
+
+import numpy as np
+
+
+MYPY = False
+if MYPY:
+    from .sdd import WmcManager
+    from .circuit import Circuit
+    from typing import Optional, Callable, Tuple
+
+
+logger = logging.getLogger("pysdd")
+
+
+LearningResult = collections.namedtuple("LearningResult", ["weights", "log_likelihood", "epochs", "converged"])
+LearningResult.__doc__ = """Result of ``fit_literal_weights``.
+
+:param weights: Learned literal weights [-n, ..., -1, 1, ..., n], normalized such that the weights of the
+    positive and negative literal of a variable sum to one (not in log-space)
+:param log_likelihood: Average log-likelihood of the data for the learned weights
+:param epochs: Number of passes over the data
+:param converged: The change in average log-likelihood was smaller than the tolerance
+"""
+
+
+def _check_data(data, var_count):
+    data = np.asarray(data)
+    if data.ndim != 2 or data.shape[1] != var_count:
+        raise ValueError(f"Expected data with {var_count} columns (one per variable), "
+                         f"got an array with shape {data.shape}")
+    return data
+
+
+def log_likelihood_gradient(circuit, data, log_weights):
+    # type: (Circuit, np.ndarray, np.ndarray) -> Tuple[float, np.ndarray]
+    """Average log-likelihood of the examples and its gradient with respect to the log-weights.
+
+    :param circuit: Circuit of the SDD with the vtree arrays
+    :param data: Array of shape (nb_examples, var_count) with values -1 (variable is false),
+        0 (not observed) and 1 (variable is true)
+    :param log_weights: Natural logarithms of the literal weights [-n, ..., -1, 1, ..., n]
+    :return: Tuple with the average log-likelihood and an array with the gradient for every literal
+    """
+    n = circuit.var_count
+    data = _check_data(data, n)
+    # The last query, without evidence, gives the marginals P(l)
+    queries = np.concatenate([data, np.zeros((1, n), dtype=data.dtype)])
+    pe, marginals = circuit.evidence(queries, log_weights, log_mode=True)
+    if np.any(pe[:len(data)] == 0):
+        raise ValueError(f"Example {np.flatnonzero(pe[:len(data)] == 0)[0]} is inconsistent with the SDD")
+    posterior = marginals[:len(data)].mean(axis=0) - marginals[len(data)]
+    gradient = np.concatenate([-posterior[::-1], posterior])
+    return float(np.mean(np.log(pe[:len(data)]))), gradient
+
+
+def fit_literal_weights(wmc, data, batch_size=None, learning_rate=0.1, max_epochs=100, tolerance=1e-6,
+                        l2=0.0, seed=None, callback=None):
+    # type: (WmcManager, np.ndarray, Optional[int], float, int, float, float, Optional[int], Optional[Callable]) -> LearningResult
+    """Fit the literal weights of a WMC manager to data by maximizing the log-likelihood.
+
+    The optimization starts from the current literal weights of the manager and uses the Adam update
+    rule on the logarithms of the weights. After fitting, the learned weights are set in the manager.
+
+    :param wmc: WmcManager
+    :param data: Array of shape (nb_examples, var_count) with values -1 (variable is false),
+        0 (not observed) and 1 (variable is true)
+    :param batch_size: Number of examples per gradient step, by default all examples
+    :param learning_rate: Step size
+    :param max_epochs: Maximal number of passes over the data
+    :param tolerance: Stop when the average log-likelihood changes less than this value after an epoch
+    :param l2: Weight of the L2 regularization on the logarithms of the weights
+    :param seed: Seed to shuffle the examples in minibatches
+    :param callback: Function called after every epoch as ``callback(epoch, log_likelihood, weights)``,
+        the optimization stops if it returns True
+    :return: LearningResult
+    """
+    circuit = wmc.circuit()
+    data = _check_data(data, circuit.var_count)
+    if len(data) == 0:
+        raise ValueError("Expected at least one example")
+    if batch_size is None or batch_size > len(data):
+        batch_size = len(data)
+    rng = np.random.RandomState(seed)
+    params = wmc.literal_weights_array()
+    if not wmc.log_mode:
+        with np.errstate(divide="ignore"):
+            params = np.log(params)
+    if not np.all(np.isfinite(params)):
+        raise ValueError("Expected non-zero literal weights to start from")
+    moment1 = np.zeros_like(params)
+    moment2 = np.zeros_like(params)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    step = 0
+    log_likelihood = -np.inf
+    converged = False
+    epoch = 0
+    while epoch < max_epochs and not converged:
+        epoch += 1
+        order = rng.permutation(len(data)) if batch_size < len(data) else np.arange(len(data))
+        epoch_log_likelihood = 0.0
+        for start in range(0, len(data), batch_size):
+            batch = data[order[start:start + batch_size]]
+            batch_log_likelihood, gradient = log_likelihood_gradient(circuit, batch, params)
+            epoch_log_likelihood += batch_log_likelihood * len(batch)
+            gradient -= l2 * params
+            step += 1
+            moment1 = beta1 * moment1 + (1 - beta1) * gradient
+            moment2 = beta2 * moment2 + (1 - beta2) * gradient**2
+            params += learning_rate * (moment1 / (1 - beta1**step)) / (np.sqrt(moment2 / (1 - beta2**step)) + eps)
+        epoch_log_likelihood /= len(data)
+        logger.debug(f"Epoch {epoch}: log-likelihood = {epoch_log_likelihood}")
+        converged = abs(epoch_log_likelihood - log_likelihood) < tolerance
+        log_likelihood = epoch_log_likelihood
+        if callback is not None and callback(epoch, log_likelihood, params):
+            break
+    # Normalize per variable, this does not change the probabilities
+    n = circuit.var_count
+    norm = np.logaddexp(params[n:], params[n - 1::-1])
+    params = params - np.concatenate([norm[::-1], norm])
+    log_likelihood, _ = log_likelihood_gradient(circuit, data, params)
+    weights = np.exp(params)
+    wmc.set_literal_weights_from_array(params if wmc.log_mode else weights)
+    return LearningResult(weights, log_likelihood, epoch, converged)
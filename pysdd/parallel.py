@@ -0,0 +1,216 @@
+# -*- coding: UTF-8 -*-
+"""
+pysdd.parallel
+~~~~~~~~~~~~~~
+
+Use multiple threads to compile or evaluate independent SDDs, or multiple processes to compile one CNF or DNF.
+
+The long-running calls to the SDD library (compilation, apply, minimization, model counting and
+weighted model counting) release the GIL. Independent managers can thus be used in parallel threads.
+
+Limitations of the SDD library:
+
+- A manager (and all its nodes and WMC managers) should only be used by one thread at a time.
+- Vtree searches (minimization) use process-wide state and are executed one at a time. Compilations
+  that perform a vtree search (auto garbage collection and minimization, or a vtree search mode) are
+  thus not run in parallel.
+- Time limits for the vtree search are expressed in processor time, which is summed over all threads.
+
+The compilation of a single CNF or DNF is split over processes with ``compile_partitioned``: the clauses are
+partitioned, every partition is compiled in its own process with the same vtree, and the results are
+combined in a balanced binary tree of conjunctions (disjunctions for a DNF) in the parent process.
+
+:author: Wannes Meert, Arthur Choi
+:copyright: Copyright 2017-2019 KU Leuven and Regents of the University of California.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .sdd import SddManager, Vtree, Fnf, CompilerOptions
+from .util import _require_numpy
+
+
+MYPY = False
+if MYPY:
+    from .sdd import Fnf, SddNode, WmcManager
+    from .sdd import FnfArrays, VtreeArrays, SddArrays
+    from typing import List, Optional, Iterable, Tuple, Union, Callable
+
+
+def _compile_one(fnf, vtree_type, vtree_search_mode):
+    # type: (Fnf, str, int) -> Tuple[SddManager, SddNode]
+    sdd = SddManager.from_vtree(Vtree(var_count=fnf.var_count, vtree_type=vtree_type))
+    sdd.set_options(CompilerOptions(vtree_search_mode=vtree_search_mode))
+    sdd.root = sdd.fnf_to_sdd(fnf)
+    return sdd, sdd.root
+
+
+def compile_many(fnfs, threads=None, vtree_type="balanced", vtree_search_mode=0):
+    # type: (Iterable[Fnf], Optional[int], str, int) -> List[Tuple[SddManager, SddNode]]
+    """Compile every CNF or DNF to an SDD in its own manager.
+
+    :param fnfs: Fnf objects (e.g. ``Fnf.from_cnf_file``)
+    :param threads: Number of threads, by default the number of processors
+    :param vtree_type: Type of the initial vtree for every manager
+    :param vtree_search_mode: Vtree search mode of the compiler (see ``CompilerOptions``). By default there
+        is no vtree search. With a vtree search (-1 for automatic, or a period), the compilations are
+        executed one at a time.
+    :return: List with a tuple (SddManager, SddNode) for every Fnf
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda fnf: _compile_one(fnf, vtree_type, vtree_search_mode), fnfs))
+
+
+def propagate_many(wmc_managers, threads=None):
+    # type: (Iterable[WmcManager], Optional[int]) -> List[float]
+    """Weighted model count for every WMC manager (see ``WmcManager.propagate``).
+
+    The WMC managers should belong to different SDD managers.
+
+    :param wmc_managers: WmcManager objects
+    :param threads: Number of threads, by default the number of processors
+    :return: List with the weighted model count for every WMC manager
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda wmc: wmc.propagate(), wmc_managers))
+
+
+def _lca_postorder(arrays, vtree_arrays):
+    # type: (FnfArrays, VtreeArrays) -> np.ndarray
+    """Post-order rank of the vtree node that is the lca of the variables of every clause."""
+    left, right = vtree_arrays.left, vtree_arrays.right
+    nb_nodes = len(left)
+    depth = np.zeros(nb_nodes, dtype=np.int64)
+    rank = np.zeros(nb_nodes, dtype=np.int64)
+    leaf = np.zeros(vtree_arrays.var.max() + 1, dtype=np.int64)
+    stack = [(vtree_arrays.root, False)]
+    count = 0
+    while stack:
+        v, expanded = stack.pop()
+        if expanded or left[v] < 0:
+            rank[v] = count
+            count += 1
+            if left[v] < 0:
+                leaf[vtree_arrays.var[v]] = v
+        else:
+            depth[left[v]] = depth[right[v]] = depth[v] + 1
+            stack += [(v, True), (right[v], False), (left[v], False)]
+    # In the in-order layout, the lca of the leaves at indices a <= b is the node with the smallest
+    # depth in [a, b]. The key depth * nb_nodes + index finds it with one minimum per clause.
+    index = np.append(leaf[np.abs(arrays.literals)], 0)
+    starts = arrays.offsets[:-1]
+    first = np.minimum.reduceat(index, starts)
+    last = np.maximum.reduceat(index, starts)
+    # Empty clauses (which make the Fnf trivial) get the first leaf
+    empty = starts == arrays.offsets[1:]
+    first[empty] = last[empty] = 0
+    key = np.append(depth * nb_nodes + np.arange(nb_nodes), 0)
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2], bounds[1::2] = first, last + 1
+    lca = np.minimum.reduceat(key, bounds)[0::2] % nb_nodes
+    return rank[lca]
+
+
+def _partition_vtree(arrays, vtree_arrays, partitions):
+    # type: (FnfArrays, VtreeArrays, int) -> List[np.ndarray]
+    order = np.argsort(_lca_postorder(arrays, vtree_arrays), kind="stable")
+    return np.array_split(order, partitions)
+
+
+def _partition_natural(arrays, vtree_arrays, partitions):
+    # type: (FnfArrays, VtreeArrays, int) -> List[np.ndarray]
+    return np.array_split(np.arange(len(arrays.offsets) - 1), partitions)
+
+
+_partitions = {
+    "vtree": _partition_vtree,
+    "natural": _partition_natural,
+}
+
+
+def _compile_partition(literals, offsets, var_count, op, vtree_arrays):
+    # type: (np.ndarray, np.ndarray, int, str, VtreeArrays) -> SddArrays
+    """Compile a part of the clauses in a worker process, without vtree search such that the vtree
+    remains the same as in the parent process."""
+    sdd = SddManager.from_vtree(Vtree.from_arrays(vtree_arrays))
+    sdd.set_options(CompilerOptions(vtree_search_mode=0))
+    node = sdd.fnf_to_sdd(Fnf.from_clauses(literals, var_count, op, offsets))
+    return sdd.to_arrays([node])
+
+
+def compile_partitioned(fnf, processes=None, partitions=None, vtree=None, vtree_type="balanced",
+                        partition="vtree"):
+    # type: (Fnf, Optional[int], Optional[int], Optional[Vtree], str, Union[str, Callable]) -> Tuple[SddManager, SddNode]
+    """Compile a CNF or DNF to an SDD with multiple processes.
+
+    The clauses (or terms) are partitioned and every partition is compiled in a worker process, with the
+    same vtree and without vtree search. The SDDs of the partitions are sent back as flat arrays (see
+    ``SddManager.to_arrays``), loaded in a new manager and combined in a balanced binary tree.
+
+    Partitions that are compiled independently can be larger than the SDD of all clauses. This works
+    best when the clauses of a partition mostly share variables, as with partition "vtree".
+
+    :param fnf: Fnf object (e.g. ``Fnf.from_cnf_file``)
+    :param processes: Number of processes, by default the number of processors
+    :param partitions: Number of partitions, by default the number of processes
+    :param vtree: Vtree to compile with, by default a new vtree of type vtree_type. It is not changed.
+    :param vtree_type: Type of the vtree if no vtree is given
+    :param partition: How to partition the clauses: "vtree" sorts the clauses by the post-order position
+        of the vtree node that is the lca of their variables (see ``CompilerOptions(combination="bucket")``)
+        and splits them in consecutive parts of equal size, "natural" splits them in the order of the Fnf.
+        A function is called as ``partition(arrays, vtree_arrays, partitions)`` with the FnfArrays and
+        VtreeArrays and returns a list with an array of clause indices for every partition.
+    :return: Tuple (SddManager, SddNode), the node is referenced
+    """
+    _require_numpy()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if partitions is None:
+        partitions = processes
+    if partitions < 1:
+        raise ValueError(f"Expected at least one partition, got {partitions}")
+    if vtree is None:
+        vtree = Vtree(var_count=fnf.var_count, vtree_type=vtree_type)
+    vtree_arrays = vtree.to_arrays()
+    arrays = fnf.to_arrays()
+    if not callable(partition):
+        if partition not in _partitions:
+            raise ValueError(f"Unknown partition {partition!r}, expected one of {list(_partitions.keys())} "
+                             f"or a function")
+        partition = _partitions[partition]
+    parts = [np.asarray(part, dtype=np.int64) for part in partition(arrays, vtree_arrays, partitions)]
+    clauses = np.sort(np.concatenate(parts + [np.empty(0, dtype=np.int64)]))
+    if clauses.shape != (len(arrays.offsets) - 1,) or np.any(clauses != np.arange(len(clauses))):
+        raise ValueError("The partition should assign every clause to exactly one partition")
+    jobs = []
+    for part in parts:
+        lengths = arrays.offsets[part + 1] - arrays.offsets[part]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        # Indices of the literals of the clauses in the partition
+        literals = arrays.literals[np.repeat(arrays.offsets[part] - offsets[:-1], lengths) + np.arange(offsets[-1])]
+        jobs.append((literals, offsets, arrays.var_count, arrays.op, vtree_arrays))
+    sdd = SddManager.from_vtree(Vtree.from_arrays(vtree_arrays))
+    sdd.set_options(CompilerOptions(vtree_search_mode=0))
+    combine = sdd.conjoin if arrays.op == "cnf" else sdd.disjoin
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        nodes = [sdd.load_arrays(result, validate=False)[0] for result in executor.map(_compile_partition, *zip(*jobs))]
+    for node in nodes:
+        node.ref()
+    while len(nodes) > 1:
+        pairs, nodes = nodes, []
+        for node1, node2 in zip(pairs[0::2], pairs[1::2]):
+            node = combine(node1, node2)
+            node.ref()
+            node1.deref()
+            node2.deref()
+            nodes.append(node)
+        if len(pairs) % 2 == 1:
+            nodes.append(pairs[-1])
+    sdd.root = nodes[0]
+    return sdd, nodes[0]
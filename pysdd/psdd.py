@@ -0,0 +1,493 @@
+# -*- coding: UTF-8 -*-
+"""
+pysdd.psdd
+~~~~~~~~~~
+
+Probabilistic Sentential Decision Diagrams (PSDD) in a flat array representation.
+
+A PSDD file is parsed once, after which a matrix of observations is evaluated in vectorized
+passes over the PSDD: one layer of decision nodes at a time, for a block of observations at
+a time. This module only depends on NumPy, not on the SDD library.
+
+:author: Wannes Meert, Arthur Choi
+:copyright: Copyright 2017-2019 KU Leuven and Regents of the University of California.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import collections
+
+import numpy as np
+
+
+MYPY = False
+if MYPY:
+    from typing import List, Tuple, Union, Optional
+    from pathlib import Path
+
+
+# Same values as pysdd.sdd.NodeKind
+FALSE_NODE = 0
+TRUE_NODE = 1
+LITERAL_NODE = 2
+DECISION_NODE = 3
+
+# Maximal number of values kept in memory per block of observations
+BLOCK_BUDGET = 1 << 22
+
+
+_Layer = collections.namedtuple("_Layer", [
+    "nodes", "elements", "starts", "parents", "child_order", "child_nodes", "child_starts"])
+_Layer.__doc__ = """Decision nodes of one layer, their elements (grouped per node, starting at starts) and
+the parent of every element. The primes followed by the subs of the elements, ordered with child_order, are
+grouped per child node, starting at child_starts."""
+
+
+def _log1mexp(x):
+    """log(1 - exp(x)) for x <= 0."""
+    with np.errstate(divide="ignore"):
+        return np.where(x > -0.6931471805599453, np.log(-np.expm1(x)), np.log1p(-np.exp(x)))
+
+
+def _popcount(words):
+    """Number of set bits in every row of an array of uint64 words."""
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return np.unpackbits(words.view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+
+class Psdd:
+    """PSDD with its nodes in topological order (children before parents), the root is the last node.
+
+    Nodes are true nodes (with a distribution over one variable), literal nodes and decision nodes
+    (with a distribution over the elements).
+
+    :param kind: Node kinds (TRUE_NODE, LITERAL_NODE or DECISION_NODE)
+    :param vtree: Vtree id of every node
+    :param literal: Literal of a literal node, variable of a true node, 0 for decision nodes
+    :param theta: Natural logarithm of the probability that the variable of a true node is true
+    :param elem_offsets: Elements of decision node i are elem_offsets[i] to elem_offsets[i+1]
+    :param primes: Prime node of every element
+    :param subs: Sub node of every element
+    :param elem_theta: Natural logarithm of the probability of every element
+    :param var_count: Number of variables, by default the largest variable in the PSDD
+    """
+    def __init__(self, kind, vtree, literal, theta, elem_offsets, primes, subs, elem_theta, var_count=None):
+        self.kind = np.asarray(kind, dtype=np.int8)
+        self.vtree = np.asarray(vtree, dtype=np.int64)
+        self.literal = np.asarray(literal, dtype=np.int64)
+        self.theta = np.asarray(theta, dtype=np.float64)
+        self.elem_offsets = np.asarray(elem_offsets, dtype=np.int64)
+        self.primes = np.asarray(primes, dtype=np.int64)
+        self.subs = np.asarray(subs, dtype=np.int64)
+        self.elem_theta = np.asarray(elem_theta, dtype=np.float64)
+        if var_count is None:
+            var_count = int(np.abs(self.literal).max(initial=0))
+        self.var_count = var_count
+        self.nb_nodes = len(self.kind)
+        self.root = self.nb_nodes - 1
+        self._layers = None
+
+    @staticmethod
+    def from_file(filename):
+        # type: (Union[str, bytes, Path]) -> Psdd
+        """Read a PSDD file.
+
+        File syntax::
+
+            c ids of psdd nodes start at 0
+            c psdd nodes appear bottom-up, children before parents
+            c psdd count-of-sdd-nodes
+            c L id-of-literal-sdd-node [id-of-vtree] literal
+            c T id-of-trueNode-sdd-node id-of-vtree variable log(litProb)
+            c D id-of-decomposition-sdd-node id-of-vtree number-of-elements {id-of-prime id-of-sub log(elementProb)}*
+        """
+        if isinstance(filename, bytes):
+            filename = filename.decode()
+        kind, vtree, literal, theta, elem_offsets = [], [], [], [], [0]
+        primes, subs, elem_theta = [], [], []
+        index = None
+        with open(filename, "r") as psdd_file:
+            for line_nb, line in enumerate(psdd_file, 1):
+                cols = line.split()
+                if len(cols) == 0 or cols[0] == "c":
+                    continue
+                if cols[0] == "psdd":
+                    index = np.full(int(cols[1]), -1, dtype=np.int64)
+                    continue
+                if index is None:
+                    raise ValueError(f"A PSDD file should start with 'psdd' (line {line_nb})")
+                index[int(cols[1])] = len(kind)
+                if cols[0] == "L":
+                    kind.append(LITERAL_NODE)
+                    vtree.append(int(cols[2]) if len(cols) > 3 else -1)
+                    literal.append(int(cols[len(cols) - 1]))
+                    theta.append(0.0)
+                elif cols[0] == "T":
+                    kind.append(TRUE_NODE)
+                    vtree.append(int(cols[2]))
+                    literal.append(int(cols[3]))
+                    theta.append(float(cols[4]))
+                elif cols[0] == "D":
+                    kind.append(DECISION_NODE)
+                    vtree.append(int(cols[2]))
+                    literal.append(0)
+                    theta.append(0.0)
+                    nb_elements = int(cols[3])
+                    if len(cols) != 4 + 3 * nb_elements:
+                        raise ValueError(f"Expected {nb_elements} elements on line {line_nb}")
+                    primes.extend(cols[4::3])
+                    subs.extend(cols[5::3])
+                    elem_theta.extend(cols[6::3])
+                else:
+                    raise ValueError(f"Unknown node type '{cols[0]}' on line {line_nb}")
+                elem_offsets.append(len(primes))
+        if index is None:
+            raise ValueError("A PSDD file should start with 'psdd'")
+        return Psdd(kind, vtree, literal, theta, elem_offsets,
+                    index[np.array(primes, dtype=np.int64)], index[np.array(subs, dtype=np.int64)],
+                    np.array(elem_theta, dtype=np.float64))
+
+    @staticmethod
+    def from_sdd(node, data=None, alpha=1.0):
+        """Create a PSDD with the structure of an SDD and parameters learned from data.
+
+        The SDD is made smooth with respect to the manager's vtree: every decision node gets primes that are
+        normalized for the left child of its vtree node and subs for the right child. Missing vtree nodes are
+        filled in with nodes that represent true. Elements with a false sub are removed.
+
+        :param node: SddNode, the base of the PSDD (this should not be false)
+        :param data: Data to learn the parameters from (see ``fit``), by default no data
+        :param alpha: Pseudocount for Laplace smoothing
+        :return: Psdd
+        """
+        arrays = node.to_arrays()
+        vtree_arrays = node.manager.vtree().to_arrays()
+        left, right, parent, variables = vtree_arrays.left, vtree_arrays.right, vtree_arrays.parent, vtree_arrays.var
+        kind, vtree, literal, elem_offsets = [], [], [], [0]
+        primes, subs = [], []
+
+        def add_node(node_kind, node_vtree, node_literal=0, elements=()):
+            kind.append(node_kind)
+            vtree.append(node_vtree)
+            literal.append(node_literal)
+            for prime, sub in elements:
+                primes.append(prime)
+                subs.append(sub)
+            elem_offsets.append(len(primes))
+            return len(kind) - 1
+
+        true_nodes = dict()
+
+        def true_node(v):
+            """Node that represents true for the variables in vtree node v."""
+            # Missing nodes are added in post-order, with an explicit stack for deep vtrees
+            stack = [v]
+            while stack:
+                w = stack[-1]
+                if w in true_nodes:
+                    stack.pop()
+                elif left[w] < 0:
+                    true_nodes[w] = add_node(TRUE_NODE, w, variables[w])
+                    stack.pop()
+                elif left[w] in true_nodes and right[w] in true_nodes:
+                    true_nodes[w] = add_node(DECISION_NODE, w, elements=[(true_nodes[left[w]], true_nodes[right[w]])])
+                    stack.pop()
+                else:
+                    stack += [right[w], left[w]]
+            return true_nodes[v]
+
+        lifted = dict()
+
+        def lift(i, target):
+            """Node for SDD node i that is normalized for vtree node target."""
+            if arrays.kind[i] == TRUE_NODE:
+                return true_node(target)
+            key = (i, target)
+            if key not in lifted:
+                result, v = index[i], arrays.vtree[i]
+                while v != target:
+                    p = parent[v]
+                    if p < 0:
+                        raise ValueError("Node is not normalized for a vtree below its parent")
+                    elements = [(result, true_node(right[p]))] if left[p] == v else [(true_node(left[p]), result)]
+                    result = add_node(DECISION_NODE, p, elements=elements)
+                    v = p
+                lifted[key] = result
+            return lifted[key]
+
+        index = np.full(len(arrays.kind), -1, dtype=np.int64)
+        for i in range(len(arrays.kind)):
+            if arrays.kind[i] == LITERAL_NODE:
+                index[i] = add_node(LITERAL_NODE, arrays.vtree[i], arrays.literal[i])
+            elif arrays.kind[i] == DECISION_NODE:
+                v = arrays.vtree[i]
+                elements = [(lift(arrays.primes[e], left[v]), lift(arrays.subs[e], right[v]))
+                            for e in range(arrays.elem_offsets[i], arrays.elem_offsets[i + 1])
+                            if arrays.kind[arrays.subs[e]] != FALSE_NODE]
+                index[i] = add_node(DECISION_NODE, v, elements=elements)
+        root = arrays.roots[0]
+        if arrays.kind[root] == FALSE_NODE:
+            raise ValueError("The base of a PSDD cannot be false")
+        lift(root, vtree_arrays.root)
+        psdd = Psdd(kind, vtree, literal, np.zeros(len(kind)), elem_offsets, primes, subs, np.zeros(len(primes)),
+                    var_count=arrays.var_count)
+        psdd.fit(np.zeros((0, arrays.var_count), dtype=np.int8) if data is None else data, alpha)
+        return psdd
+
+    def _pack(self, data):
+        """Complete observations as bitsets with one bit per observation, 64 observations per word.
+
+        :return: Tuple with the words for the positive and negative literal of every variable,
+            shape (var_count, nb_words), and the words with a bit for every observation
+        """
+        nb_words = (len(data) + 63) // 64
+        positive = np.zeros((self.var_count, nb_words * 8), dtype=np.uint8)
+        positive[:, :(len(data) + 7) // 8] = np.packbits(data.T.astype(bool), axis=1, bitorder="little")
+        valid = np.zeros(nb_words * 8, dtype=np.uint8)
+        valid[:(len(data) + 7) // 8] = np.packbits(np.ones(len(data), dtype=bool), bitorder="little")
+        positive, valid = positive.view(np.uint64), valid.view(np.uint64)
+        return positive, ~positive & valid, valid
+
+    def _satisfied(self, positive, negative, valid):
+        """Nodes that are satisfied by packed complete observations (see ``_pack``), shape (nb_nodes, nb_words)."""
+        satisfied = np.zeros((self.nb_nodes, len(valid)), dtype=np.uint64)
+        satisfied[self.kind == TRUE_NODE] = valid
+        literals = np.flatnonzero(self.kind == LITERAL_NODE)
+        satisfied[literals] = np.where((self.literal[literals] > 0)[:, None],
+                                       positive[np.abs(self.literal[literals]) - 1],
+                                       negative[np.abs(self.literal[literals]) - 1])
+        for layer in self._decision_layers():
+            satisfied[layer.nodes] = np.bitwise_or.reduceat(satisfied[self.primes[layer.elements]] &
+                                                            satisfied[self.subs[layer.elements]], layer.starts, axis=0)
+        return satisfied
+
+    def fit(self, data, alpha=1.0):
+        """Set the maximum-likelihood parameters for complete data, with Laplace smoothing.
+
+        Every example follows exactly one element in every decision node that it reaches. The parameters are
+        thus computed in closed form from the number of examples that reach every node and element. These are
+        counted in vectorized passes over blocks of examples that are packed as bitsets, 64 examples per word.
+
+        :param data: Array of shape (nb_examples, var_count) with values 0 and 1 (as returned by
+            ``SddNode.sample``), column i is variable i+1. Every example should be a model of the PSDD.
+        :param alpha: Pseudocount for Laplace smoothing
+        """
+        data = np.asarray(data)
+        if data.ndim != 2 or data.shape[1] != self.var_count:
+            raise ValueError(f"Expected data with {self.var_count} columns (one per variable), "
+                             f"got an array with shape {data.shape}")
+        if not np.all((data == 0) | (data == 1)):
+            raise ValueError("Expected complete data with values 0 and 1")
+        node_counts = np.zeros(self.nb_nodes, dtype=np.int64)
+        positive_counts = np.zeros(self.nb_nodes, dtype=np.int64)
+        elem_counts = np.zeros(len(self.primes), dtype=np.int64)
+        true_nodes = np.flatnonzero(self.kind == TRUE_NODE)
+        for block in self._blocks(len(data), 2, 64):
+            positive, negative, valid = self._pack(data[block])
+            satisfied = self._satisfied(positive, negative, valid)
+            if not np.array_equal(satisfied[self.root], valid):
+                missing = np.unpackbits((valid & ~satisfied[self.root]).view(np.uint8), bitorder="little")
+                raise ValueError(f"Example {block.start + np.argmax(missing)} is not a model of the PSDD")
+            reached = np.zeros(satisfied.shape, dtype=np.uint64)
+            reached[self.root] = valid
+            for layer in reversed(self._decision_layers()):
+                followed = (reached[layer.parents] & satisfied[self.primes[layer.elements]] &
+                            satisfied[self.subs[layer.elements]])
+                elem_counts[layer.elements] += _popcount(followed)
+                self._to_children(np.bitwise_or, reached, layer, followed, followed)
+            node_counts[true_nodes] += _popcount(reached[true_nodes])
+            positive_counts[true_nodes] += _popcount(reached[true_nodes] & positive[self.literal[true_nodes] - 1])
+        nb_elements = np.diff(self.elem_offsets)
+        parents = np.repeat(np.arange(self.nb_nodes), nb_elements)
+        decision_counts = np.bincount(parents, weights=elem_counts, minlength=self.nb_nodes)
+        self.elem_theta = np.log(elem_counts + alpha) - np.log(decision_counts[parents] + alpha * nb_elements[parents])
+        theta = np.log(positive_counts + alpha) - np.log(node_counts + 2 * alpha)
+        self.theta = np.where(self.kind == TRUE_NODE, theta, 0.0)
+
+    def save(self, filename):
+        # type: (Union[str, bytes, Path]) -> None
+        """Write the PSDD to a file (see ``from_file`` for the syntax)."""
+        if isinstance(filename, bytes):
+            filename = filename.decode()
+        with open(filename, "w") as psdd_file:
+            print("c ids of psdd nodes start at 0", file=psdd_file)
+            print("c psdd nodes appear bottom-up, children before parents", file=psdd_file)
+            print("c", file=psdd_file)
+            print("c file syntax:", file=psdd_file)
+            print("c psdd count-of-sdd-nodes", file=psdd_file)
+            print("c L id-of-literal-sdd-node id-of-vtree literal", file=psdd_file)
+            print("c T id-of-trueNode-sdd-node id-of-vtree variable log(litProb)", file=psdd_file)
+            print("c D id-of-decomposition-sdd-node id-of-vtree number-of-elements "
+                  "{id-of-prime id-of-sub log(elementProb)}*", file=psdd_file)
+            print("c", file=psdd_file)
+            print(f"psdd {self.nb_nodes}", file=psdd_file)
+            for i in range(self.nb_nodes):
+                if self.kind[i] == LITERAL_NODE:
+                    print(f"L {i} {self.vtree[i]} {self.literal[i]}", file=psdd_file)
+                elif self.kind[i] == TRUE_NODE:
+                    print(f"T {i} {self.vtree[i]} {self.literal[i]} {float(self.theta[i])!r}", file=psdd_file)
+                elif self.kind[i] == DECISION_NODE:
+                    elements = range(self.elem_offsets[i], self.elem_offsets[i + 1])
+                    print(f"D {i} {self.vtree[i]} {len(elements)} " +
+                          " ".join(f"{self.primes[e]} {self.subs[e]} {float(self.elem_theta[e])!r}" for e in elements),
+                          file=psdd_file)
+
+    def _decision_layers(self):
+        """Decision nodes grouped in layers that only depend on lower layers, with their elements."""
+        if self._layers is not None:
+            return self._layers
+        height = np.zeros(self.nb_nodes, dtype=np.int64)
+        for i in np.flatnonzero(self.kind == DECISION_NODE):
+            elements = slice(self.elem_offsets[i], self.elem_offsets[i + 1])
+            height[i] = 1 + max(height[self.primes[elements]].max(), height[self.subs[elements]].max())
+        order = np.argsort(height, kind="stable")
+        bounds = np.searchsorted(height[order], np.arange(height.max(initial=0) + 2))
+        self._layers = []
+        for h in range(1, len(bounds) - 1):
+            nodes = order[bounds[h]:bounds[h + 1]]
+            counts = self.elem_offsets[nodes + 1] - self.elem_offsets[nodes]
+            starts = np.cumsum(counts) - counts
+            elements = np.repeat(self.elem_offsets[nodes] - starts, counts) + np.arange(counts.sum())
+            children = np.concatenate([self.primes[elements], self.subs[elements]])
+            child_order = np.argsort(children, kind="stable")
+            child_nodes, child_starts = np.unique(children[child_order], return_index=True)
+            self._layers.append(_Layer(nodes, elements, starts, np.repeat(nodes, counts),
+                                       child_order, child_nodes, child_starts))
+        return self._layers
+
+    @staticmethod
+    def _to_children(ufunc, out, layer, prime_values, sub_values):
+        """Combine the values of the elements in a layer with ufunc into the rows of out for their children."""
+        values = np.concatenate([prime_values, sub_values])[layer.child_order]
+        out[layer.child_nodes] = ufunc(out[layer.child_nodes], ufunc.reduceat(values, layer.child_starts, axis=0))
+
+    def _check_observations(self, observations):
+        if observations is None:
+            observations = np.zeros((1, self.var_count), dtype=np.int8)
+        observations = np.asarray(observations)
+        if observations.ndim == 1:
+            observations = observations.reshape(1, -1)
+        if observations.ndim != 2 or observations.shape[1] != self.var_count:
+            raise ValueError(f"Expected observations with {self.var_count} columns (one per variable), "
+                             f"got an array with shape {observations.shape}")
+        return observations
+
+    def _blocks(self, nb_observations, nb_passes=1, nb_packed=1):
+        block = nb_packed * max(1, BLOCK_BUDGET // (nb_passes * max(self.nb_nodes, 1)))
+        for start in range(0, nb_observations, block):
+            yield slice(start, min(start + block, nb_observations))
+
+    def _leaf_values(self, observations, maximize=False):
+        """Values of the true and literal nodes, shape (nb_nodes, nb_observations)."""
+        values = np.empty((self.nb_nodes, len(observations)), dtype=np.float64)
+        values[self.kind == FALSE_NODE] = -np.inf
+        nodes = np.flatnonzero(self.kind == LITERAL_NODE)
+        obs = observations[:, np.abs(self.literal[nodes]) - 1].T
+        values[nodes] = np.where(obs * np.sign(self.literal[nodes])[:, None] < 0, -np.inf, 0.0)
+        nodes = np.flatnonzero(self.kind == TRUE_NODE)
+        obs = observations[:, self.literal[nodes] - 1].T
+        pos = np.where(obs < 0, -np.inf, self.theta[nodes][:, None])
+        neg = np.where(obs > 0, -np.inf, _log1mexp(self.theta[nodes])[:, None])
+        values[nodes] = np.maximum(pos, neg) if maximize else np.logaddexp(pos, neg)
+        return values
+
+    def _upward(self, observations, maximize=False):
+        plus = np.maximum if maximize else np.logaddexp
+        values = self._leaf_values(observations, maximize)
+        for layer in self._decision_layers():
+            elements = layer.elements
+            products = values[self.primes[elements]] + values[self.subs[elements]] + self.elem_theta[elements, None]
+            values[layer.nodes] = plus.reduceat(products, layer.starts, axis=0)
+        return values
+
+    def log_likelihood(self, observations):
+        # type: (np.ndarray) -> np.ndarray
+        """Natural logarithm of the probability of every row of observations.
+
+        :param observations: Array of shape (nb_observations, var_count) with values -1 (variable is false),
+            0 (not observed) and 1 (variable is true), column i is variable i+1
+        :return: Array of shape (nb_observations,)
+        """
+        observations = self._check_observations(observations)
+        result = np.empty(len(observations), dtype=np.float64)
+        for block in self._blocks(len(observations)):
+            result[block] = self._upward(observations[block])[self.root]
+        return result
+
+    def marginals(self, observations=None):
+        # type: (Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]
+        """Probability of every row of observations and the posterior marginals of all variables.
+
+        The marginals are computed with an upward and downward pass in log-space.
+
+        :param observations: See ``log_likelihood``, by default one row without observations
+        :return: Tuple with the log-likelihood of every row, shape (nb_observations,), and the probability
+            that each variable is true given the observations, shape (nb_observations, var_count).
+            The marginals are nan if the observations have probability zero.
+        """
+        observations = self._check_observations(observations)
+        log_pe = np.empty(len(observations), dtype=np.float64)
+        marginals = np.empty(observations.shape, dtype=np.float64)
+        literal_nodes = np.flatnonzero((self.kind == LITERAL_NODE) & (self.literal > 0))
+        true_nodes = np.flatnonzero(self.kind == TRUE_NODE)
+        for block in self._blocks(len(observations), 2):
+            obs = observations[block]
+            values = self._upward(obs)
+            adjoints = np.full(values.shape, -np.inf)
+            adjoints[self.root] = 0.0
+            for layer in reversed(self._decision_layers()):
+                elements = layer.elements
+                node_adjoints = adjoints[layer.parents] + self.elem_theta[elements, None]
+                self._to_children(np.logaddexp, adjoints, layer, node_adjoints + values[self.subs[elements]],
+                                  node_adjoints + values[self.primes[elements]])
+            joint = np.full((self.var_count, len(obs)), -np.inf)
+            np.logaddexp.at(joint, self.literal[literal_nodes] - 1, adjoints[literal_nodes] + values[literal_nodes])
+            pos = np.where(obs[:, self.literal[true_nodes] - 1].T < 0, -np.inf, self.theta[true_nodes][:, None])
+            np.logaddexp.at(joint, self.literal[true_nodes] - 1, adjoints[true_nodes] + pos)
+            log_pe[block] = values[self.root]
+            with np.errstate(invalid="ignore"):
+                marginals[block] = np.exp(joint - values[self.root]).T
+        return log_pe, marginals
+
+    def mpe(self, observations=None):
+        # type: (Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]
+        """Most probable explanation (complete assignment) for every row of observations.
+
+        Computed with a max-product upward pass and a top-down selection of the maximizing elements.
+
+        :param observations: See ``log_likelihood``, by default one row without observations
+        :return: Tuple with an array of shape (nb_observations, var_count) with int8 values 0 and 1 and an array
+            with the natural logarithm of the probability of every assignment. If the observations have
+            probability zero, the log-probability is -inf and the assignment is all -1.
+        """
+        observations = self._check_observations(observations)
+        assignments = np.empty(observations.shape, dtype=np.int8)
+        log_probs = np.empty(len(observations), dtype=np.float64)
+        literal_nodes = np.flatnonzero(self.kind == LITERAL_NODE)
+        true_nodes = np.flatnonzero(self.kind == TRUE_NODE)
+        for block in self._blocks(len(observations), 2):
+            obs = observations[block]
+            values = self._upward(obs, maximize=True)
+            selected = np.zeros(values.shape, dtype=bool)
+            selected[self.root] = True
+            for layer in reversed(self._decision_layers()):
+                elements = layer.elements
+                products = values[self.primes[elements]] + values[self.subs[elements]] + self.elem_theta[elements, None]
+                # First element with the maximal value
+                candidates = np.where(products == values[layer.parents], elements[:, None], len(self.primes))
+                chosen = np.minimum.reduceat(candidates, layer.starts, axis=0)
+                chosen = elements[:, None] == np.repeat(chosen, np.diff(layer.starts, append=len(elements)), axis=0)
+                chosen &= selected[layer.parents]
+                self._to_children(np.logical_or, selected, layer, chosen, chosen)
+            block_assignments = np.full(obs.shape, -1, dtype=np.int8)
+            rows, cols = np.nonzero(selected[literal_nodes])
+            literals = self.literal[literal_nodes[rows]]
+            block_assignments[cols, np.abs(literals) - 1] = literals > 0
+            rows, cols = np.nonzero(selected[true_nodes])
+            variables = self.literal[true_nodes[rows]]
+            theta = self.theta[true_nodes[rows]]
+            value = obs[cols, variables - 1]
+            block_assignments[cols, variables - 1] = (value > 0) | ((value == 0) & (theta >= _log1mexp(theta)))
+            block_assignments[values[self.root] == -np.inf] = -1
+            assignments[block] = block_assignments
+            log_probs[block] = values[self.root]
+        return assignments, log_probs
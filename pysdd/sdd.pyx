@@ -16,7 +16,8 @@ cimport compiler_c
 cimport io_c
 cimport fnf_c
 from cpython cimport array
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, calloc, realloc, free
+from libc.stdint cimport int8_t, int64_t
 
 import os
 import tempfile
@@ -24,6 +25,8 @@ from contextlib import redirect_stdout, redirect_stderr
 import io
 import cython
 import collections
+import threading
+import time
 
 
 IF HAVE_CYSIGNALS:
@@ -34,34 +37,530 @@ ELSE:
     sig_on = noop
     sig_off = noop
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
+
+cdef _require_numpy():
+    if np is None:
+        raise ImportError("This functionality requires NumPy (pip install numpy)")
+
+
+## Thread safety
+# The C calls below release the GIL, which allows independent managers to be used from different threads.
+# The SDD library has a few process-wide variables that need to be guarded:
+# - The vtree search (minimization) keeps its best scores in global variables, thus only one vtree search
+#   can run at a time.
+# - The WMC manager stores the log mode of the running propagation in a global variable, thus propagations
+#   can only run concurrently if they use the same mode.
+
+_vtree_search_lock = threading.Lock()
+
+
+cdef class _ModeLock:
+    """Lock that can be held by multiple threads at the same time if they all use the same mode."""
+    cdef int mode
+    cdef int count
+    cdef object condition
+
+    def __cinit__(self):
+        self.mode = 0
+        self.count = 0
+        self.condition = threading.Condition()
+
+    cdef acquire(self, int mode):
+        if self.count == 0 or self.mode == mode:
+            # Fast path, runs without releasing the GIL
+            self.mode = mode
+            self.count += 1
+            return
+        with self.condition:
+            while self.count > 0 and self.mode != mode:
+                self.condition.wait()
+            self.mode = mode
+            self.count += 1
+
+    cdef release(self):
+        self.count -= 1
+        if self.count == 0:
+            with self.condition:
+                self.condition.notify_all()
+
+
+cdef _ModeLock _wmc_mode_lock = _ModeLock()
+
+
+## Array representation
+
+cpdef enum NodeKind:
+    # Node types in the array representation of an SDD (see SddNode.to_arrays)
+    FALSE_NODE = 0
+    TRUE_NODE = 1
+    LITERAL_NODE = 2
+    DECISION_NODE = 3
+
+
+# The module is given explicitly, such that the arrays can be pickled (it cannot be derived in Cython)
+SddArrays = collections.namedtuple("SddArrays", [
+    "kind", "literal", "vtree", "elem_offsets", "primes", "subs", "roots", "var_count"], module=__name__)
+SddArrays.__doc__ = """Flat, topologically ordered representation of one or more SDDs.
+
+Nodes are numbered such that children always precede their parents.
+
+:param kind: NodeKind of every node (int8)
+:param literal: Literal of literal nodes, 0 for other nodes (int64)
+:param vtree: Position of the vtree node the node is normalized for, -1 for true and false (int64)
+:param elem_offsets: The elements of node i are at indices elem_offsets[i] to elem_offsets[i+1] (int64)
+:param primes: Node index of the prime of every element (int64)
+:param subs: Node index of the sub of every element (int64)
+:param roots: Node index of every root (int64)
+:param var_count: Number of variables in the manager
+"""
+
+VtreeArrays = collections.namedtuple("VtreeArrays", ["left", "right", "parent", "var", "root", "offset"],
+                                     module=__name__)
+VtreeArrays.__doc__ = """Flat representation of a vtree, indexed by in-order position.
+
+Index i refers to the vtree node with position offset + i. For the root of a manager's vtree
+the offset is 0 and indices are equal to positions.
+
+:param left: Index of the left child, -1 for leaves (int64)
+:param right: Index of the right child, -1 for leaves (int64)
+:param parent: Index of the parent, -1 for the root (int64)
+:param var: Variable of a leaf, 0 for internal nodes (int64)
+:param root: Index of the root
+:param offset: Position of the vtree node with index 0
+"""
+
+FnfArrays = collections.namedtuple("FnfArrays", ["literals", "offsets", "var_count", "op"], module=__name__)
+FnfArrays.__doc__ = """Flat representation of a CNF or DNF.
+
+:param literals: Literals of all clauses (CNF) or terms (DNF), one after the other (int64)
+:param offsets: The literals of clause i are at indices offsets[i] to offsets[i+1] (int64)
+:param var_count: Number of variables
+:param op: "cnf" or "dnf"
+"""
+
+
+class CompilationBudgetExceeded(Exception):
+    """The compilation of a CNF or DNF was stopped because it exceeded a budget (see ``SddManager.fnf_to_sdd``).
+
+    The manager remains usable. The partially compiled SDD is not referenced and is reclaimed by the next
+    garbage collection.
+
+    :param budget: The budget that was exceeded: "time_limit", "max_live_size" or "max_size"
+    :param clause: Number of clauses (or terms) that were compiled
+    :param live_size: Live size of the manager when the compilation was stopped
+    :param elapsed: Compilation time in seconds
+    """
+    def __init__(self, budget, clause, live_size, elapsed):
+        super().__init__(f"Compilation exceeded {budget} after {clause} clauses "
+                         f"(live size {live_size}, {elapsed:.3f} sec)")
+        self.budget = budget
+        self.clause = clause
+        self.live_size = live_size
+        self.elapsed = elapsed
+
+
+cdef struct PtrIndex:
+    # Open addressing hash table from pointers to indices
+    size_t* keys
+    Py_ssize_t* values
+    size_t mask
+    size_t size
+
+
+cdef inline size_t _ptrindex_home(PtrIndex* table, size_t key) nogil:
+    return ((key >> 4) * <size_t>11400714819323198485ULL) & table.mask
+
+
+cdef inline size_t _ptrindex_slot(PtrIndex* table, size_t key) nogil:
+    cdef size_t slot = _ptrindex_home(table, key)
+    while table.keys[slot] != 0 and table.keys[slot] != key:
+        slot = (slot + 1) & table.mask
+    return slot
+
+
+cdef int _ptrindex_init(PtrIndex* table, size_t capacity) except -1:
+    cdef size_t size = 64
+    while size < 2 * capacity:
+        size *= 2
+    table.keys = <size_t*> calloc(size, sizeof(size_t))
+    table.values = <Py_ssize_t*> malloc(size * sizeof(Py_ssize_t))
+    if table.keys == NULL or table.values == NULL:
+        free(table.keys)
+        free(table.values)
+        raise MemoryError("Could not create node index")
+    table.mask = size - 1
+    table.size = 0
+    return 0
+
+
+cdef void _ptrindex_free(PtrIndex* table):
+    free(table.keys)
+    free(table.values)
+    table.keys = NULL
+    table.values = NULL
+
+
+cdef inline Py_ssize_t _ptrindex_get(PtrIndex* table, const void* ptr) nogil:
+    cdef size_t slot = _ptrindex_slot(table, <size_t>ptr)
+    if table.keys[slot] == 0:
+        return -1
+    return table.values[slot]
+
+
+cdef int _ptrindex_set(PtrIndex* table, const void* ptr, Py_ssize_t value) except -1:
+    cdef size_t slot
+    cdef size_t i
+    cdef PtrIndex old
+    if 2 * (table.size + 1) > table.mask + 1:
+        old = table[0]
+        _ptrindex_init(table, table.mask + 1)
+        for i in range(old.mask + 1):
+            if old.keys[i] != 0:
+                slot = _ptrindex_slot(table, old.keys[i])
+                table.keys[slot] = old.keys[i]
+                table.values[slot] = old.values[i]
+                table.size += 1
+        _ptrindex_free(&old)
+    slot = _ptrindex_slot(table, <size_t>ptr)
+    if table.keys[slot] == 0:
+        table.size += 1
+    table.keys[slot] = <size_t>ptr
+    table.values[slot] = value
+    return 0
+
+
+cdef void _ptrindex_remove(PtrIndex* table, const void* ptr) nogil:
+    # Backward shift deletion, keeps the probe sequences intact without tombstones
+    cdef size_t hole = _ptrindex_slot(table, <size_t>ptr)
+    cdef size_t slot = hole
+    cdef size_t home
+    if table.keys[hole] == 0:
+        return
+    while True:
+        slot = (slot + 1) & table.mask
+        if table.keys[slot] == 0:
+            break
+        home = _ptrindex_home(table, table.keys[slot])
+        # The entry stays if its home lies cyclically in (hole, slot]
+        if ((slot - home) & table.mask) < ((slot - hole) & table.mask):
+            continue
+        table.keys[hole] = table.keys[slot]
+        table.values[hole] = table.values[slot]
+        hole = slot
+    table.keys[hole] = 0
+    table.size -= 1
+
+
+cdef _sdd_to_arrays(SddManager manager, list nodes):
+    """Flatten the SDDs rooted at the given nodes into an SddArrays tuple.
+
+    Shared nodes are included once. Uses an explicit stack, the depth of the SDD is not limited
+    by the recursion limit.
+    """
+    _require_numpy()
+    cdef Py_ssize_t nb_roots = len(nodes)
+    cdef Py_ssize_t nb_nodes = 0
+    cdef Py_ssize_t nb_elements = 0
+    cdef Py_ssize_t order_size = 1024
+    cdef Py_ssize_t stack_size = 64
+    cdef Py_ssize_t depth, i, j, e
+    cdef sddapi_c.SddNode* node
+    cdef sddapi_c.SddNode* child
+    cdef sddapi_c.SddNode** elements
+    cdef sddapi_c.SddNode** order = <sddapi_c.SddNode**> malloc(order_size * sizeof(sddapi_c.SddNode*))
+    cdef sddapi_c.SddNode** stack = <sddapi_c.SddNode**> malloc(stack_size * sizeof(sddapi_c.SddNode*))
+    cdef Py_ssize_t* cursor = <Py_ssize_t*> malloc(stack_size * sizeof(Py_ssize_t))
+    cdef void* tmp
+    cdef int8_t[::1] kind_v
+    cdef int64_t[::1] literal_v, vtree_v, elem_offsets_v, primes_v, subs_v, roots_v
+    cdef PtrIndex index
+    index.keys = NULL
+    index.values = NULL
+    try:
+        if order == NULL or stack == NULL or cursor == NULL:
+            raise MemoryError("Could not allocate traversal buffers")
+        _ptrindex_init(&index, 1024)
+        # Post-order depth-first traversal
+        for i in range(nb_roots):
+            node = (<SddNode?> nodes[i])._sddnode
+            if _ptrindex_get(&index, node) >= 0:
+                continue
+            depth = 0
+            stack[0] = node
+            cursor[0] = 0
+            while depth >= 0:
+                node = stack[depth]
+                if sddapi_c.sdd_node_is_decision(node) and cursor[depth] < 2 * sddapi_c.sdd_node_size(node):
+                    child = sddapi_c.sdd_node_elements(node)[cursor[depth]]
+                    cursor[depth] += 1
+                    if _ptrindex_get(&index, child) < 0:
+                        depth += 1
+                        if depth == stack_size:
+                            stack_size *= 2
+                            tmp = realloc(stack, stack_size * sizeof(sddapi_c.SddNode*))
+                            if tmp == NULL:
+                                raise MemoryError("Could not allocate traversal buffers")
+                            stack = <sddapi_c.SddNode**> tmp
+                            tmp = realloc(cursor, stack_size * sizeof(Py_ssize_t))
+                            if tmp == NULL:
+                                raise MemoryError("Could not allocate traversal buffers")
+                            cursor = <Py_ssize_t*> tmp
+                        stack[depth] = child
+                        cursor[depth] = 0
+                    continue
+                # All children are numbered
+                if nb_nodes == order_size:
+                    order_size *= 2
+                    tmp = realloc(order, order_size * sizeof(sddapi_c.SddNode*))
+                    if tmp == NULL:
+                        raise MemoryError("Could not allocate traversal buffers")
+                    order = <sddapi_c.SddNode**> tmp
+                _ptrindex_set(&index, node, nb_nodes)
+                order[nb_nodes] = node
+                nb_nodes += 1
+                if sddapi_c.sdd_node_is_decision(node):
+                    nb_elements += sddapi_c.sdd_node_size(node)
+                depth -= 1
+
+        kind = np.empty(nb_nodes, dtype=np.int8)
+        literal = np.zeros(nb_nodes, dtype=np.int64)
+        vtree = np.empty(nb_nodes, dtype=np.int64)
+        elem_offsets = np.empty(nb_nodes + 1, dtype=np.int64)
+        primes = np.empty(nb_elements, dtype=np.int64)
+        subs = np.empty(nb_elements, dtype=np.int64)
+        roots = np.empty(nb_roots, dtype=np.int64)
+        kind_v = kind
+        literal_v = literal
+        vtree_v = vtree
+        elem_offsets_v = elem_offsets
+        primes_v = primes
+        subs_v = subs
+        roots_v = roots
+        e = 0
+        for i in range(nb_nodes):
+            node = order[i]
+            elem_offsets_v[i] = e
+            if sddapi_c.sdd_node_is_decision(node):
+                kind_v[i] = DECISION_NODE
+                elements = sddapi_c.sdd_node_elements(node)
+                for j in range(sddapi_c.sdd_node_size(node)):
+                    primes_v[e] = _ptrindex_get(&index, elements[2 * j])
+                    subs_v[e] = _ptrindex_get(&index, elements[2 * j + 1])
+                    e += 1
+            elif sddapi_c.sdd_node_is_literal(node):
+                kind_v[i] = LITERAL_NODE
+                literal_v[i] = sddapi_c.sdd_node_literal(node)
+            elif sddapi_c.sdd_node_is_true(node):
+                kind_v[i] = TRUE_NODE
+            else:
+                kind_v[i] = FALSE_NODE
+            if kind_v[i] == TRUE_NODE or kind_v[i] == FALSE_NODE:
+                vtree_v[i] = -1
+            else:
+                vtree_v[i] = sddapi_c.sdd_vtree_position(sddapi_c.sdd_vtree_of(node))
+        elem_offsets_v[nb_nodes] = e
+        for i in range(nb_roots):
+            roots_v[i] = _ptrindex_get(&index, (<SddNode> nodes[i])._sddnode)
+    finally:
+        free(order)
+        free(stack)
+        free(cursor)
+        _ptrindex_free(&index)
+    return SddArrays(kind, literal, vtree, elem_offsets, primes, subs, roots,
+                     sddapi_c.sdd_manager_var_count(manager._sddmanager))
+
+
+cdef int _check_child(sddapi_c.SddNode* node, Py_ssize_t lo, Py_ssize_t hi):
+    """Node is a constant or is normalized for a vtree node with position in [lo, hi]."""
+    cdef Py_ssize_t position
+    if sddapi_c.sdd_node_is_true(node) or sddapi_c.sdd_node_is_false(node):
+        return 1
+    position = sddapi_c.sdd_vtree_position(sddapi_c.sdd_vtree_of(node))
+    return lo <= position <= hi
+
+
+cdef int _check_partition(sddapi_c.SddManager* mgr, sddapi_c.SddNode** nodes, const int64_t[::1] primes,
+                          Py_ssize_t first, Py_ssize_t last):
+    """The primes of elements [first, last) are mutually exclusive and exhaustive.
+
+    Uses apply operations, automatic garbage collection and minimization should be off.
+    """
+    cdef sddapi_c.SddNode* covered = sddapi_c.sdd_manager_false(mgr)
+    cdef Py_ssize_t e
+    for e in range(first, last):
+        if not sddapi_c.sdd_node_is_false(sddapi_c.sdd_conjoin(covered, nodes[primes[e]], mgr)):
+            return 0
+        covered = sddapi_c.sdd_disjoin(covered, nodes[primes[e]], mgr)
+    return sddapi_c.sdd_node_is_true(covered)
+
+
+cdef list _sdd_from_arrays(SddManager manager, arrays, bint validate=True):
+    """Construct the SDDs in an SddArrays tuple in the manager, the inverse of _sdd_to_arrays.
+
+    Decision nodes are constructed directly from their elements, as is done by sdd_read, without
+    apply operations. The vtree positions in the arrays should be those of the manager's vtree.
+    All elements are checked before a node is constructed: the primes and subs should be normalized
+    for the left and right child of the node's vtree node and, if validate is set, the primes should
+    form a partition. Otherwise a ValueError is raised and the manager is left unchanged (apart from
+    dead nodes).
+    """
+    _require_numpy()
+    cdef sddapi_c.SddManager* mgr = manager._sddmanager
+    cdef Py_ssize_t var_count = sddapi_c.sdd_manager_var_count(mgr)
+    cdef Py_ssize_t nb_positions = 2 * var_count - 1
+    cdef const int8_t[::1] kind = np.ascontiguousarray(arrays.kind, dtype=np.int8)
+    cdef const int64_t[::1] literal = np.ascontiguousarray(arrays.literal, dtype=np.int64)
+    cdef const int64_t[::1] vtree = np.ascontiguousarray(arrays.vtree, dtype=np.int64)
+    cdef const int64_t[::1] elem_offsets = np.ascontiguousarray(arrays.elem_offsets, dtype=np.int64)
+    cdef const int64_t[::1] primes = np.ascontiguousarray(arrays.primes, dtype=np.int64)
+    cdef const int64_t[::1] subs = np.ascontiguousarray(arrays.subs, dtype=np.int64)
+    cdef const int64_t[::1] roots = np.ascontiguousarray(arrays.roots, dtype=np.int64)
+    cdef Py_ssize_t nb_nodes = kind.shape[0]
+    cdef Py_ssize_t i, e, v, lo, hi, depth
+    cdef sddapi_c.Vtree* node_vtree
+    cdef sddapi_c.Vtree** vtrees = NULL
+    cdef sddapi_c.Vtree** stack = NULL
+    cdef sddapi_c.SddNode** nodes = NULL
+    cdef bint auto_gc = sddapi_c.sdd_manager_is_auto_gc_and_minimize_on(mgr)
+    if elem_offsets.shape[0] != nb_nodes + 1 or primes.shape[0] != subs.shape[0] or \
+            elem_offsets[nb_nodes] != primes.shape[0]:
+        raise ValueError("Inconsistent sizes of the node and element arrays")
+    # The nodes under construction are not referenced, and the partition checks use apply
+    sddapi_c.sdd_manager_auto_gc_and_minimize_off(mgr)
+    try:
+        vtrees = <sddapi_c.Vtree**> malloc(nb_positions * sizeof(sddapi_c.Vtree*))
+        stack = <sddapi_c.Vtree**> malloc(nb_positions * sizeof(sddapi_c.Vtree*))
+        nodes = <sddapi_c.SddNode**> malloc((nb_nodes + 1) * sizeof(sddapi_c.SddNode*))
+        if vtrees == NULL or stack == NULL or nodes == NULL:
+            raise MemoryError("Could not allocate construction buffers")
+        # Vtree nodes by position
+        depth = 0
+        stack[0] = sddapi_c.sdd_manager_vtree(mgr)
+        while depth >= 0:
+            node_vtree = stack[depth]
+            depth -= 1
+            vtrees[sddapi_c.sdd_vtree_position(node_vtree)] = node_vtree
+            if not sddapi_c.sdd_vtree_is_leaf(node_vtree):
+                depth += 1
+                stack[depth] = sddapi_c.sdd_vtree_left(node_vtree)
+                depth += 1
+                stack[depth] = sddapi_c.sdd_vtree_right(node_vtree)
+        for i in range(nb_nodes):
+            if kind[i] == FALSE_NODE:
+                nodes[i] = sddapi_c.sdd_manager_false(mgr)
+            elif kind[i] == TRUE_NODE:
+                nodes[i] = sddapi_c.sdd_manager_true(mgr)
+            elif kind[i] == LITERAL_NODE:
+                if literal[i] == 0 or literal[i] > var_count or literal[i] < -var_count:
+                    raise ValueError(f"Node {i}: literal {literal[i]} is not in the manager")
+                nodes[i] = sddapi_c.sdd_manager_literal(literal[i], mgr)
+            elif kind[i] == DECISION_NODE:
+                v = vtree[i]
+                if v < 0 or v >= nb_positions or sddapi_c.sdd_vtree_is_leaf(vtrees[v]):
+                    raise ValueError(f"Node {i}: {v} is not the position of an internal vtree node")
+                if elem_offsets[i + 1] <= elem_offsets[i]:
+                    raise ValueError(f"Node {i}: decision node without elements")
+                # In-order positions, the left subtree is [lo, v - 1] and the right subtree [v + 1, hi]
+                lo = v - 2 * sddapi_c.sdd_vtree_var_count(sddapi_c.sdd_vtree_left(vtrees[v])) + 1
+                hi = v + 2 * sddapi_c.sdd_vtree_var_count(sddapi_c.sdd_vtree_right(vtrees[v])) - 1
+                # Check all elements before starting the partition
+                for e in range(elem_offsets[i], elem_offsets[i + 1]):
+                    if not (0 <= primes[e] < i and 0 <= subs[e] < i):
+                        raise ValueError(f"Node {i}: elements should refer to earlier nodes")
+                    if sddapi_c.sdd_node_is_false(nodes[primes[e]]) or \
+                            not _check_child(nodes[primes[e]], lo, v - 1) or \
+                            not _check_child(nodes[subs[e]], v + 1, hi):
+                        raise ValueError(f"Node {i}: elements are not normalized for vtree node {v}")
+                if validate and not _check_partition(mgr, nodes, primes, elem_offsets[i], elem_offsets[i + 1]):
+                    raise ValueError(f"Node {i}: primes are not mutually exclusive and exhaustive")
+                sddapi_c.START_partition(mgr)
+                for e in range(elem_offsets[i], elem_offsets[i + 1]):
+                    sddapi_c.DECLARE_element(nodes[primes[e]], nodes[subs[e]], vtrees[v], mgr)
+                nodes[i] = sddapi_c.GET_node_of_partition(vtrees[v], mgr, 0)
+            else:
+                raise ValueError(f"Node {i}: unknown node kind {kind[i]}")
+        result = []
+        for i in range(roots.shape[0]):
+            if not 0 <= roots[i] < nb_nodes:
+                raise ValueError(f"Root {roots[i]} is not a node")
+            result.append(SddNode.wrap(nodes[roots[i]], manager))
+    finally:
+        if auto_gc:
+            sddapi_c.sdd_manager_auto_gc_and_minimize_on(mgr)
+        free(vtrees)
+        free(stack)
+        free(nodes)
+    return result
+
+
+@cython.no_gc_clear
 cdef class SddNode:
     cdef sddapi_c.SddNode* _sddnode
     cdef SddManager _manager
+    cdef sddapi_c.SddSize _id
     cdef _name
+    # Cache for elements(), valid as long as the C node keeps the same element array
+    cdef tuple _elements
+    cdef sddapi_c.SddNode** _elements_ptr
+    cdef sddapi_c.SddNodeSize _elements_size
+    cdef object __weakref__
 
     def __cinit__(self, manager):
         self._manager = manager
-        self._name = "?"
+        self._name = None
+        self._elements = None
+
+    def __dealloc__(self):
+        # The manager is not cleared by the garbage collector (no_gc_clear) and outlives its wrappers
+        cdef SddManager manager = self._manager
+        if manager is None or self._sddnode == NULL:
+            return
+        if _ptrindex_get(&manager._nodes, self._sddnode) == <Py_ssize_t><void*>self:
+            _ptrindex_remove(&manager._nodes, self._sddnode)
 
     @staticmethod
     cdef wrap(sddapi_c.SddNode* node, SddManager manager):
+        """Transform a C SddNode to a Python SddNode.
+
+        Wrappers are interned per manager: wrapping the same C node (pointer and id) twice
+        returns the same Python object.
+
+        :return: Python object for the SddNode, or None if the node has been garbage collected
+        """
         if node == NULL:
             return None
-        wrapper = SddNode(manager)
-        wrapper._sddnode = node
-        if wrapper.garbage_collected():
+        cdef sddapi_c.SddSize node_id = sddapi_c.sdd_id(node)
+        cdef Py_ssize_t cached = _ptrindex_get(&manager._nodes, node)
+        cdef SddNode wrapper
+        if cached != -1 and (<SddNode><void*>cached)._id == node_id:
+            return <SddNode><void*>cached
+        if sddapi_c.sdd_garbage_collected(node, node_id) == 1:
             return None
-        if sddapi_c.sdd_node_is_literal(node):
-            wrapper._name = sddapi_c.sdd_node_literal(node)
-        elif sddapi_c.sdd_node_is_true(node):
-            wrapper._name = "True"
-        elif sddapi_c.sdd_node_is_false(node):
-            wrapper._name = "False"
-        elif sddapi_c.sdd_node_is_decision(node):
-            wrapper._name = "Decision"
+        wrapper = SddNode.__new__(SddNode, manager)
+        wrapper._sddnode = node
+        wrapper._id = node_id
+        _ptrindex_set(&manager._nodes, node, <Py_ssize_t><void*>wrapper)
         return wrapper
 
+    cdef _node_name(self):
+        # The name is only needed for printing, compute it lazily
+        if self._name is None:
+            if sddapi_c.sdd_node_is_literal(self._sddnode):
+                self._name = sddapi_c.sdd_node_literal(self._sddnode)
+            elif sddapi_c.sdd_node_is_true(self._sddnode):
+                self._name = "True"
+            elif sddapi_c.sdd_node_is_false(self._sddnode):
+                self._name = "False"
+            elif sddapi_c.sdd_node_is_decision(self._sddnode):
+                self._name = "Decision"
+            else:
+                self._name = "?"
+        return self._name
 
     @property
     def id(self):
@@ -73,17 +572,17 @@ cdef class SddNode:
 
         :return: id
         """
-        return sddapi_c.sdd_id(self._sddnode)
+        return self._id
 
     def __hash__(self):
-        return self.id
+        return self._id
 
     def garbage_collected(self):
         """Returns true if the SDD node with the given ID has been garbage collected; returns false otherwise.
 
         This function may be helpful for debugging.
         """
-        return sddapi_c.sdd_garbage_collected(self._sddnode, self.id) == 1
+        return sddapi_c.sdd_garbage_collected(self._sddnode, self._id) == 1
 
     @property
     def manager(self):
@@ -183,7 +682,11 @@ cdef class SddNode:
     def elements(self):
         """Returns an array containing the elements of an SDD node.
 
-        :returns: A list of pairs [(prime, sub)]
+        :returns: A tuple of pairs ((prime, sub), ...)
+
+        Changed in this version: a tuple is returned instead of a list. The tuple is cached on the node
+        and reused as long as the C node keeps the same elements, use ``list(node.elements())`` for a
+        mutable copy.
 
         Internal working:
         If the node has m elements, the array will be of size 2m, with primes appearing at locations
@@ -191,15 +694,24 @@ cdef class SddNode:
         Assumes that sdd node is decision(node) returns 1. Moreover, the returned array should not be
         freed.
         """
-        cdef sddapi_c.SddNode** nodes;
+        cdef sddapi_c.SddNode** nodes
+        cdef sddapi_c.SddNodeSize m
+        cdef sddapi_c.SddNodeSize i
+        if not sddapi_c.sdd_node_is_decision(self._sddnode):
+            return ()
         nodes = sddapi_c.sdd_node_elements(self._sddnode)
         # do not free memory of nodes
-        m = self.node_size()
+        m = sddapi_c.sdd_node_size(self._sddnode)
+        if self._elements is not None and self._elements_ptr == nodes and self._elements_size == m:
+            return self._elements
         primesubs = []
         for i in range(0, 2 * m, 2):
             primesubs.append((SddNode.wrap(nodes[i], self._manager),
                               SddNode.wrap(nodes[i + 1], self._manager)))
-        return primesubs
+        self._elements = tuple(primesubs)
+        self._elements_ptr = nodes
+        self._elements_size = m
+        return self._elements
 
     def vtree(self):
         """Returns the vtree of an SDD node."""
@@ -277,6 +789,63 @@ cdef class SddNode:
                         for right in self.models(vtree.right()):
                             yield SddNode._join_models(left,right)
 
+    def model_batches(self, batch_size=65536, variables=None, packed=False):
+        """A generator for the global models of an SDD, in batches of NumPy arrays.
+
+        This is a fast alternative for models(). Every batch is a matrix with one row per model and one
+        column per manager variable (in increasing order). Models are enumerated in compiled code.
+
+        :param batch_size: Number of models per batch (the last batch can be smaller)
+        :param variables: Project the models on the given variables (the other variables are existentially
+            quantified out). Each projected model is returned once and only these variables get a column.
+        :param packed: Return the models as bits packed into uint8 values (see ``numpy.packbits``)
+            instead of int8 values.
+        :return: Generator of NumPy arrays
+        """
+        _require_numpy()
+        from .circuit import Circuit
+        cdef SddNode node = self
+        cdef long var_count = self._manager.var_count()
+        if variables is not None:
+            variables = np.unique(np.asarray(variables, dtype=np.int64))
+            if len(variables) > 0 and (variables[0] < 1 or variables[-1] > var_count):
+                raise ValueError(f"Variables should be between 1 and {var_count}")
+            exists_map = np.ones(var_count + 1, dtype=np.intc)
+            exists_map[0] = 0
+            exists_map[variables] = 0
+            node = self._manager.exists_multiple_static(exists_map, self)
+        circuit = Circuit(node.to_arrays(), self._manager.vtree().to_arrays())
+        return circuit.model_batches(batch_size, variables, packed)
+
+    def sample(self, n, weights=None, seed=None):
+        """Draw n global models of an SDD, with a probability proportional to their weight.
+
+        :param n: Number of samples
+        :param weights: Array with literal weights [-3, -2, -1, 1, 2, 3] (not in log-space). If None, all weights
+            are 1 and the models are sampled uniformly.
+        :param seed: Seed for the random number generator
+        :return: NumPy array of shape (n, var_count) with values 0 and 1, column i is variable i+1
+        """
+        _require_numpy()
+        from .circuit import Circuit
+        circuit = Circuit(self.to_arrays(), self._manager.vtree().to_arrays())
+        return circuit.sample(n, weights, seed)
+
+    def evaluate(self, semiring, weights=None, smooth=True):
+        """Evaluate the SDD in a commutative semiring (algebraic model counting).
+
+        :param semiring: pysdd.circuit.Semiring, or the name of a built-in semiring (sum-product, log-sum-exp,
+            max-product, min-plus, boolean or counting)
+        :param weights: Array with the value of every literal [-3, -2, -1, 1, 2, 3] in the semiring, or a matrix
+            with one such row per query. By default, every literal has the value one of the semiring.
+        :param smooth: Smooth with respect to all variables in the manager's vtree
+        :return: NumPy array with one value per query
+        """
+        _require_numpy()
+        from .circuit import Circuit
+        circuit = Circuit(self.to_arrays(), self._manager.vtree().to_arrays() if smooth else None)
+        return circuit.evaluate(semiring, weights)
+
     def wmc(self, log_mode=True):
         """Create a WmcManager to perform Weighted Model Counting with this node as root.
 
@@ -284,6 +853,20 @@ cdef class SddNode:
         """
         return WmcManager(self, log_mode)
 
+    def to_arrays(self):
+        """Export the SDD rooted at this node to flat arrays in one pass.
+
+        Nodes are ordered topologically (children before parents) with the root as last node.
+
+        :return: SddArrays with NumPy arrays for node kinds, literals, vtree positions,
+            element offsets, primes and subs.
+        """
+        return _sdd_to_arrays(self._manager, [self])
+
+    def save_binary(self, filename):
+        """Save the SDD rooted at this node in the binary SDD format, see ``SddManager.save_binary``."""
+        self._manager.save_binary(filename, [self])
+
 
     ## Manual Garbage Collection (Sec 5.4)
 
@@ -329,7 +912,7 @@ cdef class SddNode:
         return self._manager.dot(self)
 
     def __str__(self):
-        return "SddNode(name={},id={})".format(self._name, self.id)
+        return "SddNode(name={},id={})".format(self._node_name(), self._id)
 
     def __repr__(self):
         return self.__str__()
@@ -375,6 +958,10 @@ cdef class SddManager:
     cdef bint _prevent_transformation # Sect 5.2: Transformations with auto_gc_and_minimize can invalidate WMCManager
     cdef CompilerOptions options
     cdef public object root
+    # Interned SddNode wrappers, indexed by C pointer. The references are borrowed, a wrapper removes
+    # its own entry when it is deallocated.
+    cdef PtrIndex _nodes
+    cdef list _literals  # Literal wrappers, indexed by literal + var_count
 
     ## Creating managers (Sec 5.1.1)
 
@@ -384,6 +971,8 @@ cdef class SddManager:
     def __cinit__(self, long var_count=1, bint auto_gc_and_minimize=False, Vtree vtree=None):
         self.options = CompilerOptions()
         self.root = None
+        _ptrindex_init(&self._nodes, 0)
+        self._literals = None
         if vtree is not None:
             self._sddmanager = sddapi_c.sdd_manager_new(vtree._vtree)
             if self._sddmanager is NULL:
@@ -400,6 +989,7 @@ cdef class SddManager:
     def __dealloc__(self):
         if self._sddmanager is not NULL:
             sddapi_c.sdd_manager_free(self._sddmanager)
+        _ptrindex_free(&self._nodes)
 
     @staticmethod
     def from_vtree(Vtree vtree):
@@ -435,24 +1025,28 @@ cdef class SddManager:
         made a left sibling of leaf v.
         """
         sddapi_c.sdd_manager_add_var_before_first(self._sddmanager)
+        self._literals = None
 
     def add_var_after_last(self):
         """Let v be the rightmost leaf node in the vtree. A new leaf node labeled with variable n + 1 is created and
         made a right sibling of leaf v.
         """
         sddapi_c.sdd_manager_add_var_after_last(self._sddmanager)
+        self._literals = None
 
     def add_var_before(self, sddapi_c.SddLiteral target_var):
         """Let v be the vtree leaf node labeled with variable target var. A new leaf node labeled with variable
         n + 1 is created and made a left sibling of leaf v.
         """
         sddapi_c.sdd_manager_add_var_before(target_var, self._sddmanager)
+        self._literals = None
 
     def add_var_after(self, sddapi_c.SddLiteral target_var):
         """Let v be the vtree leaf node labeled with variable target var. A new leaf node labeled with variable
         n + 1 is created and made a right sibling of leaf v.
         """
         sddapi_c.sdd_manager_add_var_after(target_var, self._sddmanager)
+        self._literals = None
 
 
     ## Terminal SDDs (Sec 5.1.2)
@@ -475,14 +1069,22 @@ cdef class SddManager:
 
         :param lit: Literal (integer number)
         """
-        if lit == 0:
-            raise ValueError("Literal 0 does not exist")
-        if lit > self.var_count():
-            raise ValueError("Number of available literals is {} < {}".format(self.var_count(), lit))
         cdef long literal_c = lit
-        # if self.is_var_used(literal_c) == 0:
-        #     return None # TODO in version 2.0 this is 0 if the variable is not yet in a formula
-        return SddNode.wrap(sddapi_c.sdd_manager_literal(literal_c, self._sddmanager), self)
+        cdef long var_count = sddapi_c.sdd_manager_var_count(self._sddmanager)
+        if literal_c == 0:
+            raise ValueError("Literal 0 does not exist")
+        if literal_c > var_count or literal_c < -var_count:
+            raise ValueError("Number of available literals is {} < {}".format(var_count, abs(literal_c)))
+        # Literal nodes are terminal and never garbage collected, their wrappers can be kept in a table
+        if self._literals is None:
+            self._literals = [None] * (2 * var_count + 1)
+        node = self._literals[literal_c + var_count]
+        if node is None:
+            # if self.is_var_used(literal_c) == 0:
+            #     return None # TODO in version 2.0 this is 0 if the variable is not yet in a formula
+            node = SddNode.wrap(sddapi_c.sdd_manager_literal(literal_c, self._sddmanager), self)
+            self._literals[literal_c + var_count] = node
+        return node
 
     def l(self, lit):
         """Short for literal(lit)"""
@@ -521,14 +1123,14 @@ cdef class SddManager:
 
     def get_vars(self, value):
         try:
-            if isinstance(value, collections.abc.Iterable):
-                literals = [self.literal(lit) for lit in value]
-                return literals
-
             if type(value) == int:
                 literal = self.literal(value)
                 return literal
 
+            if isinstance(value, collections.abc.Iterable):
+                literals = [self.literal(lit) for lit in value]
+                return literals
+
             if type(value) == slice:
                 start = value.start if value.start is not None else 1
                 stop = value.stop if value.stop is not None else self.var_count()
@@ -595,6 +1197,129 @@ cdef class SddManager:
         free(nodes_c)
         return new_manager
 
+    def to_arrays(self, nodes):
+        """Export the SDDs rooted at the given nodes to flat arrays in one pass.
+
+        Nodes shared between the SDDs are included only once. The node index of every
+        given node is stored in the roots array, in the same order.
+
+        :param nodes: A list of SddNodes of this manager
+        :return: SddArrays
+        """
+        return _sdd_to_arrays(self, list(nodes))
+
+    def load_arrays(self, arrays, validate=True):
+        """Construct the SDDs in flat arrays in this manager, the inverse of ``to_arrays``.
+
+        Decision nodes are constructed directly from their elements, without apply operations. The
+        arrays should thus be normalized for the manager's vtree (e.g. exported from a manager with
+        the same vtree, see ``Vtree.from_arrays``). The elements are checked before construction,
+        invalid arrays raise a ValueError.
+
+        :param arrays: SddArrays
+        :param validate: Check that the primes of every decision node form a partition. This conjoins
+            and disjoins the primes and is much slower than the construction, only turn it off for
+            arrays from a trusted source (e.g. ``to_arrays``).
+        :return: List with an SddNode for every root in the arrays
+        """
+        return _sdd_from_arrays(self, arrays, validate)
+
+    def save_binary(self, filename, nodes):
+        """Save the SDDs rooted at the given nodes, and the manager's vtree, in the binary SDD format.
+
+        The binary format is smaller and much faster to read than the text format of ``save``. It can be
+        memory-mapped to evaluate the SDDs without a manager (see ``pysdd.util.read_sdd_binary``).
+
+        :param filename: Path to the file
+        :param nodes: A list of SddNodes of this manager
+        """
+        from .util import write_sdd_binary
+        write_sdd_binary(filename, self.to_arrays(nodes), self.vtree().to_arrays())
+
+    def save_bundle(self, filename, roots):
+        """Save named SDDs, and the manager's vtree, to one file in the binary SDD format.
+
+        The vtree and every node that is shared between the SDDs are stored once, the size of the file
+        is thus proportional to the shared size of the SDDs (see ``shared_size``).
+
+        :param filename: Path to the file
+        :param roots: Dictionary from name (e.g. a string) to SddNode of this manager
+        """
+        from .util import write_sdd_binary
+        names = list(roots.keys())
+        write_sdd_binary(filename, self.to_arrays([roots[name] for name in names]), self.vtree().to_arrays(), names)
+
+    @staticmethod
+    def load_bundle(filename, validate=True):
+        """Create a manager with the vtree in a bundle (see ``save_bundle``), and read the named SDDs.
+
+        Every shared node is constructed once. The roots are referenced (see ``SddNode.ref``), such
+        that they are not garbage collected when automatic garbage collection is turned on.
+
+        :param filename: Path to the file
+        :param validate: Check the partitions, see ``load_arrays``
+        :return: Tuple with the new SddManager and a dictionary from name to SddNode
+        """
+        from .util import read_sdd_bundle
+        names, arrays, vtree_arrays = read_sdd_bundle(filename)
+        if vtree_arrays is None:
+            raise ValueError(f"{filename}: File has no vtree")
+        manager = SddManager.from_vtree(Vtree.from_arrays(vtree_arrays))
+        nodes = manager.load_arrays(arrays, validate)
+        for node in nodes:
+            node.ref()
+        return manager, dict(zip(names, nodes))
+
+    def read_binary(self, filename, validate=True):
+        """Read the SDDs in a file in the binary SDD format into this manager.
+
+        The file should have been saved from a manager with the same vtree, see ``from_binary``
+        to create a manager with the vtree in the file.
+
+        :param filename: Path to the file
+        :param validate: Check the partitions, see ``load_arrays``
+        :return: List with the root SddNodes, in the order in which they were saved
+        """
+        from .util import read_sdd_binary
+        arrays, vtree_arrays = read_sdd_binary(filename)
+        if vtree_arrays is not None:
+            own = self.vtree().to_arrays()
+            if vtree_arrays.root != own.root or not all(np.array_equal(getattr(vtree_arrays, name), getattr(own, name))
+                                                        for name in ("left", "right", "var")):
+                raise ValueError("The vtree in the file is not the vtree of the manager")
+        return self.load_arrays(arrays, validate)
+
+    @staticmethod
+    def from_binary(filename, validate=True):
+        """Create a manager with the vtree in a file in the binary SDD format, and read its SDDs.
+
+        :param filename: Path to the file
+        :param validate: Check the partitions, see ``load_arrays``
+        :return: Tuple with the new SddManager and the list with the root SddNodes
+        """
+        from .util import read_sdd_binary
+        arrays, vtree_arrays = read_sdd_binary(filename)
+        if vtree_arrays is None:
+            raise ValueError(f"{filename}: File has no vtree")
+        manager = SddManager.from_vtree(Vtree.from_arrays(vtree_arrays))
+        return manager, manager.load_arrays(arrays, validate)
+
+    def shared_size(self, nodes):
+        """Size of the SDDs rooted at the given nodes, counting every shared element once.
+
+        :param nodes: A list of SddNodes of this manager
+        """
+        cdef Py_ssize_t i, count = len(nodes)
+        cdef sddapi_c.SddNode** c_nodes = <sddapi_c.SddNode**> malloc(max(count, 1) * sizeof(sddapi_c.SddNode*))
+        if c_nodes == NULL:
+            raise MemoryError("Could not allocate node array")
+        try:
+            for i in range(count):
+                c_nodes[i] = (<SddNode?> nodes[i])._sddnode
+            return sddapi_c.sdd_shared_size(c_nodes, count)
+        finally:
+            free(c_nodes)
+
     def print_stdout(self):
         sddapi_c.sdd_manager_print(self._sddmanager)
 
@@ -656,28 +1381,46 @@ cdef class SddManager:
         if self.is_prevent_transformation_on() and self.is_auto_gc_and_minimize_on():
             raise EnvironmentError("Transformation is not allowed when prevent_transformation and auto garbage "
                                    "collection and SDD minimization is active")
-        return SddNode.wrap(sddapi_c.sdd_apply(node1._sddnode, node2._sddnode, op, self._sddmanager), self)
+        return SddNode.wrap(self._apply(node1, node2, op), self)
 
     def conjoin(self, SddNode node1, SddNode node2):
         """Returns the result of applying the corresponding Boolean operation on the given SDDs."""
         if self.is_prevent_transformation_on() and self.is_auto_gc_and_minimize_on():
             raise EnvironmentError("Transformation is not allowed when prevent_transformation and auto garbage "
                                    "collection and SDD minimization is active")
-        return SddNode.wrap(sddapi_c.sdd_conjoin(node1._sddnode, node2._sddnode, self._sddmanager), self)
+        return SddNode.wrap(self._apply(node1, node2, 0), self)
 
     def disjoin(self, SddNode node1, SddNode node2):
         """Returns the result of applying the corresponding Boolean operation on the given SDDs."""
         if self.is_prevent_transformation_on() and self.is_auto_gc_and_minimize_on():
             raise EnvironmentError("Transformation is not allowed when prevent_transformation and auto garbage "
                                    "collection and SDD minimization is active")
-        return SddNode.wrap(sddapi_c.sdd_disjoin(node1._sddnode, node2._sddnode, self._sddmanager), self)
+        return SddNode.wrap(self._apply(node1, node2, 1), self)
 
     def negate(self, SddNode node):
         """Returns the result of applying the corresponding Boolean operation on the given SDDs."""
         if self.is_prevent_transformation_on() and self.is_auto_gc_and_minimize_on():
             raise EnvironmentError("Transformation is not allowed when prevent_transformation and auto garbage "
                                    "collection and SDD minimization is active")
-        return SddNode.wrap(sddapi_c.sdd_negate(node._sddnode, self._sddmanager), self)
+        cdef sddapi_c.SddNode* node_c = node._sddnode
+        cdef sddapi_c.SddNode* rnode
+        with nogil:
+            rnode = sddapi_c.sdd_negate(node_c, self._sddmanager)
+        return SddNode.wrap(rnode, self)
+
+    cdef sddapi_c.SddNode* _apply(self, SddNode node1, SddNode node2, sddapi_c.BoolOp op):
+        """Apply without holding the GIL (auto minimization runs a vtree search, which takes the global lock)."""
+        cdef sddapi_c.SddNode* node1_c = node1._sddnode
+        cdef sddapi_c.SddNode* node2_c = node2._sddnode
+        cdef sddapi_c.SddNode* rnode
+        if sddapi_c.sdd_manager_is_auto_gc_and_minimize_on(self._sddmanager):
+            with _vtree_search_lock:
+                with nogil:
+                    rnode = sddapi_c.sdd_apply(node1_c, node2_c, op, self._sddmanager)
+        else:
+            with nogil:
+                rnode = sddapi_c.sdd_apply(node1_c, node2_c, op, self._sddmanager)
+        return rnode
 
     def condition(self, lit, SddNode node):
         """Returns the result of conditioning an SDD on a literal, where a literal is a positive or negative integer."""
@@ -755,13 +1498,46 @@ cdef class SddManager:
         """
         return sddapi_c.sdd_minimum_cardinality(node._sddnode)
 
+    def top_k_models(self, SddNode node, k, cost="cardinality"):
+        """Returns the k best global models of an SDD, in order.
+
+        The models are found with a lazy best-first search over the SDD, without enumerating all models.
+
+        :param node: SddNode
+        :param k: Number of models
+        :param cost: "cardinality" to rank the models by increasing cardinality (the number of variables
+            that are true), or an array with literal weights [-3, -2, -1, 1, 2, 3] (not in log-space) to rank
+            the models by decreasing weight (the product of their literal weights).
+        :return: Tuple with a NumPy array with one row per model (at most k) with values 0 and 1, column i is
+            variable i+1, and an array with the cardinality or the natural logarithm of the weight of every model.
+        """
+        _require_numpy()
+        from .circuit import Circuit
+        circuit = Circuit(node.to_arrays(), self.vtree().to_arrays())
+        if isinstance(cost, str):
+            if cost != "cardinality":
+                raise ValueError(f"Unknown cost {cost}, expected 'cardinality' or literal weights")
+            var_count = self.var_count()
+            log_weights = np.concatenate([np.zeros(var_count), -np.ones(var_count)])
+            models, scores = circuit.top_k(k, log_weights, log_mode=True)
+            return models, np.rint(-scores).astype(np.int64)
+        return circuit.top_k(k, cost)
+
     def model_count(self, SddNode node):
         """Returns the model count of an SDD (i.e., with respect to the SDD variables)."""
-        return sddapi_c.sdd_model_count(node._sddnode, self._sddmanager)
+        cdef sddapi_c.SddNode* node_c = node._sddnode
+        cdef sddapi_c.SddModelCount count
+        with nogil:
+            count = sddapi_c.sdd_model_count(node_c, self._sddmanager)
+        return count
 
     def global_model_count(self, SddNode node):
         """Returns the global model count of an SDD (i.e., with respect to the manager variables)."""
-        return sddapi_c.sdd_global_model_count(node._sddnode, self._sddmanager)
+        cdef sddapi_c.SddNode* node_c = node._sddnode
+        cdef sddapi_c.SddModelCount count
+        with nogil:
+            count = sddapi_c.sdd_global_model_count(node_c, self._sddmanager)
+        return count
 
     def rename_variables(self, SddNode node, sddapi_c.SddLiteral[:] variable_map):
         """Returns an SDD which is obtained by renaming variables in the SDD node.  The array variable_map has size n+1, where n is the number of variables in the manager.  A variable i, 1 <= i <= n, that appears in the given SDD is renamed into variable variable_map[i] (variable_map[0] is not used)."""
@@ -863,7 +1639,7 @@ cdef class SddManager:
     # Read CNF
 
     @staticmethod
-    def from_cnf_file(char* filename, char* vtree_type="balanced"):
+    def from_cnf_file(filename, char* vtree_type="balanced"):
         """Create an SDD from the given CNF file."""
         cdef Fnf cnf = Fnf.from_cnf_file(filename)
         return SddManager.from_fnf(cnf, vtree_type)
@@ -876,20 +1652,13 @@ cdef class SddManager:
     @staticmethod
     def from_cnf_string(cnf, char* vtree_type="balanced"):
         """Create an SDD from the given CNF string."""
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            fname = os.path.join(tmpdirname, "program.cnf")
-            fname_b = fname.encode()
-            fname_c = fname_b
-            with open(fname, "w") as ofile:
-                ofile.write(cnf)
-            return SddManager.from_cnf_file(fname_c, vtree_type)
-        return None, None
+        return SddManager.from_fnf(Fnf.from_cnf_string(cnf), vtree_type)
 
 
     # Read DNF
 
     @staticmethod
-    def from_dnf_file(char* filename, char* vtree_type="balanced"):
+    def from_dnf_file(filename, char* vtree_type="balanced"):
         """Create an SDD from the given DNF file."""
         cdef Fnf dnf = Fnf.from_dnf_file(filename)
         return SddManager.from_fnf(dnf, vtree_type)
@@ -902,35 +1671,73 @@ cdef class SddManager:
     @staticmethod
     def from_dnf_string(dnf, char* vtree_type="balanced"):
         """Create an SDD from the given DNF string."""
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            fname = os.path.join(tmpdirname, "program.dnf")
-            fname_b = fname.encode()
-            fname_c = fname_b
-            with open(fname, "w") as ofile:
-                ofile.write(dnf)
-            return SddManager.from_dnf_file(fname_c, vtree_type)
-        return None, None
+        return SddManager.from_fnf(Fnf.from_dnf_string(dnf), vtree_type)
 
 
     # Read FNF
 
     @staticmethod
-    def from_fnf(Fnf fnf, char* vtree_type="balanced"):
-        """Create an SDD from the given DNF file."""
+    def from_fnf(Fnf fnf, char* vtree_type="balanced", **budgets):
+        """Create an SDD from the given CNF or DNF.
+
+        The budgets (time_limit, max_live_size, max_size and progress) are passed to ``fnf_to_sdd``.
+        """
         vtree = Vtree(var_count=fnf.var_count, vtree_type=vtree_type)
         sdd = SddManager(vtree=vtree)
         sdd.auto_gc_and_minimize_off()  # Having this on while building triggers segfault
         # cli.initialize_manager_search_state(self._sddmanager)  # not required anymore in 2.0?
-        # TODO: Add interruption to compilation (e.g. for timeouts)
-        rnode = SddNode.wrap(compiler_c.fnf_to_sdd(fnf._fnf, sdd._sddmanager), sdd)
+        rnode = sdd.fnf_to_sdd(fnf, **budgets)
         sdd.root = rnode
         # sdd.auto_gc_and_minimize_off()
         return sdd, rnode
 
 
-    def fnf_to_sdd(self, Fnf fnf):
-        rnode = SddNode.wrap(compiler_c.fnf_to_sdd(fnf._fnf, self._sddmanager), self)
-        return rnode
+    def fnf_to_sdd(self, Fnf fnf, time_limit=None, max_live_size=None, max_size=None, progress=None):
+        """Compile the given CNF or DNF to an SDD.
+
+        The GIL is released during compilation, such that independent managers can compile in parallel threads
+        (see pysdd.parallel). When the compilation performs a vtree search, other vtree searches have to wait.
+
+        The clauses (or terms) are compiled one by one. If a budget is given, it is checked after every clause
+        and a CompilationBudgetExceeded exception is raised when it is exceeded. The manager remains usable.
+        A single clause is not interrupted, thus a budget can be exceeded by the cost of one clause.
+
+        The order of the clauses and how they are combined are set in the manager's CompilerOptions:
+
+        - clause_order: "vtree" (default), "natural", "length", "occurrence", the name of an ordering
+          registered with ``register_clause_order``, or such a function.
+        - combination: "linear" (default) conjoins every clause with the result of all previous clauses,
+          "balanced" combines the clauses in a balanced binary tree, and "bucket" assigns every clause to the
+          vtree node that is the lca of its variables and combines the clauses bottom-up along the vtree.
+
+        :param time_limit: Maximal compilation time in seconds
+        :param max_live_size: Maximal live size of the manager (see ``live_size``)
+        :param max_size: Maximal size of the manager, including dead nodes (see ``size``)
+        :param progress: Function called after every clause as ``progress(clause, live_size, elapsed)``
+            with the number of compiled clauses, the live size of the manager and the time in seconds.
+            The compilation stops if it raises an exception.
+        """
+        cdef compiler_c.Fnf* fnf_c = fnf._fnf
+        cdef sddapi_c.SddNode* rnode
+        cdef _FnfCompiler compiler
+        if time_limit is not None or max_live_size is not None or max_size is not None or progress is not None \
+                or self.options.clause_order != "vtree" or self.options.combination != "linear":
+            compiler = _FnfCompiler(self, fnf, time_limit, max_live_size, max_size, progress)
+            if self.options.vtree_search_mode != 0:  # Automatic or periodic vtree search
+                with _vtree_search_lock:
+                    rnode = compiler.compile(self.options.clause_order, self.options.combination)
+            else:
+                rnode = compiler.compile(self.options.clause_order, self.options.combination)
+            return SddNode.wrap(rnode, self)
+        if sddapi_c.sdd_manager_is_auto_gc_and_minimize_on(self._sddmanager) or self.options.vtree_search_mode != 0:
+            # The C compiler turns automatic vtree search on for a negative vtree search mode
+            with _vtree_search_lock:
+                with nogil:
+                    rnode = compiler_c.fnf_to_sdd(fnf_c, self._sddmanager)
+        else:
+            with nogil:
+                rnode = compiler_c.fnf_to_sdd(fnf_c, self._sddmanager)
+        return SddNode.wrap(rnode, self)
 
 
     ## Manual Garbage Collection (Sec 5.4)
@@ -952,9 +1759,10 @@ cdef class SddManager:
         To allow for a timeout, this function can be interrupted by the keyboard interrupt (SIGINT).
         """
         f = io.StringIO()
-        with redirect_stdout(f):
+        with redirect_stdout(f), _vtree_search_lock:
             sig_on()
-            sddapi_c.sdd_manager_minimize(self._sddmanager)
+            with nogil:
+                sddapi_c.sdd_manager_minimize(self._sddmanager)
             sig_off()
         s = f.getvalue()
         return s
@@ -963,10 +1771,12 @@ cdef class SddManager:
         """Performs local garbage collection on vtree and then tries to minimize the size of the SDD of
         vtree by searching for a diﬀerent vtree. Returns the root of the resulting vtree.
         """
-        return Vtree.wrap(sddapi_c.sdd_vtree_minimize(vtree._vtree, self._sddmanager))
+        return vtree.minimize(self)
 
     def minimize_limited(self):
-        sddapi_c.sdd_manager_minimize_limited(self._sddmanager)
+        with _vtree_search_lock:
+            with nogil:
+                sddapi_c.sdd_manager_minimize_limited(self._sddmanager)
 
     def init_vtree_size_limit(self, Vtree vtree):
         sddapi_c.sdd_manager_init_vtree_size_limit(vtree._vtree, self._sddmanager)
@@ -1085,31 +1895,479 @@ cdef class Fnf:
 
     ## CNF/DNF to SDD Compiler (Sec 6)
 
-    def read_cnf(self, char* filename):
-        self._fnf =  io_c.read_cnf(filename)
-        self._type_cnf = True
+    @staticmethod
+    def from_clauses(clauses, long var_count, op="cnf", offsets=None):
+        """Create a CNF or DNF from clauses (or terms) in memory, without writing a file.
+
+        :param clauses: A list with a list of literals for every clause, or a flat array with the literals
+            of all clauses if offsets is given
+        :param var_count: Number of variables
+        :param op: "cnf" (conjunction of clauses) or "dnf" (disjunction of terms)
+        :param offsets: The literals of clause i are at indices offsets[i] to offsets[i+1] of the flat array
+        :return: Fnf
+        """
+        if op not in ("cnf", "dnf"):
+            raise ValueError(f"Expected op 'cnf' or 'dnf', got {op!r}")
+        if offsets is None:
+            literals = array.array("q")
+            offsets = array.array("q", [0])
+            for clause in clauses:
+                literals.extend(clause)
+                offsets.append(len(literals))
+        elif np is not None:
+            literals = np.ascontiguousarray(clauses, dtype=np.int64)
+            offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        else:
+            literals = array.array("q", clauses)
+            offsets = array.array("q", offsets)
+        fnf = Fnf()
+        fnf._fnf = _fnf_from_flat(literals, offsets, var_count, 0 if op == "cnf" else 1)
+        fnf._type_cnf = op == "cnf"
+        fnf._type_dnf = op == "dnf"
+        return fnf
+
+    @staticmethod
+    def from_cnf_string(cnf):
+        """Create a CNF from a string in the DIMACS format."""
+        literals, offsets, var_count = _parse_fnf_string(cnf)
+        return Fnf.from_clauses(literals, var_count, "cnf", offsets=offsets)
+
+    @staticmethod
+    def from_dnf_string(dnf):
+        """Create a DNF from a string in the DIMACS format (with header "p cnf" or "p dnf")."""
+        literals, offsets, var_count = _parse_fnf_string(dnf)
+        return Fnf.from_clauses(literals, var_count, "dnf", offsets=offsets)
+
+    def to_arrays(self):
+        """Export the CNF or DNF to flat arrays, the inverse of ``from_clauses``.
+
+        :return: FnfArrays
+        """
+        _require_numpy()
+        if self._fnf is NULL:
+            raise ValueError("No CNF or DNF has been read")
+        cdef Py_ssize_t i, j, k = 0
+        cdef compiler_c.LitSet* litset
+        offsets = np.zeros(self._fnf.litset_count + 1, dtype=np.int64)
+        cdef int64_t[::1] offsets_v = offsets
+        for i in range(self._fnf.litset_count):
+            offsets_v[i + 1] = offsets_v[i] + self._fnf.litsets[i].literal_count
+        literals = np.empty(offsets_v[self._fnf.litset_count], dtype=np.int64)
+        cdef int64_t[::1] literals_v = literals
+        for i in range(self._fnf.litset_count):
+            litset = &self._fnf.litsets[i]
+            for j in range(litset.literal_count):
+                literals_v[k] = litset.literals[j]
+                k += 1
+        return FnfArrays(literals, offsets, self._fnf.var_count, "cnf" if self._fnf.op == 0 else "dnf")
+
+    @staticmethod
+    def from_file(filename, op="cnf"):
+        """Read a CNF or DNF file in the DIMACS format.
+
+        The file is parsed in chunks (see ``pysdd.util.read_fnf_arrays``), files compressed with gzip
+        or xz are decompressed while reading, and errors are raised as a ValueError with the line number.
+        Without NumPy, the reader of the SDD package is used, which only reads uncompressed files.
+
+        :param filename: Path to the file
+        :param op: "cnf" or "dnf"
+        :return: Fnf
+        """
+        if np is None:
+            filename = os.fsencode(filename)
+            fnf = Fnf.wrap(io_c.read_cnf(filename) if op == "cnf" else io_c.read_dnf(filename))
+            fnf._type_cnf = op == "cnf"
+            fnf._type_dnf = op == "dnf"
+            return fnf
+        from .util import read_fnf_arrays
+        arrays = read_fnf_arrays(os.fsdecode(filename), op)
+        return Fnf.from_clauses(arrays.literals, arrays.var_count, op, offsets=arrays.offsets)
+
+    def _read(self, filename, op):
+        cdef Fnf fnf = Fnf.from_file(filename, op)
+        if self._fnf is not NULL:
+            fnf_c.free_fnf(self._fnf)
+        self._fnf, fnf._fnf = fnf._fnf, NULL
+        self._type_cnf = op == "cnf"
+        self._type_dnf = op == "dnf"
+
+    def read_cnf(self, filename):
+        self._read(filename, "cnf")
         print("Read CNF: vars={} clauses={}".format(self.var_count, self.litset_count))
 
     @staticmethod
-    def from_cnf_file(char* filename):
-        fnf = Fnf.wrap(io_c.read_cnf(filename))
-        fnf._type_cnf = True
+    def from_cnf_file(filename):
+        fnf = Fnf.from_file(filename, "cnf")
         print("Read CNF: vars={} clauses={}".format(fnf.var_count, fnf.litset_count))
         return fnf
 
-    def read_dnf(self, char* filename):
-        self._fnf =  io_c.read_dnf(filename)
-        self._type_dnf = True
+    def read_dnf(self, filename):
+        self._read(filename, "dnf")
         print("Read CNF: vars={} clauses={}".format(self.var_count, self.litset_count))
 
     @staticmethod
-    def from_dnf_file(char* filename):
-        fnf = Fnf.wrap(io_c.read_dnf(filename))
-        fnf._type_dnf = True
+    def from_dnf_file(filename):
+        fnf = Fnf.from_file(filename, "dnf")
         print("Read CNF: vars={} clauses={}".format(fnf.var_count, fnf.litset_count))
         return fnf
 
 
+cdef compiler_c.Fnf* _fnf_from_flat(const int64_t[::1] literals, const int64_t[::1] offsets, long var_count,
+                                    sddapi_c.BoolOp op) except NULL:
+    # Fill the C structures the same way as io_c.read_cnf, such that fnf_c.free_fnf can free them
+    cdef Py_ssize_t litset_count = offsets.shape[0] - 1
+    cdef Py_ssize_t i, j
+    cdef compiler_c.Fnf* fnf
+    cdef compiler_c.LitSet* litset
+    if var_count < 0:
+        raise ValueError(f"Expected a non-negative number of variables, got {var_count}")
+    if litset_count < 0 or offsets[0] != 0 or offsets[litset_count] != literals.shape[0]:
+        raise ValueError("Expected offsets from 0 to the number of literals")
+    for i in range(litset_count):
+        if offsets[i + 1] < offsets[i]:
+            raise ValueError(f"Expected non-decreasing offsets, clause {i} has a negative length")
+    for j in range(literals.shape[0]):
+        if literals[j] == 0 or literals[j] > var_count or literals[j] < -var_count:
+            raise ValueError(f"Invalid literal {literals[j]} for {var_count} variables")
+    fnf = <compiler_c.Fnf*>malloc(sizeof(compiler_c.Fnf))
+    if fnf is NULL:
+        raise MemoryError()
+    fnf.var_count = var_count
+    fnf.litset_count = 0
+    fnf.op = op
+    fnf.litsets = <compiler_c.LitSet*>calloc(litset_count, sizeof(compiler_c.LitSet))
+    if fnf.litsets is NULL and litset_count > 0:
+        fnf_c.free_fnf(fnf)
+        raise MemoryError()
+    for i in range(litset_count):
+        litset = &fnf.litsets[i]
+        litset.id = i
+        litset.op = 1 - op  # Clauses are disjunctions, terms are conjunctions
+        litset.literal_count = offsets[i + 1] - offsets[i]
+        litset.literals = <sddapi_c.SddLiteral*>calloc(litset.literal_count, sizeof(sddapi_c.SddLiteral))
+        fnf.litset_count = i + 1
+        if litset.literals is NULL and litset.literal_count > 0:
+            fnf_c.free_fnf(fnf)
+            raise MemoryError()
+        for j in range(litset.literal_count):
+            litset.literals[j] = literals[offsets[i] + j]
+    return fnf
+
+
+def _parse_fnf_string(text):
+    """Parse a CNF or DNF in the DIMACS format to flat literals and offsets.
+
+    Follows the parser of the SDD package: lines starting with 'c' are comments and the
+    clauses after the number given in the header are ignored.
+    """
+    if isinstance(text, bytes):
+        text = text.decode()
+    tokens = " ".join(line for line in text.splitlines() if not line.startswith("c")).split()
+    if len(tokens) < 4 or tokens[0] != "p" or tokens[1] not in ("cnf", "dnf"):
+        raise ValueError('Expected header "p cnf <var_count> <clause_count>"')
+    var_count, litset_count = int(tokens[2]), int(tokens[3])
+    literals = array.array("q")
+    offsets = array.array("q", [0])
+    for token in tokens[4:]:
+        if len(offsets) > litset_count:
+            break
+        literal = int(token)
+        if literal == 0:
+            offsets.append(len(literals))
+        else:
+            literals.append(literal)
+    if len(offsets) <= litset_count:
+        raise ValueError(f"Expected {litset_count} clauses, found {len(offsets) - 1}")
+    return literals, offsets, var_count
+
+
+def _order_natural(arrays, manager):
+    return np.arange(len(arrays.offsets) - 1)
+
+
+def _order_length(arrays, manager):
+    return np.argsort(np.diff(arrays.offsets), kind="stable")
+
+
+def _order_occurrence(arrays, manager):
+    variables = np.abs(arrays.literals)
+    occurrences = np.bincount(variables, minlength=arrays.var_count + 1)
+    scores = np.add.reduceat(occurrences[variables], arrays.offsets[:-1])
+    return np.argsort(-scores, kind="stable")
+
+
+_clause_orders = {
+    "natural": _order_natural,
+    "length": _order_length,
+    "occurrence": _order_occurrence,
+}
+
+
+def register_clause_order(name, function):
+    """Register a clause ordering that can be used as ``CompilerOptions(clause_order=name)``.
+
+    Built-in orderings are "vtree" (the default, sort by the vtree position of the lca of the literals
+    as in the SDD package), "natural" (the order in the Fnf), "length" (short clauses first) and
+    "occurrence" (first the clauses whose variables occur most often).
+
+    :param name: Name of the ordering
+    :param function: Function called as ``function(arrays, manager)`` with the FnfArrays of the CNF or DNF
+        (see ``Fnf.to_arrays``) and the SddManager, that returns the clause indices in the order in which
+        they should be compiled
+    """
+    if name == "vtree":
+        raise ValueError("The clause order 'vtree' cannot be replaced")
+    _clause_orders[name] = function
+
+
+cdef class _FnfCompiler:
+    """Compiles the clauses (or terms) of an Fnf one by one as in fnf/compiler.c, with a configurable clause
+    order and combination, and with budgets that are checked after every clause.
+
+    Every node that is held between apply operations is referenced, such that automatic garbage collection
+    and minimization can run during the compilation. When the compilation stops, these nodes are dereferenced.
+    """
+    cdef SddManager mgr
+    cdef sddapi_c.SddManager* manager
+    cdef Fnf fnf_object
+    cdef compiler_c.Fnf* fnf
+    cdef compiler_c.LitSet** litsets
+    cdef sddapi_c.SddSize count
+    cdef sddapi_c.SddSize compiled
+    cdef sddapi_c.BoolOp op
+    cdef int period
+    cdef bint resort
+    cdef sddapi_c.SddNode** nodes
+    cdef Py_ssize_t nb_nodes
+    cdef object time_limit, max_live_size, max_size, progress
+    cdef double start
+
+    def __cinit__(self, SddManager mgr, Fnf fnf, time_limit, max_live_size, max_size, progress):
+        self.mgr = mgr
+        self.manager = mgr._sddmanager
+        self.fnf_object = fnf
+        self.fnf = fnf._fnf
+        self.count = self.fnf.litset_count
+        self.op = self.fnf.op
+        self.period = mgr.options.vtree_search_mode
+        self.time_limit = time_limit
+        self.max_live_size = max_live_size
+        self.max_size = max_size
+        self.progress = progress
+
+    def __dealloc__(self):
+        self.release()
+        free(self.litsets)
+
+    cdef void release(self):
+        # Dereference the nodes that are held, such that they are reclaimed by garbage collection
+        cdef Py_ssize_t i
+        if self.nodes is not NULL:
+            for i in range(self.nb_nodes):
+                if self.nodes[i] is not NULL:
+                    sddapi_c.sdd_deref(self.nodes[i], self.manager)
+            free(self.nodes)
+            self.nodes = NULL
+
+    cdef int order(self, clause_order) except -1:
+        cdef sddapi_c.SddSize i
+        self.litsets = <compiler_c.LitSet**>malloc(self.count * sizeof(compiler_c.LitSet*))
+        if self.litsets is NULL:
+            raise MemoryError()
+        if clause_order == "vtree":
+            for i in range(self.count):
+                self.litsets[i] = &self.fnf.litsets[i]
+            with nogil:
+                compiler_c.sort_litsets_by_lca(self.litsets, self.count, self.manager)
+            return 0
+        if not callable(clause_order):
+            if clause_order not in _clause_orders:
+                raise ValueError(f"Unknown clause order {clause_order!r}, expected one of "
+                                 f"{['vtree'] + list(_clause_orders.keys())} or a function")
+            clause_order = _clause_orders[clause_order]
+        _require_numpy()
+        indices = np.asarray(clause_order(self.fnf_object.to_arrays(), self.mgr), dtype=np.int64)
+        if indices.shape != (self.count,) or np.any(np.sort(indices) != np.arange(self.count)):
+            raise ValueError(f"The clause order should return a permutation of the {self.count} clause indices")
+        for i in range(self.count):
+            self.litsets[i] = &self.fnf.litsets[indices[i]]
+        return 0
+
+    cdef int alloc_nodes(self, Py_ssize_t nb_nodes) except -1:
+        self.nodes = <sddapi_c.SddNode**>calloc(nb_nodes, sizeof(sddapi_c.SddNode*))
+        if self.nodes is NULL:
+            raise MemoryError()
+        self.nb_nodes = nb_nodes
+        return 0
+
+    cdef sddapi_c.SddNode* next_clause(self) except NULL:
+        # Compiles the next clause, the result is referenced
+        cdef sddapi_c.SddSize i = self.compiled
+        cdef sddapi_c.SddNode* node
+        cdef bint minimize = self.period > 0 and i > 0 and i % self.period == 0
+        with nogil:
+            if minimize:
+                sddapi_c.sdd_manager_minimize_limited(self.manager)
+            if self.resort and (self.period < 0 or minimize):
+                compiler_c.sort_litsets_by_lca(self.litsets + i, self.count - i, self.manager)
+            node = compiler_c.apply_litset(self.litsets[i], self.manager)
+            sddapi_c.sdd_ref(node, self.manager)
+        self.compiled += 1
+        return node
+
+    cdef sddapi_c.SddNode* combine(self, sddapi_c.SddNode* node1, sddapi_c.SddNode* node2) nogil:
+        # Combines two referenced nodes, the result is referenced instead
+        cdef sddapi_c.SddNode* node = sddapi_c.sdd_apply(node1, node2, self.op, self.manager)
+        sddapi_c.sdd_ref(node, self.manager)
+        sddapi_c.sdd_deref(node1, self.manager)
+        sddapi_c.sdd_deref(node2, self.manager)
+        return node
+
+    cdef int check(self, bint clause=True, bint last=False) except -1:
+        # Called after every clause (to report progress) and after every other combination
+        elapsed = time.perf_counter() - self.start
+        live_size = sddapi_c.sdd_manager_live_size(self.manager)
+        if clause and self.progress is not None:
+            self.progress(self.compiled, live_size, elapsed)
+        if last:
+            return 0
+        if self.time_limit is not None and elapsed > self.time_limit:
+            raise CompilationBudgetExceeded("time_limit", self.compiled, live_size, elapsed)
+        if self.max_live_size is not None and live_size > self.max_live_size:
+            raise CompilationBudgetExceeded("max_live_size", self.compiled, live_size, elapsed)
+        if self.max_size is not None and sddapi_c.sdd_manager_size(self.manager) > self.max_size:
+            raise CompilationBudgetExceeded("max_size", self.compiled, live_size, elapsed)
+        return 0
+
+    cdef sddapi_c.SddNode* compile(self, clause_order, combination) except NULL:
+        cdef sddapi_c.SddNode* one = sddapi_c.sdd_manager_true(self.manager)
+        cdef sddapi_c.SddNode* zero = sddapi_c.sdd_manager_false(self.manager)
+        cdef sddapi_c.SddNode* node
+        cdef sddapi_c.SddSize i
+        if combination not in ("linear", "balanced", "bucket"):
+            raise ValueError(f"Unknown combination {combination!r}, expected 'linear', 'balanced' or 'bucket'")
+        if self.op == 1:  # DISJOIN
+            one, zero = zero, one
+        if self.count == 0:
+            return one
+        for i in range(self.count):
+            if self.fnf.litsets[i].literal_count == 0:
+                return zero
+        if self.period < 0:
+            sddapi_c.sdd_manager_auto_gc_and_minimize_on(self.manager)
+        else:
+            sddapi_c.sdd_manager_auto_gc_and_minimize_off(self.manager)
+        self.start = time.perf_counter()
+        try:
+            self.order(clause_order)
+            if combination == "linear":
+                self.resort = clause_order == "vtree"
+                self.compile_linear(one)
+            elif combination == "balanced":
+                self.compile_balanced()
+            else:
+                self.compile_bucket(one)
+        except BaseException:
+            self.release()
+            raise
+        node = self.nodes[0]
+        self.nodes[0] = NULL
+        sddapi_c.sdd_deref(node, self.manager)
+        return node
+
+    cdef int compile_linear(self, sddapi_c.SddNode* one) except -1:
+        # Fold the clauses into one node, as in the SDD package
+        cdef sddapi_c.SddNode* node
+        self.alloc_nodes(1)
+        self.nodes[0] = one
+        while self.compiled < self.count:
+            node = self.next_clause()
+            with nogil:
+                self.nodes[0] = self.combine(node, self.nodes[0])
+            self.check(True, self.compiled == self.count)
+        return 0
+
+    cdef int compile_balanced(self) except -1:
+        # Balanced binary tree of conjunctions (disjunctions), built from left to right: the stack
+        # holds the results of complete subtrees of decreasing height
+        cdef Py_ssize_t top = 0
+        cdef int heights[65]  # Enough for 2**64 clauses
+        self.alloc_nodes(65)
+        while self.compiled < self.count:
+            self.nodes[top] = self.next_clause()
+            heights[top] = 0
+            top += 1
+            while top >= 2 and heights[top - 1] == heights[top - 2]:
+                with nogil:
+                    self.nodes[top - 2] = self.combine(self.nodes[top - 1], self.nodes[top - 2])
+                self.nodes[top - 1] = NULL
+                heights[top - 2] += 1
+                top -= 1
+            self.check(True, self.compiled == self.count and top == 1)
+        while top >= 2:
+            with nogil:
+                self.nodes[top - 2] = self.combine(self.nodes[top - 1], self.nodes[top - 2])
+            self.nodes[top - 1] = NULL
+            top -= 1
+            self.check(False, top == 1)
+        return 0
+
+    cdef int compile_bucket(self, sddapi_c.SddNode* one) except -1:
+        # Every clause is assigned to the vtree node that is the lca of its literals. The vtree is traversed
+        # in post-order and the result for a vtree node combines its clauses with the results of its children.
+        # The schedule is fixed before compilation, a vtree search during compilation does not change it.
+        cdef sddapi_c.Vtree* root = sddapi_c.sdd_manager_vtree(self.manager)
+        cdef sddapi_c.Vtree* vtree
+        cdef sddapi_c.SddNode* node
+        cdef Py_ssize_t nb_vtrees = 2 * sddapi_c.sdd_manager_var_count(self.manager) - 1
+        cdef Py_ssize_t j, k, child
+        cdef sddapi_c.SddSize i
+        cdef compiler_c.LitSet* litset
+        postorder, children, index = [], [], {}
+        stack = [(<size_t>root, False)]
+        while stack:
+            address, expanded = stack.pop()
+            vtree = <sddapi_c.Vtree*><size_t>address
+            if expanded or sddapi_c.sdd_vtree_is_leaf(vtree):
+                index[address] = len(postorder)
+                postorder.append(address)
+                children.append([] if sddapi_c.sdd_vtree_is_leaf(vtree) else
+                                [index[<size_t>sddapi_c.sdd_vtree_left(vtree)],
+                                 index[<size_t>sddapi_c.sdd_vtree_right(vtree)]])
+            else:
+                stack.append((address, True))
+                stack.append((<size_t>sddapi_c.sdd_vtree_right(vtree), False))
+                stack.append((<size_t>sddapi_c.sdd_vtree_left(vtree), False))
+        buckets = [[] for _ in range(nb_vtrees)]
+        for i in range(self.count):
+            litset = self.litsets[i]
+            vtree = sddapi_c.sdd_manager_lca_of_literals(litset.literal_count, litset.literals, self.manager)
+            buckets[index[<size_t>vtree]].append(<size_t>litset)
+        i = 0
+        for bucket in buckets:
+            for address in bucket:
+                self.litsets[i] = <compiler_c.LitSet*><size_t>address
+                i += 1
+        # nodes[0] is the result for the root, the result for vtree node j is in nodes[j + 1]
+        self.alloc_nodes(nb_vtrees + 1)
+        for j in range(nb_vtrees):
+            self.nodes[0] = one
+            for k in range(len(buckets[j])):
+                node = self.next_clause()
+                with nogil:
+                    self.nodes[0] = self.combine(node, self.nodes[0])
+                self.check(True, self.compiled == self.count and j == nb_vtrees - 1 and len(children[j]) == 0)
+            for k, child in enumerate(children[j]):
+                with nogil:
+                    self.nodes[0] = self.combine(self.nodes[child + 1], self.nodes[0])
+                self.nodes[child + 1] = NULL
+                self.check(False, j == nb_vtrees - 1 and k == len(children[j]) - 1)
+            if j < nb_vtrees - 1:
+                self.nodes[j + 1] = self.nodes[0]
+                self.nodes[0] = NULL
+        return 0
+
+
 @cython.embedsignature(True)
 cdef class Vtree:
     """Returns a vtree over a given number of variables.
@@ -1280,6 +2538,74 @@ cdef class Vtree:
         return rvtree
 
 
+    def to_arrays(self):
+        """Export the vtree rooted at this node to flat arrays, indexed by in-order position.
+
+        :return: VtreeArrays
+        """
+        _require_numpy()
+        cdef sddapi_c.Vtree* node = self._vtree
+        cdef sddapi_c.Vtree* child
+        cdef Py_ssize_t nb_nodes = 2 * sddapi_c.sdd_vtree_var_count(self._vtree) - 1
+        cdef Py_ssize_t depth = 0
+        cdef Py_ssize_t i, offset
+        cdef int64_t[::1] left_v, right_v, parent_v, var_v
+        while not sddapi_c.sdd_vtree_is_leaf(node):
+            node = sddapi_c.sdd_vtree_left(node)
+        offset = sddapi_c.sdd_vtree_position(node)
+        left = np.full(nb_nodes, -1, dtype=np.int64)
+        right = np.full(nb_nodes, -1, dtype=np.int64)
+        parent = np.full(nb_nodes, -1, dtype=np.int64)
+        var = np.zeros(nb_nodes, dtype=np.int64)
+        left_v, right_v, parent_v, var_v = left, right, parent, var
+        cdef sddapi_c.Vtree** stack = <sddapi_c.Vtree**> malloc(nb_nodes * sizeof(sddapi_c.Vtree*))
+        if stack == NULL:
+            raise MemoryError("Could not allocate traversal buffer")
+        stack[0] = self._vtree
+        while depth >= 0:
+            node = stack[depth]
+            depth -= 1
+            i = sddapi_c.sdd_vtree_position(node) - offset
+            if sddapi_c.sdd_vtree_is_leaf(node):
+                var_v[i] = sddapi_c.sdd_vtree_var(node)
+                continue
+            child = sddapi_c.sdd_vtree_left(node)
+            left_v[i] = sddapi_c.sdd_vtree_position(child) - offset
+            parent_v[left_v[i]] = i
+            depth += 1
+            stack[depth] = child
+            child = sddapi_c.sdd_vtree_right(node)
+            right_v[i] = sddapi_c.sdd_vtree_position(child) - offset
+            parent_v[right_v[i]] = i
+            depth += 1
+            stack[depth] = child
+        free(stack)
+        return VtreeArrays(left, right, parent, var, sddapi_c.sdd_vtree_position(self._vtree) - offset, offset)
+
+    @staticmethod
+    def from_arrays(vtree_arrays):
+        """Create a vtree from flat arrays, the inverse of ``to_arrays``.
+
+        :param vtree_arrays: VtreeArrays
+        :return: Vtree, with in-order positions as in the arrays (without offset)
+        """
+        left, right, var = vtree_arrays.left, vtree_arrays.right, vtree_arrays.var
+        lines = []
+        stack = [(vtree_arrays.root, False)]
+        while stack:
+            v, expanded = stack.pop()
+            if left[v] < 0:
+                lines.append(f"L {v} {var[v]}")
+            elif expanded:
+                lines.append(f"I {v} {left[v]} {right[v]}")
+            else:
+                stack += [(v, True), (right[v], False), (left[v], False)]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            filename = os.path.join(tmpdirname, "vtree.vtree")
+            with open(filename, "w") as ofile:
+                ofile.write(f"vtree {len(lines)}\n" + "\n".join(lines) + "\n")
+            return Vtree(filename=filename)
+
     ## Size and Count (Sec 5.3.2)
 
     def size(self):
@@ -1471,7 +2797,11 @@ cdef class Vtree:
         """Performs local garbage collection on vtree and then tries to minimize the size of the SDD of
         vtree by searching for a different vtree. Returns the root of the resulting vtree.
         """
-        return Vtree.wrap(sddapi_c.sdd_vtree_minimize(self._vtree, manager._sddmanager))
+        cdef sddapi_c.Vtree* rvtree
+        with _vtree_search_lock:
+            with nogil:
+                rvtree = sddapi_c.sdd_vtree_minimize(self._vtree, manager._sddmanager)
+        return Vtree.wrap(rvtree)
 
     def init_vtree_size_limit(self, SddManager manager):
         """Declares the size s of current SDD for vtree as the reference size for the relative size limit l.
@@ -1515,6 +2845,12 @@ cdef class WmcManager:
     """
     cdef sddapi_c.WmcManager* _wmcmanager
     cdef public SddNode node
+    cdef readonly bint log_mode
+    cdef long _var_count  # Number of variables in the manager when the WMC manager was created
+    cdef object _circuit
+    cdef object _incremental
+    cdef list _undo  # Previous weights, as (literal, weight) pairs
+    cdef list _undo_marks
 
     ## Weighted Model Counting (Sec 5.6)
 
@@ -1524,6 +2860,12 @@ cdef class WmcManager:
     def __cinit__(self, SddNode node, bint log_mode=1):
         self._wmcmanager = sddapi_c.wmc_manager_new(node._sddnode, log_mode, node._manager._sddmanager)
         self.node = node
+        self.log_mode = log_mode
+        self._var_count = sddapi_c.sdd_manager_var_count(node._manager._sddmanager)
+        self._circuit = None
+        self._incremental = None
+        self._undo = []
+        self._undo_marks = []
         node._manager.set_prevent_transformation(prevent=True)
         if self._wmcmanager is NULL:
             raise MemoryError()
@@ -1546,8 +2888,41 @@ cdef class WmcManager:
         """Returns the weighted model count of the SDD underlying the WMC manager (using the current literal weights).
 
         This function should be called each time the weights of literals are changed.
+        The GIL is released during propagation (see pysdd.parallel.propagate_many).
         """
-        return sddapi_c.wmc_propagate(self._wmcmanager)
+        cdef sddapi_c.SddWmc result
+        _wmc_mode_lock.acquire(self.log_mode)
+        try:
+            with nogil:
+                result = sddapi_c.wmc_propagate(self._wmcmanager)
+        finally:
+            _wmc_mode_lock.release()
+        return result
+
+    def circuit(self):
+        """Returns the array based evaluation structure (pysdd.circuit.Circuit) for the SDD of this manager.
+
+        The structure is created on first use and shared by all batched computations.
+        """
+        _require_numpy()
+        if self._circuit is None:
+            from .circuit import Circuit
+            manager = self.node._manager
+            self._circuit = Circuit(self.node.to_arrays(), manager.vtree().to_arrays())
+        return self._circuit
+
+    def propagate_batch(self, weights):
+        """Returns the weighted model count for every row in a matrix of literal weights.
+
+        This is equivalent to calling set_literal_weights_from_array and propagate for every row, but
+        all rows are evaluated together in one bottom-up pass over the SDD. The literal weights stored in
+        this manager are not used nor changed.
+
+        :param weights: Array of size <nb_queries>x<nb_literals>*2, every row represents
+            literals [-3, -2, -1, 1, 2, 3] (natural logs in log-mode)
+        :return: Array of size <nb_queries> with weighted model counts
+        """
+        return self.circuit().wmc(weights, self.log_mode)
 
     def set_literal_weight(self, literal, sddapi_c.SddWmc weight):
         """Set weight of literal.
@@ -1558,22 +2933,130 @@ cdef class WmcManager:
         set_literal_weights_from_array.
         """
         cdef sddapi_c.SddLiteral literal_c = self._extract_literal(literal)
-        sddapi_c.wmc_set_literal_weight(literal_c, weight, self._wmcmanager)
+        self._set_literal_weight(literal_c, weight)
+
+    cdef _set_literal_weight(self, sddapi_c.SddLiteral literal, sddapi_c.SddWmc weight):
+        if self._undo_marks:
+            self._undo.append((literal, sddapi_c.wmc_literal_weight(literal, self._wmcmanager)))
+        sddapi_c.wmc_set_literal_weight(literal, weight, self._wmcmanager)
+        if self._incremental is not None:
+            self._incremental.set_literal_weight(literal, weight)
+
+    def push_weights(self):
+        """Remember the current literal weights, such that they can be restored with pop_weights.
+
+        Calls can be nested. Only the weights that are changed afterwards are stored.
+        """
+        self._undo_marks.append(len(self._undo))
+
+    def pop_weights(self):
+        """Restore the literal weights to the state of the matching push_weights call."""
+        if not self._undo_marks:
+            raise IndexError("pop_weights without matching push_weights")
+        cdef Py_ssize_t mark = self._undo_marks.pop()
+        while len(self._undo) > mark:
+            literal, weight = self._undo.pop()
+            sddapi_c.wmc_set_literal_weight(literal, weight, self._wmcmanager)
+            if self._incremental is not None:
+                self._incremental.set_literal_weight(literal, weight)
+
+    def propagate_incremental(self):
+        """Returns the weighted model count of the SDD, recomputing only what changed since the previous call.
+
+        Only the nodes that depend on literals whose weights changed since the previous call are recomputed,
+        which is much faster than propagate for small changes on large SDDs. The literal probabilities and
+        derivatives are not updated, use propagate for those.
+        """
+        if self._incremental is None:
+            from .circuit import IncrementalWmc
+            self._incremental = IncrementalWmc(self.circuit(), self.literal_weights_array(), self.log_mode)
+        return self._incremental.propagate()
+
+    def query_evidence(self, evidence):
+        """Probability of the evidence and posterior marginals, for multiple sets of evidence.
+
+        The evidence is applied on top of the current literal weights, the literal weights
+        in the manager are not changed. All evidence sets are processed together in a batched
+        upward and downward pass over the SDD.
+
+        :param evidence: Array of size <nb_queries>x<nb_vars> with -1 (negative), 0 (unobserved)
+            or 1 (positive) for every variable
+        :return: Tuple with an array of size <nb_queries> with the probability of the evidence
+            (normalized by the weighted model count without evidence) and an array of size
+            <nb_queries>x<nb_vars> with the probability of every positive literal given the evidence.
+        """
+        return self.circuit().evidence(evidence, self.literal_weights_array(), self.log_mode)
+
+    def mpe(self, evidence=None):
+        """Most probable explanation: the complete assignment with the largest weight, given the evidence.
+
+        Uses the current literal weights. The weight of an assignment is the product of its literal weights.
+
+        :param evidence: Array of size <nb_vars> with -1 (negative), 0 (unobserved) or 1 (positive)
+            for every variable, or None
+        :return: Tuple with an array of size <nb_vars> with values 0 and 1 and the natural logarithm of the weight
+            of the assignment. If the evidence is inconsistent, the log-weight is -inf and the array contains -1.
+        """
+        _require_numpy()
+        if evidence is not None:
+            evidence = np.asarray(evidence).reshape(1, -1)
+        assignments, log_weights = self.circuit().mpe(evidence, self.literal_weights_array(), self.log_mode)
+        return assignments[0], log_weights[0]
+
+    def mpe_batch(self, evidence):
+        """Most probable explanation for multiple sets of evidence, see ``mpe``.
 
-    def set_literal_weights_from_array(self, double[:] weights):
+        All evidence sets are processed together in a batched max-product upward pass over the SDD.
+
+        :param evidence: Array of size <nb_queries>x<nb_vars> with -1 (negative), 0 (unobserved)
+            or 1 (positive) for every variable
+        :return: Tuple with an array of size <nb_queries>x<nb_vars> with the assignments and an array of
+            size <nb_queries> with their log-weights
+        """
+        _require_numpy()
+        return self.circuit().mpe(evidence, self.literal_weights_array(), self.log_mode)
+
+    def set_literal_weights_from_array(self, weights):
         """Set all literal weights.
 
-        Expects an array of size <nb_literals>*2 which represents literals [-3, -2, -1, 1, 2, 3]
+        Expects an array of size <nb_literals>*2 which represents literals [-3, -2, -1, 1, 2, 3],
+        or an array of size 2x<nb_literals> where the first row represents literals [-3, -2, -1]
+        and the second row literals [1, 2, 3] (e.g. ``literal_weights_array().reshape(2, -1)``).
         """
-        if len(weights) > 2 * self.node._manager.var_count():
+        if getattr(weights, "ndim", 1) == 2:
+            self._set_literal_weights_2d(weights)
+        else:
+            self._set_literal_weights_1d(weights)
+
+    cdef _set_literal_weights_1d(self, double[:] weights):
+        if weights.shape[0] > 2 * self._var_count:
             raise Exception("Array of weights is longer than the number of variables in the manager.")
-        cdef long nb_lits = len(weights) / 2  # The array can be shorter than the number of variables
-        cdef sddapi_c.SddLiteral lit
+        cdef long nb_lits = weights.shape[0] // 2  # The array can be shorter than the number of variables
         cdef long i
-        for i in range(nb_lits):
-            sddapi_c.wmc_set_literal_weight(i - nb_lits, weights[i], self._wmcmanager)
-        for i in range(nb_lits, 2*nb_lits):
-            sddapi_c.wmc_set_literal_weight(i - nb_lits + 1, weights[i], self._wmcmanager)
+        if self._incremental is not None or len(self._undo_marks) > 0:
+            for i in range(nb_lits):
+                self._set_literal_weight(i - nb_lits, weights[i])
+                self._set_literal_weight(i + 1, weights[nb_lits + i])
+        else:
+            for i in range(nb_lits):
+                sddapi_c.wmc_set_literal_weight(i - nb_lits, weights[i], self._wmcmanager)
+                sddapi_c.wmc_set_literal_weight(i + 1, weights[nb_lits + i], self._wmcmanager)
+
+    cdef _set_literal_weights_2d(self, double[:, :] weights):
+        if weights.shape[0] != 2:
+            raise ValueError("Expected an array with two rows (negative and positive literals).")
+        if weights.shape[1] > self._var_count:
+            raise Exception("Array of weights is longer than the number of variables in the manager.")
+        cdef long nb_lits = weights.shape[1]
+        cdef long i
+        if self._incremental is not None or len(self._undo_marks) > 0:
+            for i in range(nb_lits):
+                self._set_literal_weight(i - nb_lits, weights[0, i])
+                self._set_literal_weight(i + 1, weights[1, i])
+        else:
+            for i in range(nb_lits):
+                sddapi_c.wmc_set_literal_weight(i - nb_lits, weights[0, i], self._wmcmanager)
+                sddapi_c.wmc_set_literal_weight(i + 1, weights[1, i], self._wmcmanager)
 
     def literal_weight(self, literal):
         """Returns the weight of a literal."""
@@ -1596,12 +3079,56 @@ cdef class WmcManager:
         cdef sddapi_c.SddLiteral literal_c = self._extract_literal(literal)
         return sddapi_c.wmc_literal_pr(literal_c, self._wmcmanager)
 
+    def literal_weights_array(self):
+        """Returns the weights of all literals.
+
+        :return: Array of size <nb_literals>*2 which represents literals [-3, -2, -1, 1, 2, 3]
+            (see set_literal_weights_from_array)
+        """
+        return self._literal_array(0)
+
+    def literal_derivative_array(self):
+        """Returns the partial derivatives of the weighted model count with respect to the weights of all literals.
+
+        The result returned by this function is meaningful only after having called wmc propagate.
+
+        :return: Array of size <nb_literals>*2 which represents literals [-3, -2, -1, 1, 2, 3]
+        """
+        return self._literal_array(1)
+
+    def literal_pr_array(self):
+        """Returns the probabilities of all literals.
+
+        The result returned by this function is meaningful only after having called wmc propagate.
+
+        :return: Array of size <nb_literals>*2 which represents literals [-3, -2, -1, 1, 2, 3]
+        """
+        return self._literal_array(2)
+
+    cdef _literal_array(self, int which):
+        _require_numpy()
+        cdef sddapi_c.SddLiteral var_count = sddapi_c.sdd_manager_var_count(self.node._manager._sddmanager)
+        cdef sddapi_c.SddLiteral i, lit
+        result = np.empty(2 * var_count, dtype=np.float64)
+        cdef double[::1] result_v = result
+        for i in range(2 * var_count):
+            lit = i - var_count if i < var_count else i - var_count + 1
+            if which == 0:
+                result_v[i] = sddapi_c.wmc_literal_weight(lit, self._wmcmanager)
+            elif which == 1:
+                result_v[i] = sddapi_c.wmc_literal_derivative(lit, self._wmcmanager)
+            else:
+                result_v[i] = sddapi_c.wmc_literal_pr(lit, self._wmcmanager)
+        return result
+
 
     ## Auxiliary
 
     def _extract_literal(self, literal):
         cdef sddapi_c.SddLiteral literal_c
-        if isinstance(literal, SddNode):
+        if type(literal) is int:
+            literal_c = literal
+        elif isinstance(literal, SddNode):
             if literal.is_literal():
                 literal_c = literal.literal
             else:
@@ -1626,17 +3153,21 @@ cdef class CompilerOptions:
     cdef public int vtree_search_mode
     cdef public int post_search
     cdef public int verbose
+    cdef public object clause_order
+    cdef public object combination
 
     def __init__(self, cnf_filename = None, dnf_filename = None, vtree_filename = None, sdd_filename = None,
                   output_vtree_filename = None, output_vtree_dot_filename = None, output_sdd_filename = None,
                   output_sdd_dot_filename = None, initial_vtree_type = "balanced".encode(),
-                  minimize_cardinality = 0, vtree_search_mode = -1, post_search = 0, verbose = 0):
+                  minimize_cardinality = 0, vtree_search_mode = -1, post_search = 0, verbose = 0,
+                  clause_order = "vtree", combination = "linear"):
         pass
 
     def __cinit__(self, cnf_filename = None, dnf_filename = None, vtree_filename = None, sdd_filename = None,
                   output_vtree_filename = None, output_vtree_dot_filename = None, output_sdd_filename = None,
                   output_sdd_dot_filename = None, initial_vtree_type = "balanced".encode(),
-                  minimize_cardinality = 0, vtree_search_mode = -1, post_search = 0, verbose = 0):
+                  minimize_cardinality = 0, vtree_search_mode = -1, post_search = 0, verbose = 0,
+                  clause_order = "vtree", combination = "linear"):
         self.cnf_filename = cnf_filename
         self.dnf_filename = dnf_filename
         self.vtree_filename = vtree_filename
@@ -1650,6 +3181,8 @@ cdef class CompilerOptions:
         self.vtree_search_mode = vtree_search_mode
         self.post_search = post_search
         self.verbose = verbose
+        self.clause_order = clause_order
+        self.combination = combination
 
     def copy_options_to_c(self):
         if self.cnf_filename is None:
@@ -1704,4 +3237,6 @@ cdef class CompilerOptions:
         r += "  vtree_search_mode: " + str(self.vtree_search_mode) + "\n"
         r += "  post_search: " + str(self.post_search) + "\n"
         r += "  verbose: " + str(self.verbose) + "\n"
+        r += "  clause_order: " + str(self.clause_order) + "\n"
+        r += "  combination: " + str(self.combination) + "\n"
         return r
@@ -80,11 +80,11 @@ cdef extern from "sddapi.h":
     SddNode* sdd_manager_literal(const SddLiteral literal, SddManager* manager);
 
     #// SDD QUERIES AND TRANSFORMATIONS
-    SddNode* sdd_apply(SddNode* node1, SddNode* node2, BoolOp op, SddManager* manager);
+    SddNode* sdd_apply(SddNode* node1, SddNode* node2, BoolOp op, SddManager* manager) nogil;
     SddNode* sdd_apply_in_vtree(SddNode* node1, SddNode* node2, BoolOp op, Vtree* vtree, SddManager* manager);
-    SddNode* sdd_conjoin(SddNode* node1, SddNode* node2, SddManager* manager);
-    SddNode* sdd_disjoin(SddNode* node1, SddNode* node2, SddManager* manager);
-    SddNode* sdd_negate(SddNode* node, SddManager* manager);
+    SddNode* sdd_conjoin(SddNode* node1, SddNode* node2, SddManager* manager) nogil;
+    SddNode* sdd_disjoin(SddNode* node1, SddNode* node2, SddManager* manager) nogil;
+    SddNode* sdd_negate(SddNode* node, SddManager* manager) nogil;
     SddNode* sdd_condition(SddLiteral lit, SddNode* node, SddManager* manager);
     SddNode* sdd_exists(SddLiteral var, SddNode* node, SddManager* manager);
     SddNode* sdd_exists_multiple(int* exists_map, SddNode* node, SddManager* manager);
@@ -94,8 +94,8 @@ cdef extern from "sddapi.h":
     SddNode* sdd_minimize_cardinality(SddNode* node, SddManager* manager);
     SddNode* sdd_global_minimize_cardinality(SddNode* node, SddManager* manager);
     SddLiteral sdd_minimum_cardinality(SddNode* node);
-    SddModelCount sdd_model_count(SddNode* node, SddManager* manager);
-    SddModelCount sdd_global_model_count(SddNode* node, SddManager* manager);
+    SddModelCount sdd_model_count(SddNode* node, SddManager* manager) nogil;
+    SddModelCount sdd_global_model_count(SddNode* node, SddManager* manager) nogil;
 
     #// SDD NAVIGATION
     int sdd_node_is_true(SddNode* node);
@@ -196,17 +196,17 @@ cdef extern from "sddapi.h":
 
     #// GARBAGE COLLECTION
     SddRefCount sdd_ref_count(SddNode* node);
-    SddNode* sdd_ref(SddNode* node, SddManager* manager);
-    SddNode* sdd_deref(SddNode* node, SddManager* manager);
+    SddNode* sdd_ref(SddNode* node, SddManager* manager) nogil;
+    SddNode* sdd_deref(SddNode* node, SddManager* manager) nogil;
     void sdd_manager_garbage_collect(SddManager* manager);
     void sdd_vtree_garbage_collect(Vtree* vtree, SddManager* manager);
     int sdd_manager_garbage_collect_if(float dead_node_threshold, SddManager* manager);
     int sdd_vtree_garbage_collect_if(float dead_node_threshold, Vtree* vtree, SddManager* manager);
 
     #// MINIMIZATION
-    void sdd_manager_minimize(SddManager* manager);
-    Vtree* sdd_vtree_minimize(Vtree* vtree, SddManager* manager);
-    void sdd_manager_minimize_limited(SddManager* manager);
+    void sdd_manager_minimize(SddManager* manager) nogil;
+    Vtree* sdd_vtree_minimize(Vtree* vtree, SddManager* manager) nogil;
+    void sdd_manager_minimize_limited(SddManager* manager) nogil;
     Vtree* sdd_vtree_minimize_limited(Vtree* vtree, SddManager* manager);
 
     void sdd_manager_set_vtree_search_convergence_threshold(float threshold, SddManager* manager);
@@ -223,9 +223,22 @@ cdef extern from "sddapi.h":
     WmcManager* wmc_manager_new(SddNode* node, int log_mode, SddManager* manager);
     void wmc_manager_free(WmcManager* wmc_manager);
     void wmc_set_literal_weight(const SddLiteral literal, const SddWmc weight, WmcManager* wmc_manager);
-    SddWmc wmc_propagate(WmcManager* wmc_manager);
+    SddWmc wmc_propagate(WmcManager* wmc_manager) nogil;
     SddWmc wmc_zero_weight(WmcManager* wmc_manager);
     SddWmc wmc_one_weight(WmcManager* wmc_manager);
     SddWmc wmc_literal_weight(const SddLiteral literal, const WmcManager* wmc_manager);
     SddWmc wmc_literal_derivative(const SddLiteral literal, const WmcManager* wmc_manager);
     SddWmc wmc_literal_pr(const SddLiteral literal, const WmcManager* wmc_manager);
+
+
+# Functions of the SDD library that are not in sddapi.h. These are used by sdd_read to construct
+# a decision node from a compressed and trimmed partition for a given vtree node.
+cdef extern from *:
+    """
+    void START_partition(SddManager* manager);
+    void DECLARE_element(SddNode* prime, SddNode* sub, Vtree* vtree, SddManager* manager);
+    SddNode* GET_node_of_partition(Vtree* vtree, SddManager* manager, int limited);
+    """
+    void START_partition(SddManager* manager)
+    void DECLARE_element(SddNode* prime, SddNode* sub, Vtree* vtree, SddManager* manager)
+    SddNode* GET_node_of_partition(Vtree* vtree, SddManager* manager, int limited)
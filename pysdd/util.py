@@ -9,19 +9,34 @@ Utility functions on top of the ``sdd`` package.
 :copyright: Copyright 2017-2019 KU Leuven and Regents of the University of California.
 :license: Apache License, Version 2.0, see LICENSE for details.
 """
+import gzip
+import json
+import lzma
 import math
-from .sdd import SddNode, SddManager, Vtree
+import mmap
+import os
+import struct
+from .sdd import SddNode, SddManager, Vtree, Fnf, SddArrays, VtreeArrays, FnfArrays, NodeKind
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 MYPY = False
 if MYPY:
     # from .sdd import Vtree
     from typing import List, Optional, Dict, Set, Union, Tuple
+    from pathlib import Path
     LitNameMap = Dict[Union[int, str], str]
 
 
 node_count = 0
 
+# Number of bytes that are tokenized at once when parsing files
+PARSE_CHUNK = 1 << 22
+
 
 def sdd_to_dot(node, litnamemap=None, show_id=False, merge_leafs=False):
     # type: (Union[SddNode, SddManager], Optional[LitNameMap], bool, bool) -> str
@@ -193,12 +208,644 @@ def _vtree_to_dot_int(vtree, mgr, litnamemap=None, show_id=False):
     return s
 
 
+def _require_numpy():
+    if np is None:
+        raise ImportError("This functionality requires NumPy (pip install numpy)")
+
+
+def _line_error(filename, line, message):
+    return ValueError(f"{filename}, line {line}: {message}")
+
+
+def _chunk_lines(buf, first_line):
+    """Start, end and number of every line in a chunk."""
+    line_ends = np.flatnonzero(buf == ord("\n"))
+    if len(line_ends) == 0 or line_ends[-1] != len(buf) - 1:
+        line_ends = np.append(line_ends, len(buf))
+    line_starts = np.zeros(len(line_ends), dtype=np.int64)
+    line_starts[1:] = line_ends[:-1] + 1
+    return line_starts, line_ends, first_line + np.arange(len(line_ends))
+
+
+def _blank_lines(buf, line_starts, line_ends, lines):
+    """Overwrite the selected lines with spaces, in place."""
+    if np.any(lines):
+        blank = np.zeros(len(buf) + 1, dtype=np.int64)
+        np.add.at(blank, line_starts[lines], 1)
+        np.add.at(blank, line_ends[lines], -1)
+        buf[np.cumsum(blank[:-1]) > 0] = ord(" ")
+
+
+def _token_starts(space):
+    """Start of every token, given a mask of the whitespace in a chunk."""
+    token_starts = np.flatnonzero(~space[1:] & space[:-1]) + 1
+    if len(space) > 0 and not space[0]:
+        token_starts = np.insert(token_starts, 0, 0)
+    return token_starts
+
+
+def _chunk_integers(buf, line_ends, filename, first_line):
+    """Parse a chunk that contains only integers and whitespace.
+
+    :return: Tuple with the integers and the start of every integer in the chunk
+    """
+    padded = np.append(buf, np.uint8(ord("\n")))
+    bad = (buf > 32) & ((buf - ord("0")) > 9) & (buf != ord("-"))
+    minus = np.flatnonzero(buf == ord("-"))
+    bad[minus[(padded[minus + 1] - ord("0") > 9) | ((minus > 0) & (buf[minus - 1] > 32))]] = True
+    if np.any(bad):
+        raise _line_error(filename, first_line + np.searchsorted(line_ends, np.argmax(bad)), "Expected an integer")
+    token_starts = _token_starts(buf <= 32)
+    if len(token_starts) == 0:
+        values = np.zeros(0, dtype=np.int64)
+    else:
+        values = np.fromstring(buf.tobytes(), dtype=np.int64, sep=" ")
+    too_large = (values == np.iinfo(np.int64).max) | (values == np.iinfo(np.int64).min)
+    if len(values) != len(token_starts) or np.any(too_large):
+        raise _line_error(filename, first_line + np.searchsorted(line_ends, token_starts[np.argmax(too_large)]),
+                          "Integer is too large")
+    return values, token_starts
+
+
+def _tokenize_chunk(buf, filename, first_line):
+    """Tokenize a chunk of lines with a one-letter type followed by integers.
+
+    Lines of type 'c' (comments) are skipped. The types and comments are blanked out in place, after
+    which all integers are parsed at once by NumPy. No Python objects are created per line.
+
+    :param buf: Writable uint8 array with complete lines
+    :param first_line: Line number of the first line in the chunk
+    :return: Tuple with the type of every line, the number of integers on every line, the integers,
+        and the line numbers
+    """
+    line_starts, line_ends, line_numbers = _chunk_lines(buf, first_line)
+    padded = np.append(buf, np.uint8(ord("\n")))
+    types = padded[line_starts]
+    comments = types == ord("c")
+    keep = (types > 32) & ~comments
+    bad = keep & (padded[line_starts + 1] > 32)
+    if np.any(bad):
+        raise _line_error(filename, line_numbers[np.argmax(bad)], "Expected a line type of one letter")
+    _blank_lines(buf, line_starts, line_ends, comments)
+    buf[line_starts[keep]] = ord(" ")
+    # Only integers remain
+    values, token_starts = _chunk_integers(buf, line_ends, filename, first_line)
+    counts = np.searchsorted(token_starts, line_ends) - np.searchsorted(token_starts, line_starts)
+    bad = ~keep & (counts > 0)  # Lines that do not start with a type
+    if np.any(bad):
+        raise _line_error(filename, line_numbers[np.argmax(bad)], "Expected a line type of one letter")
+    return types[keep], counts[keep], values, line_numbers[keep]
+
+
+def _parse_file(filename, header, chunk_size=PARSE_CHUNK):
+    """Parse a file with a header line and lines with a one-letter type followed by integers.
+
+    The file is memory-mapped and tokenized in chunks of complete lines.
+
+    :param header: Expected first word of the header line, the first line that is not a comment
+    :return: Tuple with the integers on the header line, the type of every line, the offsets of the
+        integers of every line, the integers, and the line numbers
+    """
+    _require_numpy()
+    types, counts, values, line_numbers = [], [], [], []
+    with open(filename, "rb") as ifile:
+        if ifile.seek(0, 2) == 0:
+            raise ValueError(f"{filename}: Expected a file starting with '{header}'")
+        with mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            line = 0
+            fields = []
+            while len(fields) == 0 or fields[0] == b"c":
+                if mm.tell() == len(mm):
+                    raise ValueError(f"{filename}: Expected a file starting with '{header}'")
+                fields = mm.readline().split()
+                line += 1
+            if fields[0] != header.encode():
+                raise _line_error(filename, line, f"Expected a file starting with '{header}'")
+            try:
+                header_values = [int(field) for field in fields[1:]]
+            except ValueError:
+                raise _line_error(filename, line, "Expected integers in the header") from None
+            start = mm.tell()
+            while start < len(mm):
+                end = min(start + chunk_size, len(mm))
+                if end < len(mm):
+                    newline = mm.rfind(b"\n", start, end)
+                    if newline < 0:
+                        newline = mm.find(b"\n", end)
+                    end = len(mm) if newline < 0 else newline + 1
+                # Writable copy of the chunk, a view would also keep the map from being closed after an error
+                buf = np.array(np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start))
+                for result, part in zip((types, counts, values, line_numbers),
+                                        _tokenize_chunk(buf, filename, line + 1)):
+                    result.append(part)
+                line += int(np.count_nonzero(buf == ord("\n")))
+                start = end
+    types = np.concatenate(types) if types else np.zeros(0, dtype=np.uint8)
+    counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+    values = np.concatenate(values) if values else np.zeros(0, dtype=np.int64)
+    line_numbers = np.concatenate(line_numbers) if line_numbers else np.zeros(0, dtype=np.int64)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return header_values, types, offsets, values, line_numbers
+
+
+def _check_lines(filename, bad, line_numbers, message):
+    if np.any(bad):
+        raise _line_error(filename, line_numbers[np.argmax(bad)], message)
+
+
+def _repeat_ranges(starts, counts, step=1):
+    """Concatenation of the ranges starts[i], starts[i] + step, ... with counts[i] values."""
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - step * offsets, counts) + step * np.arange(counts.sum())
+
+
+def read_sdd_arrays(filename, chunk_size=PARSE_CHUNK):
+    # type: (Union[str, Path], int) -> SddArrays
+    """Read an SDD file (as written by ``SddManager.save``) into flat arrays.
+
+    The file is memory-mapped and parsed with vectorized operations, without creating Python objects
+    per line. The nodes are numbered in the order of the file (children before parents) and the node
+    on the last line is the root. The arrays can be evaluated without an SddManager with
+    ``pysdd.circuit.Circuit``, e.g. for many weight vectors at once with ``Circuit(arrays).wmc(weights)``.
+
+    :param filename: Path to the SDD file
+    :param chunk_size: Number of bytes that are parsed at once
+    :return: SddArrays, var_count is the largest variable in the file
+    """
+    header, types, offsets, values, line_numbers = _parse_file(filename, "sdd", chunk_size)
+    nb_nodes = len(types)
+    if len(header) != 1 or header[0] != nb_nodes:
+        raise ValueError(f"{filename}: Expected 'sdd {nb_nodes}' as header")
+    if nb_nodes == 0:
+        raise ValueError(f"{filename}: Expected at least one node")
+    kind_of_type = np.full(256, -1, dtype=np.int8)
+    for letter, node_kind in zip("FTLD", (NodeKind.FALSE_NODE, NodeKind.TRUE_NODE,
+                                          NodeKind.LITERAL_NODE, NodeKind.DECISION_NODE)):
+        kind_of_type[ord(letter)] = node_kind
+    kind = kind_of_type[types]
+    _check_lines(filename, kind < 0, line_numbers, "Expected a line of type F, T, L or D")
+    counts = np.diff(offsets)
+    is_decision = kind == NodeKind.DECISION_NODE
+    expected = np.array([1, 1, 3, 3])[kind]
+    _check_lines(filename, counts < expected, line_numbers, "Expected more integers")
+    nb_elements = np.zeros(nb_nodes, dtype=np.int64)
+    nb_elements[is_decision] = values[offsets[:-1][is_decision] + 2]
+    _check_lines(filename, (nb_elements < 0) | (counts != expected + 2 * nb_elements), line_numbers,
+                 "Expected a different number of integers")
+    # Map the node ids to the line order
+    ids = values[offsets[:-1]]
+    _check_lines(filename, ids < 0, line_numbers, "Expected a non-negative node id")
+    index = np.full(ids.max() + 2, -1, dtype=np.int64)  # Last entry is used for unknown ids
+    index[ids] = np.arange(nb_nodes)
+    _check_lines(filename, index[ids] != np.arange(nb_nodes), line_numbers, "Duplicate node id")
+    is_literal = kind == NodeKind.LITERAL_NODE
+    literal = np.zeros(nb_nodes, dtype=np.int64)
+    literal[is_literal] = values[offsets[:-1][is_literal] + 2]
+    _check_lines(filename, is_literal & (literal == 0), line_numbers, "Expected a non-zero literal")
+    vtree = np.full(nb_nodes, -1, dtype=np.int64)
+    vtree[is_literal | is_decision] = values[offsets[:-1][is_literal | is_decision] + 1]
+    elem_offsets = np.zeros(nb_nodes + 1, dtype=np.int64)
+    np.cumsum(nb_elements, out=elem_offsets[1:])
+    positions = _repeat_ranges(offsets[:-1] + 3, nb_elements, 2)
+    children = values[np.concatenate([positions, positions + 1])]
+    children = index[np.where((children >= 0) & (children < len(index)), children, -1)]
+    parents = np.tile(np.repeat(np.arange(nb_nodes), nb_elements), 2)
+    bad = np.zeros(nb_nodes, dtype=bool)
+    bad[parents[(children < 0) | (children >= parents)]] = True
+    _check_lines(filename, bad, line_numbers, "Expected the ids of nodes on earlier lines")
+    primes, subs = children[:len(positions)], children[len(positions):]
+    var_count = int(np.abs(literal).max())
+    return SddArrays(kind, literal, vtree, elem_offsets, primes, subs, np.array([nb_nodes - 1]), var_count)
+
+
+def read_nnf_arrays(filename, chunk_size=PARSE_CHUNK):
+    # type: (Union[str, Path], int) -> SddArrays
+    """Read an NNF file (as written by the c2d and d4 compilers) into flat arrays.
+
+    The file is memory-mapped and parsed with vectorized operations, without creating Python objects
+    per line. The NNF is represented as an SDD without vtree (all vtree positions are -1) such that it
+    can be evaluated with ``pysdd.circuit.Circuit``, e.g. for many weight vectors at once with
+    ``Circuit(arrays).wmc(weights)``. Node 0 is a true node. An or-node becomes a decision node with an
+    element (child, true) for every child, an and-node with k > 1 children becomes a chain of k - 1
+    decision nodes with one element each. The evaluation is not smoothed.
+
+    :param filename: Path to the NNF file
+    :param chunk_size: Number of bytes that are parsed at once
+    :return: SddArrays, var_count is the number of variables in the header
+    """
+    header, types, offsets, values, line_numbers = _parse_file(filename, "nnf", chunk_size)
+    nb_lines = len(types)
+    if len(header) != 3 or header[0] != nb_lines:
+        raise ValueError(f"{filename}: Expected 'nnf {nb_lines} nb-edges nb-variables' as header")
+    if nb_lines == 0:
+        raise ValueError(f"{filename}: Expected at least one node")
+    counts = np.diff(offsets)
+    is_literal, is_and, is_or = types == ord("L"), types == ord("A"), types == ord("O")
+    _check_lines(filename, ~(is_literal | is_and | is_or), line_numbers, "Expected a line of type L, A or O")
+    _check_lines(filename, counts < np.where(is_or, 2, 1), line_numbers, "Expected more integers")
+    first = np.where(is_or, 2, 1)  # Position of the first child
+    nb_children = np.zeros(nb_lines, dtype=np.int64)
+    nb_children[~is_literal] = values[offsets[:-1][~is_literal] + first[~is_literal] - 1]
+    _check_lines(filename, (nb_children < 0) | (counts != np.where(is_literal, 1, first + nb_children)),
+                 line_numbers, "Expected a different number of integers")
+    literal = values[offsets[:-1][is_literal]]
+    bad = np.zeros(nb_lines, dtype=bool)
+    bad[is_literal] = literal == 0
+    _check_lines(filename, bad, line_numbers, "Expected a non-zero literal")
+    # Node indices, an and-node with k children is preceded by its k - 2 auxiliary nodes
+    nb_auxiliary = np.where(is_and, np.maximum(nb_children - 2, 0), 0)
+    node = np.cumsum(nb_auxiliary + 1)
+    nb_nodes = int(node[-1]) + 1
+    kind = np.full(nb_nodes, NodeKind.DECISION_NODE, dtype=np.int8)
+    kind[0] = NodeKind.TRUE_NODE
+    kind[node[is_literal]] = NodeKind.LITERAL_NODE
+    kind[node[is_and & (nb_children == 0)]] = NodeKind.TRUE_NODE
+    kind[node[is_or & (nb_children == 0)]] = NodeKind.FALSE_NODE
+    literals = np.zeros(nb_nodes, dtype=np.int64)
+    literals[node[is_literal]] = literal
+    # Elements, in the order of their parents
+    child_line = np.repeat(np.arange(nb_lines), nb_children)
+    child_rank = np.arange(len(child_line)) - np.repeat(np.cumsum(nb_children) - nb_children, nb_children)
+    child = values[_repeat_ranges(offsets[:-1] + first, nb_children)]
+    bad = np.zeros(nb_lines, dtype=bool)
+    bad[child_line[(child < 0) | (child >= child_line)]] = True
+    _check_lines(filename, bad, line_numbers, "Expected the indices of nodes on earlier lines")
+    child = node[child]
+    k = nb_children[child_line]
+    single = is_or[child_line] | (k == 1)  # Element (child, true)
+    keep = single | (child_rank > 0)
+    owner = np.where(single, node[child_line], node[child_line] - k + 1 + child_rank)
+    first_child = child[np.repeat(np.cumsum(nb_children) - nb_children, nb_children)]
+    primes = np.where(single, child, np.where(child_rank == 1, first_child, owner - 1))[keep]
+    subs = np.where(single, 0, child)[keep]
+    elem_offsets = np.zeros(nb_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner[keep], minlength=nb_nodes), out=elem_offsets[1:])
+    var_count = max(header[2], int(np.abs(literal).max(initial=0)))
+    return SddArrays(kind, literals, np.full(nb_nodes, -1, dtype=np.int64), elem_offsets, primes, subs,
+                     np.array([node[-1]]), var_count)
+
+
+def _open_input(filename):
+    """Open a file for reading bytes, gzip and xz compressed files are decompressed transparently."""
+    with open(filename, "rb") as ifile:
+        magic = ifile.read(6)
+    if magic[:2] == b"\x1f\x8b":
+        return gzip.open(filename, "rb")
+    if magic == b"\xfd7zXZ\x00":
+        return lzma.open(filename, "rb")
+    return open(filename, "rb")
+
+
+def read_fnf_arrays(filename, op="cnf", chunk_size=PARSE_CHUNK):
+    # type: (Union[str, Path], str, int) -> FnfArrays
+    """Read a CNF or DNF file in the DIMACS format into flat arrays.
+
+    The file is read and parsed in chunks with vectorized operations, such that the memory that is
+    used is proportional to the number of literals and not to the size of the file. Files that are
+    compressed with gzip or xz are decompressed while reading. As in the reader of the SDD package,
+    the header is "p cnf <var_count> <clause_count>" (also for a DNF), lines starting with 'c' are
+    comments, and the input after the last clause is ignored.
+
+    :param filename: Path to the CNF or DNF file
+    :param op: "cnf" or "dnf"
+    :param chunk_size: Number of bytes that are parsed at once
+    :return: FnfArrays
+    """
+    return _read_fnf(filename, op, chunk_size)
+
+
+def read_weighted_fnf(filename, op="cnf", chunk_size=PARSE_CHUNK):
+    # type: (Union[str, Path], str, int) -> Tuple[Fnf, Optional[np.ndarray]]
+    """Read a CNF or DNF file in the DIMACS format together with the literal weights in the file.
+
+    The clauses and weights are read in one pass (see ``read_fnf_arrays``). The weights can be given as
+
+    - one line "c weights PW_1 NW_1 ... PW_n NW_n" (PySDD),
+    - lines "w <var> <weight>" with the weight of the positive literal, the negative literal has
+      weight 1 - weight, or both have weight 1 if the weight is -1 (Cachet),
+    - lines "c p weight <literal> <weight> 0" (model counting competition).
+
+    Literals without a weight have weight 1.
+
+    :param filename: Path to the CNF or DNF file
+    :param op: "cnf" or "dnf"
+    :param chunk_size: Number of bytes that are parsed at once
+    :return: Tuple with the Fnf and an array with the weights of the literals [-n, ..., -1, 1, ..., n]
+        (see ``WmcManager.set_literal_weights_from_array``), or None if the file contains no weights
+    """
+    weight_lines = []
+    arrays = _read_fnf(filename, op, chunk_size, weight_lines)
+    fnf = Fnf.from_clauses(arrays.literals, arrays.var_count, op, offsets=arrays.offsets)
+    return fnf, _parse_weight_lines(filename, weight_lines, arrays.var_count)
+
+
+def read_weight_line(filename):
+    # type: (Union[str, Path]) -> Optional[np.ndarray]
+    """Read the literal weights on the first line "c weights PW_1 NW_1 ... PW_n NW_n" of a file.
+
+    This line can be added as a comment to any file, e.g. an SDD file (see ``read_weighted_fnf`` for the
+    weights in CNF and DNF files).
+
+    :param filename: Path to the file
+    :return: Array with the weights of the literals [-n, ..., -1, 1, ..., n], or None if there is no such line
+    """
+    _require_numpy()
+    with open(filename, "rb") as ifile:
+        for line_number, line in enumerate(ifile, 1):
+            if line.startswith(b"c weights "):
+                return _parse_weight_lines(filename, [(line_number, line)])
+    return None
+
+
+def _is_weight_line(line):
+    return line.startswith(b"w") or line.startswith(b"c weights ") or line.startswith(b"c p weight ")
+
+
+def _parse_weight_lines(filename, weight_lines, var_count=None):
+    """Literal weights [-n, ..., -1, 1, ..., n] from weight lines in the formats of ``read_weighted_fnf``.
+
+    :param weight_lines: List with tuples of a line number and the line
+    :param var_count: Number of variables, by default the number of weight pairs on a "c weights" line
+    :return: Array with the weights, or None if there are no weight lines
+    """
+    if len(weight_lines) == 0:
+        return None
+    if var_count is None:
+        var_count = max((len(line.split()) - 2 for _, line in weight_lines if line.startswith(b"c weights ")), default=0) // 2
+    weights = np.ones(2 * var_count)
+    for line_number, line in weight_lines:
+        fields = line.split()
+        try:
+            if fields[0] == b"w":
+                var, weight = int(fields[1]), float(fields[2])
+                if len(fields) != 3 or not 1 <= var <= var_count:
+                    raise ValueError
+                if weight != -1:
+                    weights[var_count + var - 1], weights[var_count - var] = weight, 1 - weight
+            elif fields[1] == b"weights":
+                pairs = np.array(fields[2:], dtype=float)
+                if len(pairs) % 2 != 0 or len(pairs) > 2 * var_count:
+                    raise ValueError
+                nb_vars = len(pairs) // 2
+                weights[var_count:var_count + nb_vars] = pairs[0::2]
+                weights[var_count - nb_vars:var_count] = pairs[1::2][::-1]
+            else:
+                literal, weight = int(fields[3]), float(fields[4])
+                if len(fields) not in (5, 6) or fields[5:] not in ([], [b"0"]) \
+                        or literal == 0 or abs(literal) > var_count:
+                    raise ValueError
+                weights[var_count + literal - 1 if literal > 0 else var_count + literal] = weight
+        except (ValueError, IndexError):
+            raise _line_error(filename, line_number, f"Invalid weights for {var_count} variables") from None
+    return weights
+
+
+def _clauses_end(buf, nb_clauses):
+    """End of the first nb_clauses clauses in a chunk, or the end of the chunk if it has fewer clauses.
+
+    The clauses are terminated by tokens that consist of '0' (and '-') characters, the tokens are not parsed.
+    The input after the clauses is thus never parsed, independent of the chunk size.
+    """
+    space = buf <= 32
+    token_starts = _token_starts(space)
+    if len(token_starts) == 0:
+        return len(buf)
+    zeros = np.flatnonzero(~np.logical_or.reduceat(~space & (buf != ord("0")) & (buf != ord("-")), token_starts))
+    if len(zeros) < nb_clauses or zeros[nb_clauses - 1] + 1 == len(token_starts):
+        return len(buf)
+    return token_starts[zeros[nb_clauses - 1] + 1]
+
+
+def _read_fnf(filename, op, chunk_size, weight_lines=None):
+    """Read a DIMACS file, see ``read_fnf_arrays``.
+
+    :param weight_lines: If a list is given, the line number and content of every line with weights
+        (see ``read_weighted_fnf``) is appended to it. The file is then also read after the last clause.
+    """
+    _require_numpy()
+    if op not in ("cnf", "dnf"):
+        raise ValueError(f"Expected op 'cnf' or 'dnf', got {op!r}")
+    filename = os.fsdecode(filename)
+    literals, offsets = [], [np.zeros(1, dtype=np.int64)]
+    nb_literals = nb_clauses = 0
+    with _open_input(filename) as ifile:
+        line = 0
+        fields = []
+        while len(fields) == 0 or fields[0].startswith(b"c"):
+            chunk = ifile.readline()
+            if len(chunk) == 0:
+                raise ValueError(f"{filename}: Expected a file starting with 'p cnf'")
+            fields = chunk.split()
+            line += 1
+            if weight_lines is not None and _is_weight_line(chunk):
+                weight_lines.append((line, chunk))
+        if len(fields) != 4 or fields[0] != b"p" or fields[1] not in (b"cnf", b"dnf"):
+            raise _line_error(filename, line, "Expected a header 'p cnf <var_count> <clause_count>'")
+        try:
+            var_count, clause_count = int(fields[2]), int(fields[3])
+        except ValueError:
+            raise _line_error(filename, line, "Expected integers in the header") from None
+        if var_count < 0 or clause_count < 0:
+            raise _line_error(filename, line, "Expected non-negative integers in the header")
+        done = clause_count == 0
+        while not done or weight_lines is not None:
+            chunk = ifile.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            if not chunk.endswith(b"\n"):
+                chunk += ifile.readline()
+            buf = np.frombuffer(chunk, dtype=np.uint8).copy()
+            line_starts, line_ends, line_numbers = _chunk_lines(buf, line + 1)
+            first = buf[np.minimum(line_starts, len(buf) - 1)]
+            if weight_lines is not None:
+                # Weight lines are rare, the candidates are selected on their first and third character
+                third = buf[np.minimum(line_starts + 2, len(buf) - 1)]
+                candidates = (first == ord("w")) | ((first == ord("c")) & ((third == ord("w")) | (third == ord("p"))))
+                for i in np.flatnonzero(candidates):
+                    if _is_weight_line(chunk[line_starts[i]:line_ends[i]]):
+                        weight_lines.append((int(line_numbers[i]), chunk[line_starts[i]:line_ends[i]]))
+                first[first == ord("w")] = ord("c")
+            line += int(np.count_nonzero(buf == ord("\n")))
+            if done:
+                continue
+            del chunk
+            _blank_lines(buf, line_starts, line_ends, first == ord("c"))
+            end = np.flatnonzero(first == ord("%"))  # End of the clauses in the SATLIB benchmarks
+            if len(end) > 0:
+                buf, line_ends = buf[:line_starts[end[0]]], line_ends[:end[0]]
+            buf = buf[:_clauses_end(buf, clause_count - nb_clauses)]
+            values, token_starts = _chunk_integers(buf, line_ends, filename, line_numbers[0])
+            bad = (values > var_count) | (values < -var_count)
+            if np.any(bad):
+                raise _line_error(filename, line_numbers[0] + np.searchsorted(line_ends, token_starts[np.argmax(bad)]),
+                                  f"Invalid literal {values[np.argmax(bad)]} for {var_count} variables")
+            ends = np.flatnonzero(values == 0)[:clause_count - nb_clauses]
+            if nb_clauses + len(ends) == clause_count:
+                values = values[:ends[-1] + 1] if len(ends) > 0 else values[:0]
+            offsets.append(nb_literals + ends - np.arange(len(ends)))
+            clause_literals = values[values != 0]
+            literals.append(clause_literals)
+            nb_literals += len(clause_literals)
+            nb_clauses += len(ends)
+            done = nb_clauses == clause_count or len(end) > 0
+    if nb_clauses < clause_count:
+        raise _line_error(filename, line, f"Expected {clause_count} clauses, found {nb_clauses}")
+    literals = np.concatenate(literals) if literals else np.zeros(0, dtype=np.int64)
+    return FnfArrays(literals, np.concatenate(offsets), var_count, op)
+
+
+# Binary format: header, table of arrays (name, dtype, offset, length), arrays aligned to 64 bytes
+SDD_BINARY_MAGIC = b"PYSDDBIN"
+SDD_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct("<8sIIqqq")  # magic, version, nb_arrays, var_count, vtree root, vtree offset
+_BINARY_ENTRY = struct.Struct("<16s8sqq")  # name, dtype, offset in bytes, length
+_BINARY_ALIGN = 64
+_BINARY_INTEGERS = ("|i1", "<i2", "<i4", "<i8")
+_BINARY_DTYPES = _BINARY_INTEGERS + ("|u1",)  # Names are stored as UTF-8 encoded JSON
+
+
+def _narrow(array):
+    """Array with the smallest integer type in which all values fit."""
+    array = np.asarray(array)
+    low, high = (array.min(), array.max()) if len(array) > 0 else (0, 0)
+    for dtype in _BINARY_INTEGERS:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return array.astype(dtype, copy=False)
+
+
+def write_sdd_binary(filename, arrays, vtree_arrays=None, names=None):
+    # type: (Union[str, Path], SddArrays, Optional[VtreeArrays], Optional[List]) -> None
+    """Write SDD arrays, and optionally the arrays of the vtree, in the binary SDD format.
+
+    The file starts with a versioned header, followed by the node and element tables. Every table
+    is stored with the smallest integer type (int8, int16, int32 or int64) in which all its values
+    fit, aligned such that it can be memory-mapped. See ``SddManager.save_binary`` to save SDDs directly from a manager.
+
+    :param filename: Path to the file
+    :param arrays: SddArrays, as returned by ``SddNode.to_arrays`` or ``SddManager.to_arrays``
+    :param vtree_arrays: VtreeArrays of the manager's vtree, needed to load the SDDs into a manager
+    :param names: Name of every root (JSON-serializable, e.g. strings), see ``read_sdd_bundle``
+    """
+    _require_numpy()
+    tables = [(name, _narrow(getattr(arrays, name)))
+              for name in ("kind", "literal", "vtree", "elem_offsets", "primes", "subs", "roots")]
+    if vtree_arrays is not None:
+        tables += [("vtree_" + name, _narrow(getattr(vtree_arrays, name)))
+                   for name in ("left", "right", "parent", "var")]
+        vtree_root, vtree_offset = vtree_arrays.root, vtree_arrays.offset
+    else:
+        vtree_root, vtree_offset = -1, 0
+    if names is not None:
+        names = list(names)
+        if len(names) != len(arrays.roots):
+            raise ValueError(f"Expected {len(arrays.roots)} names (one per root), got {len(names)}")
+        tables.append(("root_names", np.frombuffer(json.dumps(names).encode(), dtype=np.uint8)))
+    offset = _BINARY_HEADER.size + len(tables) * _BINARY_ENTRY.size
+    entries = []
+    for name, table in tables:
+        offset += -offset % _BINARY_ALIGN
+        entries.append(_BINARY_ENTRY.pack(name.encode(), table.dtype.str.encode(), offset, len(table)))
+        offset += table.nbytes
+    with open(filename, "wb") as ofile:
+        ofile.write(_BINARY_HEADER.pack(SDD_BINARY_MAGIC, SDD_BINARY_VERSION, len(tables), arrays.var_count,
+                                        vtree_root, vtree_offset))
+        ofile.write(b"".join(entries))
+        for (name, table), entry in zip(tables, entries):
+            ofile.write(b"\0" * (_BINARY_ENTRY.unpack(entry)[2] - ofile.tell()))
+            ofile.write(np.ascontiguousarray(table).data)
+
+
+def _read_binary_tables(filename, mmap_mode):
+    """Tables in a file in the binary SDD format, and the integers in the header."""
+    _require_numpy()
+    if mmap_mode is not None:
+        data = np.memmap(filename, dtype=np.uint8, mode=mmap_mode)
+    else:
+        data = np.fromfile(filename, dtype=np.uint8)
+    if len(data) < _BINARY_HEADER.size or bytes(data[:len(SDD_BINARY_MAGIC)]) != SDD_BINARY_MAGIC:
+        raise ValueError(f"{filename}: Not a file in the binary SDD format")
+    _, version, nb_arrays, var_count, vtree_root, vtree_offset = \
+        _BINARY_HEADER.unpack(bytes(data[:_BINARY_HEADER.size]))
+    if version > SDD_BINARY_VERSION:
+        raise ValueError(f"{filename}: Binary SDD format version {version} is not supported "
+                         f"(up to version {SDD_BINARY_VERSION})")
+    end = _BINARY_HEADER.size + nb_arrays * _BINARY_ENTRY.size
+    if len(data) < end:
+        raise ValueError(f"{filename}: File is truncated")
+    tables = {}
+    for i in range(nb_arrays):
+        start = _BINARY_HEADER.size + i * _BINARY_ENTRY.size
+        name, dtype, offset, length = _BINARY_ENTRY.unpack(bytes(data[start:start + _BINARY_ENTRY.size]))
+        name, dtype = name.rstrip(b"\0").decode(), dtype.rstrip(b"\0").decode()
+        if dtype not in _BINARY_DTYPES:
+            raise ValueError(f"{filename}: Unknown type {dtype} for table {name}")
+        nbytes = length * np.dtype(dtype).itemsize
+        if offset < end or length < 0 or offset + nbytes > len(data):
+            raise ValueError(f"{filename}: File is truncated")
+        tables[name] = data[offset:offset + nbytes].view(dtype)
+    return tables, var_count, vtree_root, vtree_offset
+
+
+def read_sdd_binary(filename, mmap_mode="r"):
+    # type: (Union[str, Path], Optional[str]) -> Tuple[SddArrays, Optional[VtreeArrays]]
+    """Read SDD arrays from a file in the binary SDD format (see ``write_sdd_binary``).
+
+    No manager is needed, the arrays can be evaluated directly with ``pysdd.circuit.Circuit``.
+    See ``SddManager.from_binary`` to load the SDDs into a manager.
+
+    :param filename: Path to the file
+    :param mmap_mode: Memory-map the file with this mode (see ``numpy.memmap``), or read it into memory
+        if None. Memory-mapped arrays are views on the file, only the parts that are used are loaded from disk.
+    :return: Tuple with the SddArrays and the VtreeArrays (None if the file has no vtree). The arrays
+        have the integer type with which they are stored.
+    """
+    tables, var_count, vtree_root, vtree_offset = _read_binary_tables(filename, mmap_mode)
+    try:
+        arrays = SddArrays(*[tables[name] for name in SddArrays._fields[:-1]], var_count)
+        vtree_arrays = None
+        if vtree_root >= 0:
+            vtree_arrays = VtreeArrays(*[tables["vtree_" + name] for name in VtreeArrays._fields[:-2]],
+                                       vtree_root, vtree_offset)
+    except KeyError as exc:
+        raise ValueError(f"{filename}: Missing table {exc.args[0]}") from None
+    return arrays, vtree_arrays
+
+
+def read_sdd_bundle(filename, mmap_mode="r"):
+    # type: (Union[str, Path], Optional[str]) -> Tuple[List, SddArrays, Optional[VtreeArrays]]
+    """Read a bundle of named SDDs (see ``SddManager.save_bundle``) as arrays.
+
+    :param filename: Path to the file
+    :param mmap_mode: See ``read_sdd_binary``
+    :return: Tuple with the list of names, the SddArrays and the VtreeArrays. The i-th name is the
+        name of the root with node index ``arrays.roots[i]``.
+    """
+    arrays, vtree_arrays = read_sdd_binary(filename, mmap_mode)
+    tables = _read_binary_tables(filename, mmap_mode)[0]
+    if "root_names" not in tables:
+        raise ValueError(f"{filename}: File is not a bundle, the roots have no names")
+    names = json.loads(bytes(tables["root_names"]).decode())
+    if len(names) != len(arrays.roots):
+        raise ValueError(f"{filename}: Expected {len(arrays.roots)} names, got {len(names)}")
+    return names, arrays, vtree_arrays
+
+
+def _literal_weights(weights, var_count):
+    """Literal weights [-n, ..., -1, 1, ..., n] from a dictionary, the default weight is 1."""
+    array = np.ones(2 * var_count, dtype=np.float64)
+    for lit, weight in (weights or {}).items():
+        if 0 < abs(lit) <= var_count:
+            array[var_count + lit if lit < 0 else var_count + lit - 1] = weight
+    return array
+
+
 def nnf_file_wmc(nnf_filename, weights=None):
     """Perform non-smoothed Weighted Model Counting on the given NNF file.
 
-    This is an auxiliary function to perform WMC given an NNF file with only
-    Python code. This function will thus also work, even if the C SDD library
-    is not available.
+    This is an auxiliary function to perform WMC given an NNF file without
+    an SddManager. To evaluate the same file for many weights, read it once
+    with ``read_nnf_arrays`` and use ``Circuit(arrays).wmc(weights)``.
 
     A typical NNF file looks like:
 
@@ -208,47 +855,23 @@ def nnf_file_wmc(nnf_filename, weights=None):
     A 2 3 9
     O 2 2 2 10
 
+    Without NumPy, the file is evaluated line by line in Python.
+
+    :param weights: Dictionary from literal to weight, the default weight is 1
     """
-    wmc = []  # type: List[Optional[float]]
-    ln = 0
-    detected_nnf = False
-    true_weight = 1.0
-    false_weight = 0.0
-    with open(nnf_filename, 'r') as nnf_file:
-        for line in nnf_file.readlines():
-            cols = line.strip().split(' ')
-            if cols[0] == 'c':
-                continue
-            if cols[0] == 'nnf':
-                wmc = [None] * int(cols[1])
-                detected_nnf = True
-                continue
-            if not detected_nnf:
-                raise Exception(f"An NNF file should start with 'nnf'")
-            if cols[0] == 'L':
-                lit = int(cols[1])
-                if lit in weights:
-                    wmc[ln] = weights[lit]
-                else:
-                    wmc[ln] = true_weight
-            if cols[0] == 'A':
-                wmc[ln] = 1.0
-                for i in range(int(cols[1])):
-                    wmc[ln] *= wmc[int(cols[2 + i])]
-            if cols[0] == 'O':
-                wmc[ln] = false_weight
-                for i in range(int(cols[2])):
-                    wmc[ln] += wmc[int(cols[3 + i])]
-            ln += 1
-    return wmc[-1]
+    if np is None:
+        return _nnf_file_wmc_python(nnf_filename, weights or {})
+    from .circuit import Circuit
+    arrays = read_nnf_arrays(nnf_filename)
+    return float(Circuit(arrays).wmc(_literal_weights(weights, arrays.var_count))[0])
 
 
 def sdd_file_wmc(sdd_filename, weights=None):
     """Perform non-smoothed Weighted Model Counting on the given SDD file.
 
-    This is an auxiliary function to perform WMC given an SDD file with only
-    Python code. This function will thus also work, even if the C SDD library
-    is not available.
+    This is an auxiliary function to perform WMC given an SDD file without
+    an SddManager. To evaluate the same file for many weights, read it once
+    with ``read_sdd_arrays`` and use ``Circuit(arrays).wmc(weights)``.
 
     A typical SDD file looks like:
 
@@ -256,46 +879,73 @@ def sdd_file_wmc(sdd_filename, weights=None):
     L 1 0 1
     ...
     D 0 1 2 1 2 7 8
+
+    Without NumPy, the file is evaluated line by line in Python.
+
+    :param weights: Dictionary from literal to weight, the default weight is 1
     """
-    wmc = []  # type: List[Optional[float]]
-    ln = 0
+    if np is None:
+        return _sdd_file_wmc_python(sdd_filename, weights or {})
+    from .circuit import Circuit
+    arrays = read_sdd_arrays(sdd_filename)
+    return float(Circuit(arrays).wmc(_literal_weights(weights, arrays.var_count))[0])
+
+
+def _nnf_file_wmc_python(nnf_filename, weights):
+    """WMC of an NNF file in pure Python, the root is the last node."""
+    wmc = []  # type: List[float]
+    detected_nnf = False
+    with open(nnf_filename, 'r') as nnf_file:
+        for line in nnf_file:
+            cols = line.split()
+            if len(cols) == 0 or cols[0] == 'c':
+                continue
+            if cols[0] == 'nnf':
+                detected_nnf = True
+                continue
+            if not detected_nnf:
+                raise ValueError(f"{nnf_filename}: An NNF file should start with 'nnf'")
+            if cols[0] == 'L':
+                wmc.append(weights.get(int(cols[1]), 1.0))
+            elif cols[0] == 'A':
+                value = 1.0
+                for i in range(int(cols[1])):
+                    value *= wmc[int(cols[2 + i])]
+                wmc.append(value)
+            elif cols[0] == 'O':
+                value = 0.0
+                for i in range(int(cols[2])):
+                    value += wmc[int(cols[3 + i])]
+                wmc.append(value)
+    return wmc[-1]
+
+
+def _sdd_file_wmc_python(sdd_filename, weights):
+    """WMC of an SDD file in pure Python, the root is the last node."""
+    wmc = {}  # type: Dict[int, float]
+    nodeid = None
     detected_sdd = False
-    true_weight = 1.0
-    false_weight = 0.0
     with open(sdd_filename, 'r') as sdd_file:
-        for line in sdd_file.readlines():
-            cols = line.strip().split(' ')
-            if cols[0] == 'c':
+        for line in sdd_file:
+            cols = line.split()
+            if len(cols) == 0 or cols[0] == 'c':
                 continue
             if cols[0] == 'sdd':
                 detected_sdd = True
-                wmc = [None] * int(cols[1])
                 continue
             if not detected_sdd:
-                raise Exception(f"An SDD file should start with 'sdd'")
+                raise ValueError(f"{sdd_filename}: An SDD file should start with 'sdd'")
+            nodeid = int(cols[1])
             if cols[0] == 'L':
-                nodeid = int(cols[1])
-                lit = int(cols[3])
-                if lit in weights:
-                    wmc[nodeid] = weights[lit]
-                else:
-                    wmc[nodeid] = 1.0
-            if cols[0] == 'F':
-                nodeid = int(cols[1])
-                wmc[nodeid] = false_weight
-            if cols[0] == 'T':
-                nodeid = int(cols[1])
-                wmc[nodeid] = true_weight
-            if cols[0] == 'D':
-                nodeid = int(cols[1])
-                nb_elmts = int(cols[3])
-                elmts = [int(col) for col in cols[4:]]
-                w = 0.0
-                for idx in range(nb_elmts):
-                    w += wmc[elmts[2 * idx]] * wmc[elmts[2 * idx + 1]]
-                wmc[nodeid] = w
-            ln += 1
-    return wmc[0]
+                wmc[nodeid] = weights.get(int(cols[3]), 1.0)
+            elif cols[0] == 'F':
+                wmc[nodeid] = 0.0
+            elif cols[0] == 'T':
+                wmc[nodeid] = 1.0
+            elif cols[0] == 'D':
+                elements = [int(col) for col in cols[4:]]
+                wmc[nodeid] = sum(wmc[elements[2 * i]] * wmc[elements[2 * i + 1]] for i in range(int(cols[3])))
+    return wmc[nodeid]
 
 
 def psdd_file_wmc(psdd_filename, observations=None):
@@ -147,6 +147,9 @@ if cythonize is not None:
             # extra_compile_args=extra_compile_args,
             # extra_link_args=extra_link_args
             # include_dirs=[numpy.get_include()]
+        ),
+        Extension(
+            "pysdd.circuit", [str(here / "pysdd" / "circuit.pyx")]
         )],
         compiler_directives={'embedsignature': True},
         # gdb_debug=gdb_debug,
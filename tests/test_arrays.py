@@ -0,0 +1,76 @@
+from pysdd.sdd import SddManager, Vtree, NodeKind
+import sys
+import logging
+
+
+logger = logging.getLogger("pysdd")
+
+
+def check_arrays(root, arrays, index):
+    """Compare the array representation with the structure obtained through the SddNode interface."""
+    node = arrays.roots[0] if index is None else index
+    if root.is_decision():
+        assert arrays.kind[node] == NodeKind.DECISION_NODE
+        assert arrays.vtree[node] == root.vtree().position()
+        start, stop = arrays.elem_offsets[node], arrays.elem_offsets[node + 1]
+        elements = root.elements()
+        assert stop - start == len(elements)
+        for e, (prime, sub) in zip(range(start, stop), elements):
+            assert arrays.primes[e] < node and arrays.subs[e] < node
+            check_arrays(prime, arrays, arrays.primes[e])
+            check_arrays(sub, arrays, arrays.subs[e])
+    elif root.is_literal():
+        assert arrays.kind[node] == NodeKind.LITERAL_NODE
+        assert arrays.literal[node] == root.literal
+        assert arrays.vtree[node] == root.vtree().position()
+    elif root.is_true():
+        assert arrays.kind[node] == NodeKind.TRUE_NODE
+    else:
+        assert arrays.kind[node] == NodeKind.FALSE_NODE
+
+
+def test_to_arrays():
+    vtree = Vtree(var_count=5, var_order=[2, 1, 4, 3, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e = sdd.vars
+    f = ((a & b) | (c & d) | ~e) & (a | ~c)
+    arrays = f.to_arrays()
+    assert arrays.var_count == 5
+    assert arrays.roots[0] == len(arrays.kind) - 1
+    assert len(arrays.elem_offsets) == len(arrays.kind) + 1
+    assert len(arrays.primes) == arrays.elem_offsets[-1]
+    check_arrays(f, arrays, None)
+
+
+def test_to_arrays_shared():
+    sdd = SddManager(var_count=4)
+    a, b, c, d = sdd.vars
+    f1 = (a & b) | c
+    f2 = ((a & b) | c) & d
+    arrays = sdd.to_arrays([f1, f2, sdd.true()])
+    assert len(arrays.roots) == 3
+    assert arrays.kind[arrays.roots[2]] == NodeKind.TRUE_NODE
+    check_arrays(f1, arrays, arrays.roots[0])
+    check_arrays(f2, arrays, arrays.roots[1])
+    assert len(arrays.kind) < len(f1.to_arrays().kind) + len(f2.to_arrays().kind)
+
+
+def test_vtree_to_arrays():
+    vtree = Vtree(var_count=4, var_order=[1, 2, 3, 4], vtree_type="right")
+    arrays = vtree.to_arrays()
+    assert arrays.offset == 0
+    assert arrays.root == vtree.position()
+    assert list(arrays.var) == [1, 0, 2, 0, 3, 0, 4]
+    assert arrays.parent[arrays.root] == -1
+    right = vtree.right().to_arrays()
+    assert right.offset == 2
+    assert list(right.var) == [2, 0, 3, 0, 4]
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_to_arrays()
+    test_to_arrays_shared()
+    test_vtree_to_arrays()
@@ -0,0 +1,114 @@
+from pysdd.sdd import SddManager, Vtree
+from pysdd.util import read_sdd_binary, write_sdd_binary, read_sdd_bundle
+import sys
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    rng = np.random.RandomState(2)
+    sdd = SddManager.from_vtree(Vtree(var_count=10, vtree_type="balanced"))
+    f = sdd.true()
+    for _ in range(15):
+        vs = rng.choice(np.arange(1, 11), 3, replace=False) * rng.choice([-1, 1], 3)
+        f = f & (sdd.literal(int(vs[0])) | sdd.literal(int(vs[1])) | sdd.literal(int(vs[2])))
+    return sdd, f
+
+
+@pytest.mark.parametrize("mmap_mode", ["r", None])
+def test_binary_arrays(tmp_path, mmap_mode):
+    from pysdd.circuit import Circuit
+    sdd, f = formula()
+    g = sdd.literal(1) | sdd.literal(-2)
+    sdd.save_binary(tmp_path / "f.bsdd", [f, g])
+    arrays, vtree_arrays = read_sdd_binary(tmp_path / "f.bsdd", mmap_mode=mmap_mode)
+    expected, expected_vtree = sdd.to_arrays([f, g]), sdd.vtree().to_arrays()
+    for name in expected._fields[:-1]:
+        np.testing.assert_array_equal(getattr(arrays, name), getattr(expected, name))
+    for name in expected_vtree._fields:
+        np.testing.assert_array_equal(getattr(vtree_arrays, name), getattr(expected_vtree, name))
+    assert arrays.var_count == 10 and arrays.kind.dtype == np.int8 and arrays.primes.dtype == np.int8
+    # Evaluation without a manager
+    weights = np.random.RandomState(0).uniform(0.1, 1.0, size=(5, 20))
+    np.testing.assert_allclose(Circuit(arrays, vtree_arrays).wmc(weights),
+                               Circuit(expected, expected_vtree).wmc(weights))
+
+
+def test_binary_manager(tmp_path):
+    sdd, f = formula()
+    f.save_binary(tmp_path / "f.bsdd")
+    # Same manager, the nodes already exist
+    root, = sdd.read_binary(tmp_path / "f.bsdd")
+    assert root is f
+    # New manager
+    manager, (root,) = SddManager.from_binary(tmp_path / "f.bsdd")
+    assert manager.vtree().to_arrays().root == sdd.vtree().to_arrays().root
+    assert root.model_count() == f.model_count() and root.size() == f.size()
+    np.testing.assert_array_equal(np.sort(root.to_arrays().kind), np.sort(f.to_arrays().kind))
+    # Manager with another vtree
+    other = SddManager.from_vtree(Vtree(var_count=10, vtree_type="right"))
+    with pytest.raises(ValueError):
+        other.read_binary(tmp_path / "f.bsdd")
+
+
+def test_bundle(tmp_path):
+    sdd, f = formula()
+    roots = {f"query_{var}": f & sdd.literal(var) for var in range(1, 11)}
+    roots["kb"] = f
+    sdd.save_bundle(tmp_path / "kb.bsdd", roots)
+    names, arrays, _ = read_sdd_bundle(tmp_path / "kb.bsdd")
+    assert names == list(roots.keys())
+    # Shared nodes are stored once
+    nodes = list(roots.values())
+    assert sdd.shared_size(nodes) < sum(node.size() for node in nodes)
+    elements = arrays.elem_offsets[-1]
+    assert elements == sdd.shared_size(nodes)
+    manager, loaded = SddManager.load_bundle(tmp_path / "kb.bsdd")
+    assert list(loaded.keys()) == list(roots.keys())
+    for name, node in roots.items():
+        assert loaded[name].model_count() == node.model_count()
+        assert loaded[name].ref_count() >= 1
+    assert manager.shared_size(list(loaded.values())) == sdd.shared_size(nodes)
+    with pytest.raises(ValueError, match="bundle"):
+        f.save_binary(tmp_path / "f.bsdd")
+        read_sdd_bundle(tmp_path / "f.bsdd")
+
+
+def test_binary_errors(tmp_path):
+    sdd, f = formula()
+    (tmp_path / "f.sdd").write_text("sdd 1\nT 0\n")
+    with pytest.raises(ValueError, match="binary SDD format"):
+        read_sdd_binary(tmp_path / "f.sdd")
+    write_sdd_binary(tmp_path / "f.bsdd", f.to_arrays())
+    with pytest.raises(ValueError, match="no vtree"):
+        SddManager.from_binary(tmp_path / "f.bsdd")
+    data = bytearray((tmp_path / "f.bsdd").read_bytes())
+    data[8] = 99  # Version
+    (tmp_path / "g.bsdd").write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="version 99"):
+        read_sdd_binary(tmp_path / "g.bsdd")
+    (tmp_path / "h.bsdd").write_bytes((tmp_path / "f.bsdd").read_bytes()[:200])
+    with pytest.raises(ValueError, match="truncated"):
+        read_sdd_binary(tmp_path / "h.bsdd")
+    # Arrays that are not normalized for the manager's vtree
+    arrays = f.to_arrays()
+    with pytest.raises(ValueError, match="normalized"):
+        sdd.load_arrays(arrays._replace(vtree=np.where(arrays.kind == 3, arrays.vtree[-1], arrays.vtree)))
+    # Primes that are not mutually exclusive
+    primes = arrays.primes.copy()
+    node = np.flatnonzero((arrays.kind == 3) & (np.diff(arrays.elem_offsets) >= 2))[0]
+    primes[arrays.elem_offsets[node] + 1] = primes[arrays.elem_offsets[node]]
+    with pytest.raises(ValueError, match="exclusive"):
+        sdd.load_arrays(arrays._replace(primes=primes))
+    assert sdd.load_arrays(arrays)[0] is f
+    assert sdd.load_arrays(arrays, validate=False)[0] is f
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
@@ -0,0 +1,67 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    vtree = Vtree(var_count=6, var_order=[2, 1, 4, 3, 6, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f = sdd.vars
+    return ((a & b) | (c & d) | ~e) & (a | ~c)
+
+
+def query_loop(wmc, weights, evidence):
+    """Set evidence with literal weights, as in pysdd.evidence."""
+    n = evidence.shape[1]
+    total = wmc.propagate()
+    pes, marginals = [], []
+    for row in evidence:
+        wmc.set_literal_weights_from_array(weights)
+        for var, value in enumerate(row, 1):
+            if value != 0:
+                wmc.set_literal_weight(-var if value > 0 else var, wmc.zero_weight)
+        pe = wmc.propagate()
+        pes.append(np.exp(pe - total) if wmc.log_mode else pe / total)
+        if pe == wmc.zero_weight:
+            marginals.append([np.nan] * n)
+        else:
+            prs = [wmc.literal_pr(var) for var in range(1, n + 1)]
+            marginals.append(np.exp(prs) if wmc.log_mode else prs)
+    wmc.set_literal_weights_from_array(weights)
+    return np.array(pes), np.array(marginals)
+
+
+@pytest.mark.parametrize("log_mode", [False, True])
+def test_query_evidence(log_mode):
+    rng = np.random.RandomState(1)
+    weights = rng.uniform(0.1, 1.0, size=12)
+    if log_mode:
+        weights = np.log(weights)
+    wmc = formula().wmc(log_mode=log_mode)
+    wmc.set_literal_weights_from_array(weights)
+    evidence = rng.randint(-1, 2, size=(40, 6))
+    evidence[0] = 0
+    evidence[1] = [1, 0, -1, 0, 1, 0]
+    evidence[2] = [-1, 0, 1, 0, 0, 0]  # Inconsistent
+    pe, marginals = wmc.query_evidence(evidence)
+    assert pe.shape == (40,) and marginals.shape == (40, 6)
+    expected_pe, expected_marginals = query_loop(wmc, weights, evidence)
+    np.testing.assert_allclose(pe, expected_pe, atol=1e-12)
+    np.testing.assert_allclose(marginals, expected_marginals, rtol=1e-9)
+    assert pe[0] == pytest.approx(1.0) and pe[2] == 0
+    assert np.all(np.isnan(marginals[2]))
+    observed = (evidence != 0) & (pe > 0)[:, None]
+    np.testing.assert_allclose(marginals[observed], (evidence[observed] > 0).astype(float))
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_query_evidence(False)
+    test_query_evidence(True)
@@ -0,0 +1,235 @@
+from pysdd.sdd import SddManager, Fnf, Vtree, CompilerOptions, CompilationBudgetExceeded, register_clause_order
+import os
+import gzip
+from pathlib import Path
+import lzma
+import sys
+import random
+import logging
+import pytest
+
+
+logger = logging.getLogger("pysdd")
+here = Path(__file__).parent
+
+
+def random_clauses(var_count, clause_count, seed=0, min_length=1):
+    rng = random.Random(seed)
+    return [[v if rng.random() < 0.5 else -v for v in rng.sample(range(1, var_count + 1), rng.randint(min_length, 3))]
+            for _ in range(clause_count)]
+
+
+def dimacs(clauses, var_count):
+    lines = ["c random", f"p cnf {var_count} {len(clauses)}"]
+    lines += [" ".join(str(lit) for lit in clause) + " 0" for clause in clauses]
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("op", ["cnf", "dnf"])
+def test_from_clauses(tmp_path, op):
+    clauses = random_clauses(12, 30)
+    fnf = Fnf.from_clauses(clauses, 12, op)
+    assert fnf.var_count == 12 and fnf.litset_count == 30
+    fname = os.path.join(tmp_path, f"random.{op}")
+    with open(fname, "w") as ofile:
+        ofile.write(dimacs(clauses, 12))
+    expected = Fnf.from_cnf_file(fname.encode()) if op == "cnf" else Fnf.from_dnf_file(fname.encode())
+    _, node = SddManager.from_fnf(fnf)
+    _, expected_node = SddManager.from_fnf(expected)
+    assert node.model_count() == expected_node.model_count()
+    # String input is parsed in memory
+    from_string = SddManager.from_cnf_string if op == "cnf" else SddManager.from_dnf_string
+    _, node = from_string(dimacs(clauses, 12))
+    assert node.model_count() == expected_node.model_count()
+
+
+def test_to_arrays():
+    np = pytest.importorskip("numpy")
+    clauses = random_clauses(12, 30)
+    arrays = Fnf.from_clauses(clauses, 12).to_arrays()
+    assert arrays.var_count == 12 and arrays.op == "cnf"
+    assert [list(arrays.literals[s:e]) for s, e in zip(arrays.offsets[:-1], arrays.offsets[1:])] == clauses
+    # Flat literals with offsets
+    fnf = Fnf.from_clauses(arrays.literals, 12, "dnf", offsets=arrays.offsets)
+    dnf_arrays = fnf.to_arrays()
+    assert dnf_arrays.op == "dnf"
+    np.testing.assert_array_equal(dnf_arrays.literals, arrays.literals)
+    np.testing.assert_array_equal(dnf_arrays.offsets, arrays.offsets)
+
+
+def test_from_clauses_errors():
+    with pytest.raises(ValueError, match="Invalid literal 4"):
+        Fnf.from_clauses([[1, -2], [4]], 3)
+    with pytest.raises(ValueError, match="Invalid literal 0"):
+        Fnf.from_clauses([[1, 0]], 3)
+    with pytest.raises(ValueError, match="offsets"):
+        Fnf.from_clauses([1, 2, 3], 3, offsets=[0, 2])
+    with pytest.raises(ValueError, match="op"):
+        Fnf.from_clauses([[1]], 3, "xor")
+    with pytest.raises(ValueError, match="header"):
+        SddManager.from_cnf_string("1 2 0\n")
+    with pytest.raises(ValueError, match="Expected 3 clauses"):
+        SddManager.from_cnf_string("p cnf 3 3\n1 2 0\n")
+
+
+@pytest.mark.parametrize("compression", [None, "gz", "xz"])
+@pytest.mark.parametrize("chunk_size", [16, 1 << 22])
+def test_read_fnf_arrays(tmp_path, compression, chunk_size):
+    np = pytest.importorskip("numpy")
+    from pysdd.util import read_fnf_arrays
+    clauses = random_clauses(12, 30)
+    text = dimacs(clauses[:10], 12) + "c comment\n\n" + dimacs(clauses[10:], 12).split("\n", 2)[2] + "%\n0\n"
+    text = text.replace("p cnf 12 10", "p cnf 12 30")
+    fname = tmp_path / "random.cnf"
+    opener = {None: open, "gz": gzip.open, "xz": lzma.open}[compression]
+    with opener(fname, "wt") as ofile:
+        ofile.write(text)
+    arrays = read_fnf_arrays(fname, chunk_size=chunk_size)
+    assert arrays.var_count == 12 and len(arrays.offsets) == 31
+    assert [list(arrays.literals[s:e]) for s, e in zip(arrays.offsets[:-1], arrays.offsets[1:])] == clauses
+    _, node = SddManager.from_cnf_file(str(fname))
+    _, expected = SddManager.from_cnf_string(text)
+    assert node.model_count() == expected.model_count()
+
+
+def test_read_fnf_errors(tmp_path):
+    pytest.importorskip("numpy")
+    from pysdd.util import read_fnf_arrays
+    fname = tmp_path / "bad.cnf"
+    for text, message in [("c only comments\n", "Expected a file starting with 'p cnf'"),
+                          ("c x\np cnf 3\n1 0\n", "line 2: Expected a header"),
+                          ("p cnf 3 2\n1 -2 0\n2 x 0\n", "line 3: Expected an integer"),
+                          ("p cnf 3 2\n1 -2 0\n\n2 -4 0\n", "line 4: Invalid literal -4"),
+                          ("p cnf 3 3\n1 -2 0\n2 3 0\n", "line 3: Expected 3 clauses, found 2")]:
+        fname.write_text(text)
+        with pytest.raises(ValueError, match=message):
+            read_fnf_arrays(fname, chunk_size=4)
+        with pytest.raises(ValueError, match=message):
+            Fnf.from_cnf_file(str(fname))
+    # The input after the last clause is ignored
+    fname.write_text("p cnf 3 2\n1 -2 0 2\n3 0 x trailing junk\n-9 0\n")
+    for chunk_size in [4, 16, 1 << 22]:
+        arrays = read_fnf_arrays(fname, chunk_size=chunk_size)
+        assert list(arrays.literals) == [1, -2, 2, 3] and list(arrays.offsets) == [0, 2, 4]
+
+
+def test_read_weighted_fnf(tmp_path):
+    np = pytest.importorskip("numpy")
+    from pysdd.util import read_weighted_fnf, read_weight_line
+    clauses = random_clauses(4, 6)
+    header, body = dimacs(clauses, 4).split("\n", 2)[1:]
+    expected = np.array([0.7, 1.0, 0.4, 0.8, 0.2, 0.6, 1.0, 0.3])  # Literals -4, ..., -1, 1, ..., 4
+    formats = {
+        "pysdd": f"{header}\nc weights 0.2 0.8 0.6 0.4 1 1 0.3 0.7\n{body}",
+        "cachet": f"{header}\nw 1 0.2\nw 2 0.6\nw\t3\t-1\n{body}w 4 0.3\n",
+        "mcc": f"c p weight 1 0.2 0\nc p weight -1 0.8 0\n{header}\nc p weight 2 0.6 0\nc p weight -2 0.4 0\n"
+               f"{body}c p weight 4 0.3 0\nc p weight -4 0.7 0\n"}
+    for name, text in formats.items():
+        (tmp_path / f"{name}.cnf").write_text(text)
+        fnf, weights = read_weighted_fnf(tmp_path / f"{name}.cnf", chunk_size=8)
+        assert fnf.litset_count == 6
+        np.testing.assert_allclose(weights, expected)
+    np.testing.assert_allclose(read_weight_line(tmp_path / "pysdd.cnf"), expected)
+    assert read_weight_line(tmp_path / "cachet.cnf") is None
+    (tmp_path / "none.cnf").write_text(dimacs(clauses, 4))
+    _, weights = read_weighted_fnf(tmp_path / "none.cnf")
+    assert weights is None
+    (tmp_path / "bad.cnf").write_text(f"{header}\n{body}w 5 0.3\n")
+    with pytest.raises(ValueError, match="line 8: Invalid weights"):
+        read_weighted_fnf(tmp_path / "bad.cnf")
+    # The Cachet and PySDD encodings of the same network have the same weighted model count
+    counts = []
+    for name in ["standard_enc2_noisy_pysdd.cnf", "standard_enc2_noisy_cachet.cnf"]:
+        fnf, weights = read_weighted_fnf(here.parent / "cnf" / name)
+        _, root = SddManager.from_fnf(fnf)
+        wmc = root.wmc(log_mode=False)
+        wmc.set_literal_weights_from_array(weights)
+        counts.append(wmc.propagate())
+    assert counts[0] == pytest.approx(counts[1])
+
+
+@pytest.mark.parametrize("vtree_search_mode", [-1, 0, 5])
+def test_compile_progress(vtree_search_mode):
+    fnf = Fnf.from_clauses(random_clauses(20, 60, min_length=3), 20)
+    _, expected = SddManager.from_fnf(fnf)
+    sdd = SddManager.from_vtree(Vtree(var_count=20, vtree_type="balanced"))
+    sdd.set_options(CompilerOptions(vtree_search_mode=vtree_search_mode))
+    calls = []
+    node = sdd.fnf_to_sdd(fnf, time_limit=60, progress=lambda *args: calls.append(args))
+    assert node.model_count() == expected.model_count() > 0
+    assert [clause for clause, _, _ in calls] == list(range(1, 61))
+    assert calls[-1][1] > 0
+    # The callback can stop the compilation
+    def stop(clause, live_size, elapsed):
+        if clause == 10:
+            raise KeyboardInterrupt()
+    with pytest.raises(KeyboardInterrupt):
+        sdd.fnf_to_sdd(fnf, progress=stop)
+    dnf = Fnf.from_clauses(random_clauses(20, 30), 20, "dnf")
+    _, expected = SddManager.from_fnf(dnf)
+    _, node = SddManager.from_fnf(dnf, max_size=10**9)
+    assert node.model_count() == expected.model_count()
+
+
+def test_compile_budgets():
+    fnf = Fnf.from_clauses(random_clauses(80, 300, min_length=3), 80)
+    sdd = SddManager.from_vtree(Vtree(var_count=80, vtree_type="balanced"))
+    with pytest.raises(CompilationBudgetExceeded) as excinfo:
+        sdd.fnf_to_sdd(fnf, time_limit=0.01)
+    assert excinfo.value.budget == "time_limit" and 0 < excinfo.value.clause < 300
+    with pytest.raises(CompilationBudgetExceeded) as excinfo:
+        sdd.fnf_to_sdd(fnf, max_live_size=500)
+    assert excinfo.value.budget == "max_live_size" and excinfo.value.live_size > 500
+    with pytest.raises(CompilationBudgetExceeded, match="max_size"):
+        SddManager.from_fnf(fnf, max_size=1000)
+    # The manager is still usable
+    sdd.garbage_collect()
+    assert sdd.live_size() == 0
+    assert (sdd.literal(1) & sdd.literal(-2)).model_count() == 1
+
+
+
+@pytest.mark.parametrize("clause_order", ["vtree", "natural", "length", "occurrence"])
+@pytest.mark.parametrize("combination", ["linear", "balanced", "bucket"])
+@pytest.mark.parametrize("vtree_search_mode", [-1, 0])
+def test_compile_strategies(clause_order, combination, vtree_search_mode):
+    fnf = Fnf.from_clauses(random_clauses(20, 60, min_length=3), 20)
+    _, expected = SddManager.from_fnf(fnf)
+    sdd = SddManager.from_vtree(Vtree(var_count=20, vtree_type="balanced"))
+    sdd.set_options(CompilerOptions(vtree_search_mode=vtree_search_mode, clause_order=clause_order,
+                                    combination=combination))
+    calls = []
+    node = sdd.fnf_to_sdd(fnf, progress=lambda *args: calls.append(args))
+    assert node.model_count() == expected.model_count() > 0
+    assert [clause for clause, _, _ in calls] == list(range(1, 61))
+    dnf = Fnf.from_clauses(random_clauses(20, 30), 20, "dnf")
+    _, expected = SddManager.from_fnf(dnf)
+    sdd = SddManager.from_vtree(Vtree(var_count=20, vtree_type="balanced"))
+    sdd.set_options(CompilerOptions(clause_order=clause_order, combination=combination))
+    assert sdd.fnf_to_sdd(dnf).model_count() == expected.model_count()
+
+
+def test_clause_order_functions():
+    np = pytest.importorskip("numpy")
+    fnf = Fnf.from_clauses(random_clauses(20, 60, min_length=3), 20)
+    _, expected = SddManager.from_fnf(fnf)
+    register_clause_order("reverse", lambda arrays, manager: np.arange(len(arrays.offsets) - 1)[::-1])
+    sdd = SddManager.from_vtree(Vtree(var_count=20, vtree_type="balanced"))
+    for clause_order in ["reverse", lambda arrays, manager: np.random.RandomState(0).permutation(60)]:
+        sdd.set_options(CompilerOptions(clause_order=clause_order, combination="balanced"))
+        assert sdd.fnf_to_sdd(fnf).model_count() == expected.model_count()
+    with pytest.raises(ValueError):
+        register_clause_order("vtree", lambda arrays, manager: None)
+    for options in [dict(clause_order="unknown"), dict(combination="unknown"),
+                    dict(clause_order=lambda arrays, manager: np.zeros(60, dtype=int))]:
+        sdd.set_options(CompilerOptions(**options))
+        with pytest.raises(ValueError):
+            sdd.fnf_to_sdd(fnf)
+    sdd.garbage_collect()
+    assert sdd.live_size() == 0
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
@@ -3,6 +3,7 @@ from pysdd.iterator import SddIterator
 from pysdd.util import sdd_to_dot, vtree_to_dot
 import sys
 import os
+import pytest
 import logging
 from pathlib import Path
 
@@ -144,6 +145,34 @@ def test_it4():
     assert mc == 12, "MC {} != 3 * 2**2 = 12".format(mc)
 
 
+def test_it_wmc():
+    np = pytest.importorskip("numpy")
+    vtree = Vtree(var_count=6, var_order=[2, 1, 4, 3, 6, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f = sdd.vars
+    weights = np.array([0.2, 0.5, 0.9, 0.3, 0.4, 0.8, 0.7, 0.1, 0.5, 0.6, 0.3, 0.9])
+    func = SddIterator.func_weightedmodelcounting(weights)
+    for formula in [((a & b) | (c & d) | ~e) & (a | ~c), c & ~f, ~b, sdd.true(), sdd.false()]:
+        wmc = formula.wmc(log_mode=False)
+        wmc.set_literal_weights_from_array(weights)
+        it = SddIterator(sdd, smooth=True, smooth_to_root=True)
+        assert it.depth_first(formula, func) == pytest.approx(wmc.propagate())
+
+
+def test_vtree_vars():
+    vtree = Vtree(var_count=4, var_order=[2, 1, 4, 3], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    it = SddIterator(sdd, smooth=True)
+    root_vars = it._expected_vars[sdd.vtree().position()]
+    left_vars = it._expected_vars[sdd.vtree().left().position()]
+    assert len(root_vars) == 4 and set(root_vars) == {1, 2, 3, 4}
+    assert left_vars == {1, 2} and 2 in left_vars and 3 not in left_vars and 5 not in left_vars
+    assert root_vars - left_vars == {3, 4}
+    assert left_vars | {5} == {1, 2, 5}
+    assert hash(left_vars) == hash(frozenset({1, 2})) and len({left_vars, frozenset({1, 2})}) == 1
+    assert left_vars.nb_models == 4 and root_vars.nb_models == 16
+
+
 if __name__ == "__main__":
     logger.setLevel(logging.DEBUG)
     sh = logging.StreamHandler(sys.stdout)
@@ -151,6 +180,7 @@ if __name__ == "__main__":
     directory = Path(os.environ.get('TESTDIR', Path(__file__).parent))
     print(f"Saving files to {directory}")
     test_it1()
+    test_it_wmc()
     # test_it2()
     # test_it3()
     # test_it4()
@@ -0,0 +1,64 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+from pysdd.learning import fit_literal_weights, log_likelihood_gradient
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    vtree = Vtree(var_count=4, var_order=[2, 1, 4, 3], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d = sdd.vars
+    return (a | b) & (~c | d)
+
+
+def test_gradient():
+    """Compare to finite differences of the log-likelihood."""
+    wmc = formula().wmc(log_mode=True)
+    circuit = wmc.circuit()
+    rng = np.random.RandomState(5)
+    log_weights = np.log(rng.uniform(0.1, 1.0, size=8))
+    data = np.array([[1, 0, 1, 1], [0, -1, 0, 0], [-1, 1, -1, 0]])
+    ll, gradient = log_likelihood_gradient(circuit, data, log_weights)
+    for i in range(8):
+        delta = np.zeros(8)
+        delta[i] = 1e-6
+        ll_delta, _ = log_likelihood_gradient(circuit, data, log_weights + delta)
+        assert gradient[i] == pytest.approx((ll_delta - ll) / 1e-6, abs=1e-5)
+
+
+@pytest.mark.parametrize("log_mode", [False, True])
+def test_fit_literal_weights(log_mode):
+    f = formula()
+    rng = np.random.RandomState(6)
+    true_weights = np.array([0.7, 0.4, 0.8, 0.1, 0.9, 0.2, 0.6, 0.3])
+    data = f.sample(5000, weights=true_weights, seed=7).astype(np.int64) * 2 - 1
+    data[rng.uniform(size=data.shape) < 0.3] = 0
+    wmc = f.wmc(log_mode=log_mode)
+    result = fit_literal_weights(wmc, data, learning_rate=0.1, max_epochs=1000, tolerance=1e-9)
+    assert result.converged
+    minibatch_result = fit_literal_weights(f.wmc(log_mode=log_mode), data, batch_size=500, learning_rate=0.05,
+                                           max_epochs=20, seed=8)
+    assert minibatch_result.log_likelihood == pytest.approx(result.log_likelihood, abs=0.01)
+    # Compare the distributions by the marginals, the weights themselves are not identifiable
+    circuit = wmc.circuit()
+    _, learned = circuit.evidence(np.zeros((1, 4)), result.weights)
+    _, expected = circuit.evidence(np.zeros((1, 4)), true_weights)
+    np.testing.assert_allclose(learned, expected, atol=0.02)
+    weights = wmc.literal_weights_array()
+    np.testing.assert_allclose(np.exp(weights) if log_mode else weights, result.weights)
+    with pytest.raises(ValueError):
+        fit_literal_weights(wmc, [[-1, -1, 0, 0]])
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_gradient()
+    test_fit_literal_weights(False)
+    test_fit_literal_weights(True)
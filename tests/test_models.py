@@ -0,0 +1,90 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import itertools
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def brute_force_models(node, var_count):
+    models = set()
+    for values in itertools.product([0, 1], repeat=var_count):
+        cond = node
+        for var, value in enumerate(values, 1):
+            cond = cond.condition(var if value else -var)
+        if cond.is_true():
+            models.add(values)
+    return models
+
+
+def formulas():
+    vtree = Vtree(var_count=6, var_order=[2, 1, 4, 3, 6, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f = sdd.vars
+    yield ((a & b) | (c & d) | ~e) & (a | ~c)
+    yield (a & ~f) | (b & c)
+    yield c
+    yield ~d
+    yield sdd.true()
+
+
+def test_model_batches():
+    for formula in formulas():
+        expected = brute_force_models(formula, 6)
+        batches = list(formula.model_batches(batch_size=7))
+        assert all(batch.shape[1] == 6 and batch.dtype == np.int8 for batch in batches)
+        assert all(len(batch) == 7 for batch in batches[:-1])
+        models = [tuple(row) for batch in batches for row in batch]
+        assert len(models) == formula.global_model_count()
+        assert set(models) == expected
+
+
+def test_model_batches_packed():
+    sdd = SddManager(var_count=10)
+    a, b, c = sdd.literal(1), sdd.literal(2), sdd.literal(3)
+    formula = (a | b) & ~c
+    models, = list(formula.model_batches(packed=True))
+    assert models.dtype == np.uint8 and models.shape == (3 * 2**7, 2)
+    unpacked = np.unpackbits(models, axis=1)[:, :10]
+    assert len(set(tuple(row) for row in unpacked)) == 3 * 2**7
+    assert np.all(unpacked[:, 2] == 0)
+
+
+def test_model_batches_projection():
+    for formula in formulas():
+        expected = set((model[0], model[2], model[4]) for model in brute_force_models(formula, 6))
+        models = [tuple(row) for batch in formula.model_batches(variables=[5, 1, 3]) for row in batch]
+        assert len(models) == len(expected)
+        assert set(models) == expected
+    sdd = SddManager(var_count=2)
+    assert list(sdd.false().model_batches()) == []
+
+
+def test_model_count_overflow():
+    from pysdd.circuit import Circuit
+    sdd = SddManager(var_count=70)
+    formula = sdd.literal(1) | sdd.literal(2)
+    circuit = Circuit(formula.to_arrays(), sdd.vtree().to_arrays())
+    assert circuit.model_count(variables=range(1, 63)) == 3 * 2**60
+    with pytest.raises(OverflowError):
+        circuit.model_count(variables=range(1, 66))
+    # Models are still enumerated, with exact counts in Python
+    sdd = SddManager(var_count=100)
+    a, b, c, d, e, f = (sdd.literal(var) for var in (1, 2, 3, 5, 40, 99))
+    formula = (a | ~d) & (b | e) & ~(c & f)
+    batch = next(formula.model_batches(batch_size=1000))
+    assert batch.shape == (1000, 100) and len(set(map(bytes, batch))) == 1000
+    assert np.all((batch[:, 0] | (1 - batch[:, 4])) & (batch[:, 1] | batch[:, 39]) & (1 - (batch[:, 2] & batch[:, 98])))
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_model_batches()
+    test_model_batches_packed()
+    test_model_batches_projection()
+    test_model_count_overflow()
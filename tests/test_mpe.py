@@ -0,0 +1,85 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import itertools
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    vtree = Vtree(var_count=6, var_order=[2, 1, 4, 3, 6, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f = sdd.vars
+    return ((a & b) | (c & d) | ~e) & (a | ~c)
+
+
+def brute_force_mpe(node, weights, evidence):
+    n = len(evidence)
+    best, best_weight = None, -np.inf
+    for values in itertools.product([0, 1], repeat=n):
+        if any(ev != 0 and (ev > 0) != value for ev, value in zip(evidence, values)):
+            continue
+        cond = node
+        for var, value in enumerate(values, 1):
+            cond = cond.condition(var if value else -var)
+        if not cond.is_true():
+            continue
+        weight = sum(np.log(weights[n + var - 1] if value else weights[n - var])
+                     for var, value in enumerate(values, 1))
+        if weight > best_weight:
+            best, best_weight = values, weight
+    return best, best_weight
+
+
+@pytest.mark.parametrize("log_mode", [False, True])
+def test_mpe(log_mode):
+    rng = np.random.RandomState(3)
+    f = formula()
+    weights = rng.uniform(0.1, 1.0, size=12)
+    wmc = f.wmc(log_mode=log_mode)
+    wmc.set_literal_weights_from_array(np.log(weights) if log_mode else weights)
+    evidence = rng.randint(-1, 2, size=(30, 6))
+    evidence[0] = 0
+    evidence[1] = [-1, 0, 1, 0, 0, 0]  # Inconsistent
+    assignments, log_weights = wmc.mpe_batch(evidence)
+    for row, assignment, log_weight in zip(evidence, assignments, log_weights):
+        expected, expected_weight = brute_force_mpe(f, weights, row)
+        assert log_weight == pytest.approx(expected_weight)
+        if expected is None:
+            assert np.all(assignment == -1)
+        else:
+            assert tuple(assignment) == expected
+    assignment, log_weight = wmc.mpe()
+    assert tuple(assignment) == tuple(assignments[0]) and log_weight == pytest.approx(log_weights[0])
+    assignment, log_weight = wmc.mpe(evidence[2])
+    assert tuple(assignment) == tuple(assignments[2])
+
+
+def test_mpe_literal():
+    sdd = SddManager(var_count=3)
+    wmc = sdd.literal(-2).wmc(log_mode=False)
+    wmc.set_literal_weight(1, 2.0)
+    wmc.set_literal_weight(-3, 3.0)
+    assignment, log_weight = wmc.mpe()
+    assert list(assignment) == [1, 0, 0]
+    assert log_weight == pytest.approx(np.log(6.0))
+
+
+def test_mpe_without_numpy(monkeypatch):
+    import pysdd.sdd
+    wmc = formula().wmc(log_mode=False)
+    monkeypatch.setattr(pysdd.sdd, "np", None)
+    with pytest.raises(ImportError, match="requires NumPy"):
+        wmc.mpe([1, 0, 0, 0, 0, 0])
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_mpe(False)
+    test_mpe(True)
+    test_mpe_literal()
@@ -1,9 +1,12 @@
-from pysdd.util import nnf_file_wmc, sdd_file_wmc, psdd_file_wmc
+from pysdd.util import nnf_file_wmc, sdd_file_wmc, psdd_file_wmc, read_nnf_arrays, read_sdd_arrays
+from pysdd.sdd import SddManager
 import sys
 import os
 import math
+import random
 import logging
 from pathlib import Path
+import pytest
 
 
 logger = logging.getLogger("pysdd")
@@ -56,6 +59,87 @@ def test_psdd1():
     print("WMC", wmc)
 
 
+def random_sdd():
+    rng = random.Random(3)
+    sdd = SddManager(var_count=8)
+    f = sdd.true()
+    for _ in range(10):
+        clause = sdd.false()
+        for var in rng.sample(range(1, 9), 3):
+            clause = clause | sdd.literal(var if rng.random() < 0.5 else -var)
+        f = f & clause
+    return sdd, f
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1 << 22])
+def test_read_sdd_arrays(tmp_path, chunk_size):
+    np = pytest.importorskip("numpy")
+    from pysdd.circuit import Circuit
+    sdd, f = random_sdd()
+    f.save(bytes(tmp_path / "f.sdd"))
+    arrays = read_sdd_arrays(tmp_path / "f.sdd", chunk_size=chunk_size)
+    expected = f.to_arrays()
+    assert len(arrays.kind) == len(expected.kind) and len(arrays.primes) == len(expected.primes)
+    weights = np.random.RandomState(0).uniform(0.1, 1.0, size=(5, 16))
+    np.testing.assert_allclose(Circuit(arrays).wmc(weights), Circuit(expected).wmc(weights))
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1 << 22])
+def test_read_nnf_arrays(tmp_path, chunk_size):
+    np = pytest.importorskip("numpy")
+    from pysdd.circuit import Circuit
+    sdd, f = random_sdd()
+    arrays = f.to_arrays()
+    # Write as NNF, with and-nodes over three children (prime, true, sub) and comments
+    lines = ["c test"]
+
+    def add(line):
+        lines.append(line)
+        return sum(1 for line in lines if not line.startswith("c")) - 1
+
+    true, index = add("A 0"), {}
+    for i, kind in enumerate(arrays.kind):
+        if kind == 0:
+            index[i] = add("O 0 0")
+        elif kind == 1:
+            index[i] = true
+        elif kind == 2:
+            index[i] = add(f"L {arrays.literal[i]}")
+        else:
+            ands = [add(f"A 3 {index[arrays.primes[e]]} {true} {index[arrays.subs[e]]}")
+                    for e in range(arrays.elem_offsets[i], arrays.elem_offsets[i + 1])]
+            lines.append(f"c node {i}")
+            index[i] = add(f"O 0 {len(ands)} " + " ".join(map(str, ands)))
+    nb_nodes = sum(1 for line in lines if not line.startswith("c"))
+    (tmp_path / "f.nnf").write_text(f"nnf {nb_nodes} 0 8\n" + "\n".join(lines) + "\n")
+    nnf = read_nnf_arrays(tmp_path / "f.nnf", chunk_size=chunk_size)
+    assert nnf.var_count == 8
+    weights = np.random.RandomState(0).uniform(0.1, 1.0, size=(5, 16))
+    np.testing.assert_allclose(Circuit(nnf).wmc(weights), Circuit(arrays).wmc(weights))
+
+
+def test_read_errors(tmp_path):
+    pytest.importorskip("numpy")
+    (tmp_path / "bad.nnf").write_text("c comment\nnnf 3 2 2\nL 1\nL -x\nO 0 2 0 1\n")
+    with pytest.raises(ValueError, match="line 4"):
+        read_nnf_arrays(tmp_path / "bad.nnf")
+    (tmp_path / "bad.sdd").write_text("sdd 2\nL 0 0 1\nD 1 1 1 0 5\n")
+    with pytest.raises(ValueError, match="line 3"):
+        read_sdd_arrays(tmp_path / "bad.sdd")
+    with pytest.raises(ValueError, match="nnf"):
+        read_nnf_arrays(tmp_path / "bad.sdd")
+
+
+def test_file_wmc_without_numpy(monkeypatch):
+    import pysdd.util
+    weights = {+3: 0.5, +2: 0.5, +1: 1, -3: 0.5, -2: 0.5, -1: 0}
+    files = [(nnf_file_wmc, here / "rsrc" / "test.cnf.nnf"), (sdd_file_wmc, here / "rsrc" / "test.sdd")]
+    expected = [file_wmc(filename, w) for file_wmc, filename in files for w in (weights, None)]
+    monkeypatch.setattr(pysdd.util, "np", None)
+    assert [file_wmc(filename, w) for file_wmc, filename in files for w in (weights, None)] == expected
+    assert expected[0] == expected[2] == 0.75
+
+
 if __name__ == "__main__":
     logger.setLevel(logging.DEBUG)
     sh = logging.StreamHandler(sys.stdout)
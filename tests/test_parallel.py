@@ -0,0 +1,113 @@
+from pysdd.sdd import SddManager, Fnf, Vtree
+from pysdd.parallel import compile_many, propagate_many, compile_partitioned
+import os
+import sys
+import time
+import random
+import tempfile
+import logging
+import pytest
+
+
+logger = logging.getLogger("pysdd")
+
+
+def random_fnfs(nb_fnfs, var_count, clause_count):
+    """Random 3-CNFs."""
+    fnfs = []
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        for seed in range(nb_fnfs):
+            rng = random.Random(seed)
+            fname = os.path.join(tmpdirname, f"random_{seed}.cnf")
+            with open(fname, "w") as ofile:
+                print(f"p cnf {var_count} {clause_count}", file=ofile)
+                for _ in range(clause_count):
+                    lits = [v if rng.random() < 0.5 else -v for v in rng.sample(range(1, var_count + 1), 3)]
+                    print(" ".join(str(lit) for lit in lits) + " 0", file=ofile)
+            fnfs.append(Fnf.from_cnf_file(fname.encode()))
+    return fnfs
+
+
+def test_compile_many():
+    fnfs = random_fnfs(4, 16, 50)
+    results = compile_many(fnfs, threads=2)
+    assert len(results) == 4
+    for fnf, (mgr, node) in zip(fnfs, results):
+        _, expected = SddManager.from_fnf(fnf)
+        assert node.model_count() == expected.model_count()
+        assert mgr.root is node
+
+
+def test_propagate_many():
+    results = compile_many(random_fnfs(4, 16, 50), threads=2)
+    wmcs = []
+    for mgr, node in results:
+        wmc = node.wmc(log_mode=False)
+        wmc.set_literal_weight(mgr.literal(1), 0.25)
+        wmcs.append(wmc)
+    expected = [wmc.propagate() for wmc in wmcs]
+    assert propagate_many(wmcs, threads=2) == expected
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < 2, reason="Requires at least two processors")
+def test_compile_many_speedup():
+    # Without vtree search, the compilations run in parallel
+    fnfs = random_fnfs(4, 26, 78)
+    start = time.perf_counter()
+    compile_many(fnfs, threads=1)
+    serial = time.perf_counter() - start
+    start = time.perf_counter()
+    compile_many(fnfs, threads=min(4, os.cpu_count()))
+    parallel = time.perf_counter() - start
+    logger.info(f"Compile 4 CNFs: serial={serial:.3f}s parallel={parallel:.3f}s")
+    assert parallel < 0.8 * serial
+
+
+@pytest.mark.parametrize("vtree_search_mode", [-1, 0, 10])
+def test_compile_many_search(vtree_search_mode):
+    # Compilations with a vtree search are executed one at a time, the results are the same
+    fnfs = random_fnfs(4, 26, 78)
+    results = compile_many(fnfs, threads=4, vtree_search_mode=vtree_search_mode)
+    for fnf, (mgr, node) in zip(fnfs, results):
+        _, expected = SddManager.from_fnf(fnf)
+        assert node.model_count() == expected.model_count()
+
+
+@pytest.mark.parametrize("partition", ["vtree", "natural"])
+@pytest.mark.parametrize("partitions", [1, 3, 8])
+def test_compile_partitioned(partition, partitions):
+    pytest.importorskip("numpy")
+    fnf, = random_fnfs(1, 20, 60)
+    vtree = Vtree(var_count=20, vtree_type="random")
+    _, expected = SddManager.from_fnf(fnf)
+    mgr, node = compile_partitioned(fnf, processes=2, partitions=partitions, vtree=vtree, partition=partition)
+    assert node.model_count() == expected.model_count()
+    assert mgr.root is node and node.ref_count() == 1
+    assert mgr.vtree().to_arrays().root == vtree.to_arrays().root
+    mgr.garbage_collect()
+    assert mgr.live_size() == node.size()
+
+
+def test_compile_partitioned_dnf():
+    np = pytest.importorskip("numpy")
+    rng = random.Random(0)
+    dnf = Fnf.from_clauses([rng.sample(range(1, 21), 4) for _ in range(30)], 20, "dnf")
+    _, expected = SddManager.from_fnf(dnf)
+    _, node = compile_partitioned(dnf, processes=2,
+                                  partition=lambda arrays, vtree_arrays, partitions: [np.arange(0, 30, 2),
+                                                                                      np.arange(1, 30, 2)])
+    assert node.model_count() == expected.model_count()
+    with pytest.raises(ValueError):
+        compile_partitioned(dnf, partition=lambda arrays, vtree_arrays, partitions: [np.arange(29)])
+    with pytest.raises(ValueError):
+        compile_partitioned(dnf, partition="unknown")
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_compile_many()
+    test_propagate_many()
+    test_compile_many_speedup()
+    test_compile_many_search(-1)
@@ -0,0 +1,102 @@
+from pysdd.psdd import Psdd
+from pysdd.sdd import SddManager, Vtree
+import sys
+import itertools
+import logging
+from pathlib import Path
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+here = Path(__file__).parent
+
+
+def complete_assignments(var_count):
+    return np.array(list(itertools.product([-1, 1], repeat=var_count)))
+
+
+@pytest.mark.parametrize("filename", ["loop.psdd", "test.psdd"])
+def test_log_likelihood(filename):
+    psdd = Psdd.from_file(here / "rsrc" / filename)
+    complete = complete_assignments(psdd.var_count)
+    probs = np.exp(psdd.log_likelihood(complete))
+    assert probs.sum() == pytest.approx(1.0)
+    assert psdd.log_likelihood(np.zeros(psdd.var_count))[0] == pytest.approx(0.0)
+    rng = np.random.RandomState(9)
+    observations = rng.randint(-1, 2, size=(20, psdd.var_count))
+    consistent = np.all((observations[:, None, :] == 0) | (observations[:, None, :] == complete[None]), axis=2)
+    np.testing.assert_allclose(np.exp(psdd.log_likelihood(observations)), consistent @ probs, atol=1e-12)
+
+
+@pytest.mark.parametrize("filename", ["loop.psdd", "test.psdd"])
+def test_marginals_mpe(filename):
+    psdd = Psdd.from_file(here / "rsrc" / filename)
+    complete = complete_assignments(psdd.var_count)
+    probs = np.exp(psdd.log_likelihood(complete))
+    rng = np.random.RandomState(10)
+    observations = rng.randint(-1, 2, size=(20, psdd.var_count)) * (rng.uniform(size=(20, psdd.var_count)) < 0.3)
+    observations[0] = 0
+    log_pe, marginals = psdd.marginals(observations)
+    assignments, log_probs = psdd.mpe(observations)
+    for row, pe, marginal, assignment, log_prob in zip(observations, log_pe, marginals, assignments, log_probs):
+        consistent = np.all((row == 0) | (row == complete), axis=1)
+        assert np.exp(pe) == pytest.approx(probs[consistent].sum())
+        if not np.any(consistent & (probs > 0)):
+            assert log_prob == -np.inf and np.all(assignment == -1)
+            continue
+        expected = (probs[consistent] @ (complete[consistent] > 0)) / probs[consistent].sum()
+        np.testing.assert_allclose(marginal, expected, atol=1e-9)
+        assert log_prob == pytest.approx(np.log(probs[consistent].max()))
+        assert np.exp(psdd.log_likelihood(assignment * 2 - 1)[0]) == pytest.approx(probs[consistent].max())
+        assert np.all((row == 0) | (row == assignment * 2 - 1))
+
+
+def test_from_sdd(tmp_path):
+    vtree = Vtree(var_count=5, var_order=[2, 1, 4, 3, 5], vtree_type="right")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e = sdd.vars
+    f = ((a & b) | (c & ~d)) & (a | ~e)
+    weights = np.array([0.2, 0.5, 0.9, 0.3, 0.4, 0.8, 0.7, 0.1, 0.5, 0.6])
+    data = f.sample(20000, weights=weights, seed=11)
+    psdd = Psdd.from_sdd(f, data, alpha=1.0)
+    complete = complete_assignments(5)
+    probs = np.exp(psdd.log_likelihood(complete))
+    assert probs.sum() == pytest.approx(1.0)
+    is_model = np.array([_is_model(f, row) for row in complete], dtype=bool)
+    assert np.all(probs[~is_model] == 0) and np.all(probs[is_model] > 0)
+    wmc = f.wmc(log_mode=False)
+    wmc.set_literal_weights_from_array(weights)
+    wmc.propagate()
+    _, marginals = psdd.marginals()
+    np.testing.assert_allclose(marginals[0], [wmc.literal_pr(var) for var in range(1, 6)], atol=0.02)
+    # Without data, the parameters are uniform
+    uniform = Psdd.from_sdd(f)
+    assert np.all(np.exp(uniform.theta[uniform.kind == 1]) == pytest.approx(0.5))
+    # Write and read
+    psdd.save(tmp_path / "learned.psdd")
+    read_psdd = Psdd.from_file(tmp_path / "learned.psdd")
+    np.testing.assert_allclose(read_psdd.log_likelihood(complete), psdd.log_likelihood(complete))
+    with pytest.raises(ValueError):
+        psdd.fit([[0, 0, 0, 0, 0]])
+
+
+def test_from_sdd_deep_vtree():
+    sdd = SddManager.from_vtree(Vtree(var_count=1200, vtree_type="right"))
+    psdd = Psdd.from_sdd(sdd.literal(1) | sdd.literal(2))
+    # Uniform parameters: 1/2 for the element with prime 1, and 1/2 for every other variable
+    assert psdd.log_likelihood(np.ones((1, 1200), dtype=np.int8))[0] == pytest.approx(1200 * np.log(0.5))
+
+
+def _is_model(node, row):
+    for var, value in enumerate(row, 1):
+        node = node.condition(var if value > 0 else -var)
+    return node.is_true()
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_log_likelihood("loop.psdd")
+    test_marginals_mpe("test.psdd")
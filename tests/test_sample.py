@@ -0,0 +1,61 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    vtree = Vtree(var_count=5, var_order=[2, 1, 4, 3, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e = sdd.vars
+    return ((a & b) | (c & d)) & (a | ~e)
+
+
+def is_model(node, sample):
+    for var, value in enumerate(sample, 1):
+        node = node.condition(var if value else -var)
+    return node.is_true()
+
+
+def test_sample_uniform():
+    f = formula()
+    samples = f.sample(20000, seed=1)
+    assert samples.shape == (20000, 5) and samples.dtype == np.int8
+    models, counts = np.unique(samples, axis=0, return_counts=True)
+    assert len(models) == f.global_model_count()
+    assert all(is_model(f, model) for model in models)
+    expected = len(samples) / len(models)
+    assert np.all(np.abs(counts - expected) < 5 * np.sqrt(expected))
+    assert np.array_equal(samples, f.sample(20000, seed=1))
+
+
+def test_sample_weighted():
+    f = formula()
+    weights = np.array([0.2, 0.5, 0.9, 0.3, 0.4, 0.8, 0.7, 0.1, 0.5, 0.6])
+    samples = f.sample(50000, weights=weights, seed=2)
+    wmc = f.wmc(log_mode=False)
+    wmc.set_literal_weights_from_array(weights)
+    wmc.propagate()
+    for var in range(1, 6):
+        assert np.mean(samples[:, var - 1]) == pytest.approx(wmc.literal_pr(var), abs=0.01)
+
+
+def test_sample_false():
+    sdd = SddManager(var_count=2)
+    with pytest.raises(ValueError):
+        sdd.false().sample(10)
+    samples = sdd.literal(-2).sample(100, seed=3)
+    assert np.all(samples[:, 1] == 0)
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_sample_uniform()
+    test_sample_weighted()
+    test_sample_false()
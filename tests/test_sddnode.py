@@ -0,0 +1,130 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import gc
+import weakref
+import time
+import logging
+
+
+logger = logging.getLogger("pysdd")
+
+
+def test_interned_literals():
+    sdd = SddManager(var_count=4)
+    a, b, c, d = sdd.vars
+    assert sdd.literal(1) is a
+    assert sdd.literal(-2) is -b
+    assert sdd[3] is c
+    assert str(d) == "SddNode(name=4,id={})".format(d.id)
+
+
+def test_interned_elements():
+    vtree = Vtree(var_count=4, var_order=[1, 2, 3, 4], vtree_type="right")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d = sdd.vars
+    f = (a & b) | (c & d)
+    elements = f.elements()
+    assert elements is f.elements()
+    for prime, sub in elements:
+        for node in (prime, sub):
+            if node.is_literal():
+                assert node is sdd.literal(node.literal)
+    g = (a & b) | (c & d)
+    assert g is f
+    assert str(f) == "SddNode(name=Decision,id={})".format(f.id)
+    assert str(sdd.true()) == "SddNode(name=True,id={})".format(sdd.true().id)
+    assert sdd.false() is sdd.false()
+
+
+def test_literal_range():
+    sdd = SddManager(var_count=2)
+    for lit in (0, 3, -3):
+        try:
+            sdd.literal(lit)
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected ValueError for literal {}".format(lit)
+    sdd.add_var_after_last()
+    assert sdd.literal(3).literal == 3
+
+
+def test_interned_weak():
+    # The manager does not keep decision node wrappers alive, only the literal wrappers
+    gc.disable()
+    try:
+        sdd = SddManager(var_count=3)
+        f = (sdd.literal(1) & sdd.literal(2)) | sdd.literal(3)
+        node_ref = weakref.ref(f)
+        literal_ref = weakref.ref(sdd.literal(1))
+        assert literal_ref() is sdd.literal(1)
+        del f
+        assert node_ref() is None
+        f = sdd.literal(2) | sdd.literal(3)
+        node_ref = weakref.ref(f)
+        assert sdd.literal(2) | sdd.literal(3) is f
+        del sdd
+        assert node_ref() is f
+        assert f.manager.literal(2) | f.manager.literal(3) is f
+        del f
+        assert node_ref() is None
+    finally:
+        gc.enable()
+        gc.collect()
+
+
+def test_interned_many():
+    # Dropping and recreating many wrappers keeps the interning table consistent
+    sdd = SddManager(var_count=12)
+    for _ in range(5):
+        nodes = []
+        for i in range(1, 12):
+            nodes.append(sdd.literal(i) & sdd.literal(-(i + 1)))
+            nodes.append(sdd.literal(-i) | sdd.literal(i + 1))
+        for i, node in enumerate(nodes):
+            if i % 3 == 0:
+                nodes[i] = None
+        for i in range(1, 12):
+            assert sdd.literal(i) & sdd.literal(-(i + 1)) is (sdd.literal(i) & sdd.literal(-(i + 1)))
+            if nodes[2 * i - 1] is not None:
+                assert sdd.literal(-i) | sdd.literal(i + 1) is nodes[2 * i - 1]
+
+
+def test_wrap_benchmark():
+    # Micro-benchmark of SddNode.wrap, run with --log-cli-level=DEBUG for the timings
+    duration = 0.0
+    nb_wrapped = 0
+    for _ in range(10):
+        sdd = SddManager(var_count=30)
+        f = sdd.true()
+        for i in range(1, 30, 3):
+            f = f & (sdd.literal(i) | sdd.literal(-(i + 1)) | sdd.literal(i + 2))
+        # New wrappers for all nodes below the root
+        start = time.perf_counter()
+        todo = [f]
+        while todo:
+            node = todo.pop()
+            for prime, sub in node.elements():
+                nb_wrapped += 2
+                todo.append(prime)
+                todo.append(sub)
+        duration += time.perf_counter() - start
+    logger.debug("Traversal: {:.0f} ns/wrap".format(1e9 * duration / nb_wrapped))
+    # Interned wrappers
+    start = time.perf_counter()
+    for _ in range(100000):
+        sdd.true()
+    logger.debug("Interned: {:.0f} ns/wrap".format(1e9 * (time.perf_counter() - start) / 100000))
+    assert nb_wrapped > 0
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_interned_literals()
+    test_interned_elements()
+    test_literal_range()
+    test_interned_weak()
+    test_interned_many()
+    test_wrap_benchmark()
@@ -0,0 +1,72 @@
+from pysdd.sdd import SddManager, Vtree
+from pysdd.iterator import SddIterator
+import sys
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+from pysdd.circuit import Semiring
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    vtree = Vtree(var_count=6, var_order=[2, 1, 4, 3, 6, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f = sdd.vars
+    return sdd, ((a & b) | (c & d) | ~e) & (a | ~c)
+
+
+def test_builtin_semirings():
+    sdd, f = formula()
+    rng = np.random.RandomState(1)
+    weights = rng.uniform(0.1, 1.0, size=(5, 12))
+    wmc = f.wmc(log_mode=False)
+    expected = []
+    for row in weights:
+        wmc.set_literal_weights_from_array(row)
+        expected.append(wmc.propagate())
+    np.testing.assert_allclose(f.evaluate("sum-product", weights), expected)
+    np.testing.assert_allclose(f.evaluate("log-sum-exp", np.log(weights)), np.log(expected))
+    assert f.evaluate("counting")[0] == f.global_model_count()
+    assert f.evaluate("boolean")[0]
+    not_a_and_c = np.ones(12, dtype=bool)
+    not_a_and_c[[6, 3]] = False  # Literals 1 and -3
+    assert not f.evaluate("boolean", not_a_and_c)[0]
+    it = SddIterator(sdd, smooth=False)
+    assert f.evaluate("counting", smooth=False)[0] == it.depth_first(f, SddIterator.func_modelcounting)
+
+
+def test_ufunc_semirings():
+    """Semirings with ufuncs that are not compiled give the same result as the compiled ones."""
+    _, f = formula()
+    weights = np.random.RandomState(2).uniform(0.1, 1.0, size=(4, 12))
+    py_max = np.frompyfunc(max, 2, 1)
+    py_min = np.frompyfunc(min, 2, 1)
+    py_add = np.frompyfunc(lambda x, y: x + y, 2, 1)
+    py_mul = np.frompyfunc(lambda x, y: x * y, 2, 1)
+    np.testing.assert_allclose(f.evaluate(Semiring(py_max, py_mul, 0.0, 1.0), weights).astype(float),
+                               f.evaluate("max-product", weights))
+    np.testing.assert_allclose(f.evaluate(Semiring(py_min, py_add, np.inf, 0.0), weights).astype(float),
+                               f.evaluate("min-plus", weights))
+    np.testing.assert_allclose(f.evaluate(Semiring(py_add, py_mul, 0.0, 1.0), weights).astype(float),
+                               f.evaluate("sum-product", weights))
+
+
+def test_counting_bigint():
+    sdd = SddManager(var_count=80)
+    f = sdd.literal(1) | sdd.literal(2)
+    assert f.evaluate("counting")[0] == 3 * 2**78
+    assert sdd.true().evaluate("counting")[0] == 2**80
+    assert sdd.false().evaluate("counting")[0] == 0
+    with pytest.raises(ValueError):
+        f.evaluate("unknown")
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_builtin_semirings()
+    test_ufunc_semirings()
+    test_counting_bigint()
@@ -0,0 +1,82 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import itertools
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    vtree = Vtree(var_count=6, var_order=[2, 1, 4, 3, 6, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f = sdd.vars
+    return sdd, ((a & b) | (c & d) | ~e) & (a | ~c)
+
+
+def all_models(node, var_count):
+    for values in itertools.product([0, 1], repeat=var_count):
+        cond = node
+        for var, value in enumerate(values, 1):
+            cond = cond.condition(var if value else -var)
+        if cond.is_true():
+            yield values
+
+
+def test_top_k_weights():
+    sdd, f = formula()
+    weights = np.random.RandomState(4).uniform(0.1, 1.0, size=12)
+    scored = sorted((sum(np.log(weights[6 + var - 1] if value else weights[6 - var])
+                         for var, value in enumerate(model, 1)), model) for model in all_models(f, 6))
+    scored.reverse()
+    models, log_weights = sdd.top_k_models(f, 10, cost=weights)
+    assert models.shape == (10, 6)
+    np.testing.assert_allclose(log_weights, [score for score, _ in scored[:10]])
+    assert [tuple(model) for model in models] == [model for _, model in scored[:10]]
+    models, log_weights = sdd.top_k_models(f, 100, cost=weights)
+    assert len(models) == f.global_model_count() == len(set(tuple(model) for model in models))
+    assert np.all(np.diff(log_weights) <= 0)
+
+
+def test_top_k_cardinality():
+    sdd, f = formula()
+    models, cardinalities = sdd.top_k_models(f, 8)
+    assert list(cardinalities) == sorted(sum(model) for model in all_models(f, 6))[:8]
+    assert np.array_equal(models.sum(axis=1), cardinalities)
+    assert cardinalities[0] == sdd.minimum_cardinality(f)
+    models, _ = sdd.top_k_models(sdd.false(), 3)
+    assert models.shape == (0, 6)
+    models, cardinalities = sdd.top_k_models(sdd.true(), 3)
+    assert list(cardinalities) == [0, 1, 1]
+
+
+def test_top_k_zero_weights():
+    sdd = SddManager(var_count=3)
+    weights = np.array([1.0, 1.0, 0.0, 2.0, 1.0, 1.0])  # Literal -1 has weight zero
+    models, log_weights = sdd.top_k_models(sdd.literal(2) | sdd.literal(3), 10, cost=weights)
+    assert len(models) == 3 and np.all(models[:, 0] == 1)
+
+
+def test_top_k_deep():
+    # A right-linear vtree gives a chain of decision nodes that is deeper than the C stack allows to recurse
+    n = 40000
+    vtree = Vtree(var_count=n, var_order=list(range(1, n + 1)), vtree_type="right")
+    sdd = SddManager.from_vtree(vtree)
+    f = sdd.true()
+    for i in range(n - 1, 0, -2):
+        f = (sdd.literal(i) | sdd.literal(i + 1)) & f
+    models, cardinalities = sdd.top_k_models(f, 3)
+    assert list(cardinalities) == [n // 2] * 3
+    assert np.all(models[:, 0::2] + models[:, 1::2] == 1)
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_top_k_weights()
+    test_top_k_cardinality()
+    test_top_k_zero_weights()
+    test_top_k_deep()
@@ -0,0 +1,46 @@
+from pysdd.sdd import SddManager
+import sys
+import logging
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def test_literal_arrays():
+    sdd = SddManager(var_count=4)
+    a, b, c, d = sdd.vars
+    wmc = ((a & b) | (c & ~d)).wmc(log_mode=False)
+    weights = np.array([0.6, 0.7, 0.8, 0.9, 0.4, 0.3, 0.2, 0.1])
+    wmc.set_literal_weights_from_array(weights)
+    wmc.propagate()
+    literals = [-4, -3, -2, -1, 1, 2, 3, 4]
+    np.testing.assert_array_equal(wmc.literal_weights_array(), weights)
+    np.testing.assert_array_equal(wmc.literal_pr_array(), [wmc.literal_pr(lit) for lit in literals])
+    np.testing.assert_array_equal(wmc.literal_derivative_array(),
+                                  [wmc.literal_derivative(lit) for lit in literals])
+
+
+def test_set_literal_weights_2d():
+    sdd = SddManager(var_count=3)
+    wmc = sdd.literal(2).wmc(log_mode=False)
+    wmc.set_literal_weights_from_array(np.array([[0.7, 0.8, 0.9], [0.1, 0.2, 0.3]]))
+    assert wmc.literal_weight(-1) == 0.9 and wmc.literal_weight(-3) == 0.7 and wmc.literal_weight(3) == 0.3
+    np.testing.assert_array_equal(wmc.literal_weights_array(), [0.7, 0.8, 0.9, 0.1, 0.2, 0.3])
+    # Same layout as the 1D array
+    wmc.set_literal_weights_from_array(np.array([0.4, 0.5, 0.6, 0.6, 0.5, 0.4]))
+    weights = wmc.literal_weights_array()
+    wmc.set_literal_weights_from_array(np.ones(6))
+    wmc.set_literal_weights_from_array(weights.reshape(2, -1))
+    np.testing.assert_array_equal(wmc.literal_weights_array(), weights)
+    with pytest.raises(ValueError):
+        wmc.set_literal_weights_from_array(np.ones((3, 3)))
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_literal_arrays()
+    test_set_literal_weights_2d()
@@ -0,0 +1,76 @@
+from pysdd.sdd import SddManager, Vtree, WmcManager
+import sys
+import logging
+import subprocess
+import pytest
+
+
+np = pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def propagate_loop(wmc, weights):
+    results = []
+    for row in weights:
+        wmc.set_literal_weights_from_array(row)
+        results.append(wmc.propagate())
+    return np.array(results)
+
+
+def formulas():
+    vtree = Vtree(var_count=6, var_order=[2, 1, 4, 3, 6, 5], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f = sdd.vars
+    yield ((a & b) | (c & d) | ~e) & (a | ~c)
+    yield (a & ~f) | (b & c)
+    yield c
+    yield sdd.true()
+    yield sdd.false()
+
+
+@pytest.mark.parametrize("log_mode", [False, True])
+def test_propagate_batch(log_mode):
+    rng = np.random.RandomState(1)
+    for formula in formulas():
+        weights = rng.uniform(0.1, 1.0, size=(50, 12))
+        if log_mode:
+            weights = np.log(weights)
+        wmc = formula.wmc(log_mode=log_mode)
+        expected = propagate_loop(wmc, weights)
+        result = wmc.propagate_batch(weights)
+        assert result.shape == (50,)
+        np.testing.assert_allclose(result, expected, rtol=1e-10)
+
+
+def test_propagate_batch_blocks():
+    sdd = SddManager(var_count=4)
+    a, b, c, d = sdd.vars
+    formula = (a | b) & (c | ~d)
+    wmc = WmcManager(formula, log_mode=False)
+    weights = np.random.RandomState(2).uniform(size=(1000, 8))
+    np.testing.assert_allclose(wmc.propagate_batch(weights), propagate_loop(wmc, weights), rtol=1e-10)
+    # A single vector of weights
+    assert wmc.propagate_batch(np.ones(8))[0] == pytest.approx(9)
+    with pytest.raises(ValueError):
+        wmc.propagate_batch(np.ones((3, 6)))
+
+
+def test_circuit_without_numpy():
+    # Extension modules cannot be imported twice in one process, block NumPy in a new interpreter
+    code = ("import sys; sys.modules['numpy'] = None\n"
+            "import pysdd.sdd\n"
+            "try:\n"
+            "    import pysdd.circuit\n"
+            "except ImportError as exc:\n"
+            "    print(exc)\n")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert "requires NumPy" in result.stdout
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_propagate_batch(False)
+    test_propagate_batch(True)
+    test_propagate_batch_blocks()
@@ -0,0 +1,61 @@
+from pysdd.sdd import SddManager, Vtree
+import sys
+import math
+import random
+import logging
+import pytest
+
+
+pytest.importorskip("numpy")
+logger = logging.getLogger("pysdd")
+
+
+def formula():
+    vtree = Vtree(var_count=8, var_order=[2, 1, 4, 3, 6, 5, 8, 7], vtree_type="balanced")
+    sdd = SddManager.from_vtree(vtree)
+    a, b, c, d, e, f, g, h = sdd.vars
+    return ((a & b) | (c & d) | ~e) & (a | ~c) & (f | g)
+
+
+@pytest.mark.parametrize("log_mode", [False, True])
+def test_propagate_incremental(log_mode):
+    rng = random.Random(1)
+    wmc = formula().wmc(log_mode=log_mode)
+    assert wmc.propagate_incremental() == pytest.approx(wmc.propagate())
+    for _ in range(50):
+        for _ in range(rng.randint(1, 3)):
+            lit = rng.choice([1, -1]) * rng.randint(1, 8)
+            weight = rng.uniform(0.1, 1.0)
+            wmc.set_literal_weight(lit, math.log(weight) if log_mode else weight)
+        assert wmc.propagate_incremental() == pytest.approx(wmc.propagate())
+
+
+def test_push_pop_weights():
+    wmc = formula().wmc(log_mode=False)
+    wmc.set_literal_weight(1, 0.3)
+    original = wmc.propagate()
+    assert wmc.propagate_incremental() == pytest.approx(original)
+    wmc.push_weights()
+    wmc.set_literal_weight(-3, 0.0)
+    wmc.set_literal_weight(5, 0.2)
+    changed = wmc.propagate_incremental()
+    wmc.push_weights()
+    wmc.set_literal_weight(1, 0.9)
+    assert wmc.propagate_incremental() == pytest.approx(wmc.propagate())
+    wmc.pop_weights()
+    assert wmc.propagate_incremental() == pytest.approx(changed)
+    wmc.pop_weights()
+    assert wmc.literal_weight(1) == 0.3 and wmc.literal_weight(-3) == 1.0
+    assert wmc.propagate_incremental() == pytest.approx(original)
+    assert wmc.propagate() == pytest.approx(original)
+    with pytest.raises(IndexError):
+        wmc.pop_weights()
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)
+    sh = logging.StreamHandler(sys.stdout)
+    logger.addHandler(sh)
+    test_propagate_incremental(False)
+    test_propagate_incremental(True)
+    test_push_pop_weights()